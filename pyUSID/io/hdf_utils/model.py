@@ -22,7 +22,8 @@ from sidpy.hdf.dtype_utils import validate_dtype
 from sidpy import sid
 
 from .base import write_book_keeping_attrs
-from .simple import link_as_main, check_if_main, write_ind_val_dsets, validate_dims_against_main, validate_anc_h5_dsets
+from .simple import link_as_main, check_if_main, write_ind_val_dsets, validate_dims_against_main, \
+    validate_anc_h5_dsets, _supports_parallel_compression, _create_empty_dataset
 from ..dimension import Dimension, validate_dimensions
 from ..anc_build_utils import INDICES_DTYPE, make_indices_matrix
 
@@ -728,7 +729,7 @@ def get_unit_values(ds_inds, ds_vals, dim_names=None, all_dim_names=None, is_spe
 def write_main_dataset(h5_parent_group, main_data, main_data_name, quantity, units, pos_dims, spec_dims,
                        main_dset_attrs=None, h5_pos_inds=None, h5_pos_vals=None, h5_spec_inds=None, h5_spec_vals=None,
                        aux_spec_prefix='Spectroscopic_', aux_pos_prefix='Position_', verbose=False,
-                       slow_to_fast=False, **kwargs):
+                       slow_to_fast=False, parallel_compression=False, **kwargs):
     """
     Writes the provided data as a 'Main' dataset with all appropriate linking.
     By default, the instructions for generating the ancillary datasets should be specified using the pos_dims and
@@ -776,6 +777,10 @@ def write_main_dataset(h5_parent_group, main_data, main_data_name, quantity, uni
     slow_to_fast : bool, Optional. Default=False
         Set to True if the dimensions are arranged from slowest varying to fastest varying.
         Set to False otherwise.
+    parallel_compression : bool, Optional. Default=False
+        Only applies to files opened with the "mpio" driver, where compression is removed by default since HDF5
+        only allows collective writes to compressed datasets. Set to True to keep compression (HDF5 >= 1.10.2) if
+        all writes to this dataset will be collective, e.g. - by a Process with collective_writes=True
     kwargs will be passed onto the creation of the dataset. Please pass chunking, compression, dtype, and other
         arguments this way
 
@@ -892,11 +897,24 @@ def write_main_dataset(h5_parent_group, main_data, main_data_name, quantity, uni
             print('Created Spectroscopic datasets')
 
     if h5_parent_group.file.driver == 'mpio':
-        if kwargs.pop('compression', None) is not None:
+        # Compressed datasets can only be written to collectively
+        parallel_compression = parallel_compression and _supports_parallel_compression() and \
+            not isinstance(main_data, da.core.Array) and kwargs.get('compression', None) is not None
+        if not parallel_compression and kwargs.pop('compression', None) is not None:
             warn('This HDF5 file has been opened wth the "mpio" communicator. '
                  'mpi4py does not allow creation of compressed datasets. Compression kwarg has been removed')
-
-    if isinstance(main_data, np.ndarray):
+    else:
+        parallel_compression = False
+
+    if isinstance(main_data, np.ndarray) and parallel_compression:
+        # Case 1 - simple small dataset written by all ranks together
+        dtype = kwargs.pop('dtype', main_data.dtype)
+        h5_main = h5_parent_group.create_dataset(main_data_name, shape=main_data.shape, dtype=dtype, **kwargs)
+        with h5_main.collective:
+            h5_main[()] = main_data
+        if verbose:
+            print('Created compressed main dataset with provided data')
+    elif isinstance(main_data, np.ndarray):
         # Case 1 - simple small dataset
         h5_main = h5_parent_group.create_dataset(main_data_name, data=main_data, **kwargs)
         if verbose:
@@ -917,7 +935,7 @@ def write_main_dataset(h5_parent_group, main_data, main_data_name, quantity, uni
         # main_data.to_hdf5(h5_main.file.filename, h5_main.name)  # Does not work with python 2 for some reason
     else:
         # Case 3 - large empty dataset
-        h5_main = h5_parent_group.create_dataset(main_data_name, main_data, **kwargs)
+        h5_main = _create_empty_dataset(h5_parent_group, main_data_name, main_data, **kwargs)
         if verbose:
             print('Created empty dataset for Main')
 
@@ -8,8 +8,11 @@ Created on Tue Nov  3 21:14:25 2015
 """
 from __future__ import division, print_function, absolute_import, unicode_literals
 import collections
+import hashlib
+import json
 from warnings import warn
 import sys
+from contextlib import contextmanager
 import h5py
 import numpy as np
 import dask.array as da
@@ -34,6 +37,85 @@ __all__ = ['assign_group_index', 'check_and_link_ancillary', 'check_for_matching
 """
 
 
+def _supports_parallel_compression():
+    """
+    Checks whether the HDF5 library used by h5py can write to compressed
+    datasets in files opened with the "mpio" driver. HDF5 1.10.2 onwards
+    supports such writes as long as they are collective
+
+    Returns
+    -------
+    supported : bool
+        Whether or not compressed datasets can be written to in parallel
+    """
+    return h5py.version.hdf5_version_tuple >= (1, 10, 2)
+
+
+def _supports_virtual_datasets():
+    """
+    Checks whether h5py (2.9 onwards) and the HDF5 library it uses (1.10
+    onwards) support virtual datasets
+
+    Returns
+    -------
+    supported : bool
+        Whether or not virtual datasets can be created
+    """
+    return hasattr(h5py, 'VirtualLayout') and h5py.version.hdf5_version_tuple >= (1, 10, 0)
+
+
+# Whether or not empty datasets are currently being created as placeholders
+_PLACEHOLDER_STATE = {'active': False}
+
+
+@contextmanager
+def _placeholder_datasets():
+    """
+    Within this context, empty datasets created via ``create_empty_dataset``
+    and ``write_main_dataset`` are virtual datasets without any mappings.
+    These take up no space in the file, even in files opened with the "mpio"
+    driver, which allocates space for all other datasets as soon as they are
+    created. Such placeholders are meant to be replaced by the real data later
+    and cannot be written to in the meantime. Regular empty datasets are
+    created instead where virtual datasets are not supported.
+    """
+    previous = _PLACEHOLDER_STATE['active']
+    _PLACEHOLDER_STATE['active'] = True
+    try:
+        yield
+    finally:
+        _PLACEHOLDER_STATE['active'] = previous
+
+
+def _create_empty_dataset(h5_group, name, shape, **kwargs):
+    """
+    Creates an empty dataset or, within ``_placeholder_datasets()``, a virtual
+    placeholder dataset of the same shape and dtype if virtual datasets are
+    supported
+
+    Parameters
+    ----------
+    h5_group : h5py.Group
+        Group within which the dataset will be created
+    name : str
+        Name of the dataset
+    shape : tuple
+        Shape of the dataset
+    kwargs : dict
+        Keyword arguments for h5py.Group.create_dataset(). Only the dtype and
+        fillvalue apply to placeholders
+
+    Returns
+    -------
+    h5_dset : h5py.Dataset
+        Newly created dataset
+    """
+    if not _PLACEHOLDER_STATE['active'] or not _supports_virtual_datasets():
+        return h5_group.create_dataset(name, shape, **kwargs)
+    layout = h5py.VirtualLayout(shape=tuple(shape), dtype=kwargs.get('dtype', np.float32))
+    return h5_group.create_virtual_dataset(name, layout, fillvalue=kwargs.get('fillvalue', None))
+
+
 def get_all_main(parent, verbose=False):
     """
     Simple function to recursively print the contents of an hdf5 group
@@ -609,8 +691,42 @@ def check_for_old(h5_base, tool_name, new_parms=None, target_dset=None,
         target_dset = validate_single_string_arg(target_dset, 'target_dset')
 
     matching_groups = []
-    groups = find_results_groups(h5_base, tool_name,
-                                 h5_parent_group=h5_parent_goup)
+
+    indexed = dict()
+    if target_dset is None:
+        indexed = _read_results_index(h5_parent_goup).get(h5_base.name, dict()).get(tool_name, dict())
+
+    if len(indexed) == 0:
+        groups = find_results_groups(h5_base, tool_name,
+                                     h5_parent_group=h5_parent_goup)
+    else:
+        # Indexed groups are looked up by their hash without opening the others.
+        # Attributes are only compared for groups that are yet to be indexed
+        # or were indexed with a different set of parameter names
+        parms_hash, keys_hash = get_parms_hash(new_parms)
+        groups = []
+        for key, entry in indexed.items():
+            if key not in h5_parent_goup:
+                continue
+            if list(entry) == [parms_hash, keys_hash]:
+                group = h5_parent_goup[key]
+                # Guard against groups that were replaced since indexing
+                if isinstance(group, h5py.Group) and 'parms_hash' in group.attrs and \
+                        get_attr(group, 'parms_hash') == parms_hash:
+                    if verbose:
+                        print('Indexed group - {} matches'.format(key))
+                    matching_groups.append(group)
+                    continue
+                groups.append(group)
+            elif entry[1] != keys_hash and isinstance(h5_parent_goup[key], h5py.Group):
+                groups.append(h5_parent_goup[key])
+        dset_name = h5_base.name.split('/')[-1]
+        for key in h5_parent_goup.keys():
+            if key in indexed or dset_name not in key or tool_name not in key:
+                continue
+            group = h5_parent_goup[key]
+            if isinstance(group, h5py.Group):
+                groups.append(group)
 
     for group in groups:
         if verbose:
@@ -630,9 +746,173 @@ def check_for_old(h5_base, tool_name, new_parms=None, target_dset=None,
             # return group
             matching_groups.append(group)
 
+    if len(indexed) > 0:
+        # Restore the order in which the groups were created
+        matching_groups = sorted(matching_groups, key=lambda grp: grp.name)
+
     return matching_groups
 
 
+def _canonicalize_parm(value):
+    """
+    Converts a parameter to a JSON serializable form that is identical for
+    equivalent values regardless of whether they were read from HDF5
+    attributes or provided in python
+
+    Parameters
+    ----------
+    value : object
+        Parameter value
+
+    Returns
+    -------
+    value : list
+        Shape and flattened values of the parameter
+    """
+    value = np.asarray(value)
+    flat = value.ravel()
+    if value.dtype.kind in 'iubf':
+        # Integers and integral floats alike. Exact such that matching hashes imply matching values
+        flat = [_canonicalize_number(item) for item in flat]
+    elif value.dtype.kind == 'c':
+        flat = ['{},{}'.format(_canonicalize_number(item.real), _canonicalize_number(item.imag))
+                for item in flat]
+    else:
+        flat = [item.decode('utf-8') if isinstance(item, bytes) else str(item) for item in flat]
+    # Scalars and single element lists are stored alike in HDF5
+    shape = list(value.shape) if value.size > 1 else []
+    return [shape, flat]
+
+
+def _canonicalize_number(item):
+    """
+    Converts a real number to a form that is identical for equal numbers
+    regardless of their type
+
+    Parameters
+    ----------
+    item : numbers.Real
+        Number
+
+    Returns
+    -------
+    item : int or str
+        The number as an int if integral, else the exact representation of
+        the number as a float
+    """
+    if np.issubdtype(type(item), np.integer) or isinstance(item, (bool, np.bool_)):
+        return int(item)
+    item = float(item)
+    if np.isfinite(item) and item.is_integer():
+        return int(item)
+    return repr(item)
+
+
+def get_parms_hash(parms):
+    """
+    Computes canonical hashes of a set of parameters for looking up results
+    computed with the same parameters without comparing each attribute.
+    Parameters whose value is None are ignored as in
+    :func:`~pyUSID.io.hdf_utils.check_for_matching_attrs`.
+    Numbers hash alike only if they are equal, regardless of their type.
+    Parameters that only match within the tolerance of
+    :func:`~pyUSID.io.hdf_utils.check_for_matching_attrs` hash differently.
+
+    Parameters
+    ----------
+    parms : dict
+        Parameters of the computation
+
+    Returns
+    -------
+    parms_hash : str
+        Hash of the names and values of the parameters
+    keys_hash : str
+        Hash of only the names of the parameters
+    """
+    if not isinstance(parms, dict):
+        raise TypeError('parms should be a dict')
+    canonical = dict([(str(key), _canonicalize_parm(val)) for key, val in parms.items() if val is not None])
+    keys = sorted(canonical.keys())
+    parms_hash = hashlib.sha1(json.dumps([[key, canonical[key]] for key in keys]).encode('utf-8'))
+    keys_hash = hashlib.sha1(json.dumps(keys).encode('utf-8'))
+    return parms_hash.hexdigest()[:16], keys_hash.hexdigest()[:16]
+
+
+# Attribute of the parent group that indexes the results groups within it
+RESULTS_INDEX_ATTR = 'results_index'
+# Stay clear of the 64 kB limit on the size of attributes
+_MAX_RESULTS_INDEX_BYTES = 60000
+
+
+def _read_results_index(h5_parent_group):
+    """
+    Reads the index of the results groups within the provided group
+
+    Parameters
+    ----------
+    h5_parent_group : :class:`h5py.Group`
+        Group containing results groups
+
+    Returns
+    -------
+    index : dict
+        Nested dictionary of source dataset path -> tool name -> group name ->
+        [parms_hash, keys_hash]. Empty if no index is available
+    """
+    if RESULTS_INDEX_ATTR not in h5_parent_group.attrs:
+        return dict()
+    try:
+        return json.loads(get_attr(h5_parent_group, RESULTS_INDEX_ATTR))
+    except (ValueError, TypeError):
+        return dict()
+
+
+def index_results_group(h5_group, h5_source, tool_name, parms):
+    """
+    Writes the hash of the parameters to the results group and adds the
+    group to the index within its parent group, so that
+    :func:`~pyUSID.io.hdf_utils.check_for_old` can find results computed
+    with the same parameters without comparing the attributes of every
+    results group.
+
+    Parameters
+    ----------
+    h5_group : :class:`h5py.Group`
+        Results group
+    h5_source : :class:`h5py.Dataset`
+        Dataset that the tool was applied to
+    tool_name : str
+        Name of the tool as it will be provided to check_for_old
+    parms : dict
+        Parameters with which the results were computed
+
+    Returns
+    -------
+    is_indexed : bool
+        Whether or not the group was added to the index. The index is not
+        extended once it grows too large to be stored as an attribute
+    """
+    if not isinstance(h5_group, h5py.Group):
+        raise TypeError('h5_group should be a h5py.Group object')
+    if not isinstance(h5_source, h5py.Dataset):
+        raise TypeError('h5_source should be a h5py.Dataset object')
+    tool_name = validate_single_string_arg(tool_name, 'tool_name')
+
+    parms_hash, keys_hash = get_parms_hash(parms)
+    h5_group.attrs['parms_hash'] = parms_hash
+
+    h5_parent_group = h5_group.parent
+    index = _read_results_index(h5_parent_group)
+    group_name = h5_group.name.split('/')[-1]
+    index.setdefault(h5_source.name, dict()).setdefault(tool_name, dict())[group_name] = [parms_hash, keys_hash]
+    index = json.dumps(index)
+    if len(index) > _MAX_RESULTS_INDEX_BYTES:
+        return False
+    h5_parent_group.attrs[RESULTS_INDEX_ATTR] = index
+    return True
+
+
 def get_source_dataset(h5_group):
     """
     Find the name of the source dataset used to create the input `h5_group`,
@@ -821,7 +1101,7 @@ def copy_main_attributes(h5_main, h5_new):
 
 
 def create_empty_dataset(source_dset, dtype, dset_name, h5_group=None,
-                         new_attrs=None, skip_refs=False):
+                         new_attrs=None, skip_refs=False, parallel_compression=False):
     """
     Creates an empty dataset in the h5 file based on the provided dataset in
     the same or specified group
@@ -841,6 +1121,12 @@ def create_empty_dataset(source_dset, dtype, dset_name, h5_group=None,
     skip_refs : boolean, optional
         Should ObjectReferences be skipped when copying attributes from the
         `source_dset`
+    parallel_compression : bool, optional. Default = False
+        Only applies to files opened with the "mpio" driver, where compression
+        is removed by default since HDF5 only allows collective writes to
+        compressed datasets. Set to True to keep compression (HDF5 >= 1.10.2)
+        if all writes to this dataset will be collective, e.g. - by a Process
+        with collective_writes=True
 
     Returns
     -------
@@ -875,10 +1161,10 @@ def create_empty_dataset(source_dset, dtype, dset_name, h5_group=None,
              '{}'.format(dset_name, dset_name.replace('-', '_')))
     dset_name = dset_name.replace('-', '_')
 
-    kwargs = {'shape': source_dset.shape, 'dtype': dtype, 'compression': source_dset.compression,
+    kwargs = {'dtype': dtype, 'compression': source_dset.compression,
               'chunks': source_dset.chunks}
 
-    if source_dset.file.driver == 'mpio':
+    if source_dset.file.driver == 'mpio' and not (parallel_compression and _supports_parallel_compression()):
         if kwargs.pop('compression', None) is not None:
             warn('This HDF5 file has been opened wth the "mpio" communicator. '
                  'mpi4py does not allow creation of compressed datasets. Compression kwarg has been removed')
@@ -895,13 +1181,13 @@ def create_empty_dataset(source_dset, dtype, dset_name, h5_group=None,
                                                                                                 h5_new_dset.dtype,
                                                                                                 dtype))
                 del h5_new_dset, h5_group[dset_name]
-                h5_new_dset = h5_group.create_dataset(dset_name, **kwargs)
+                h5_new_dset = _create_empty_dataset(h5_group, dset_name, source_dset.shape, **kwargs)
         else:
             raise KeyError('{} is already a {} in group: {}'.format(dset_name, type(h5_group[dset_name]),
                                                                     h5_group.name))
 
     else:
-        h5_new_dset = h5_group.create_dataset(dset_name, **kwargs)
+        h5_new_dset = _create_empty_dataset(h5_group, dset_name, source_dset.shape, **kwargs)
 
     # This should link the ancillary datasets correctly
     h5_new_dset = hut.copy_attributes(source_dset, h5_new_dset,
@@ -10,7 +10,8 @@ Submodules
 """
 
 from .process import Process
+from .pipeline import ProcessPipeline
 from sidpy.proc import comp_utils
 from sidpy.proc.comp_utils import parallel_compute
 
-__all__ = ['Process', 'parallel_compute', 'comp_utils']
+__all__ = ['Process', 'ProcessPipeline', 'parallel_compute', 'comp_utils']
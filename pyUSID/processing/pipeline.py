@@ -0,0 +1,191 @@
+"""
+:class:`~pyUSID.processing.pipeline.ProcessPipeline` - Runs several processes over the same source dataset while
+reading the source dataset only once
+"""
+
+from __future__ import division, unicode_literals, print_function, \
+    absolute_import
+import time as tm
+import numpy as np
+
+from .process import Process, _read_positions
+
+
+class ProcessPipeline(object):
+    """
+    Drives several :class:`~pyUSID.processing.process.Process` instances that
+    operate on the same source dataset with a single pass of reads over the
+    source dataset. Each batch of positions is read once and handed to every
+    process that still needs to compute on those positions. Each process
+    writes its results and its own status dataset exactly as in
+    :meth:`~pyUSID.processing.process.Process.compute` and can therefore be
+    resumed independently, either via this pipeline or by itself.
+    Processes that prefetch, write asynchronously, checkpoint based on time
+    or schedule work dynamically cannot be run within a pipeline.
+    """
+
+    def __init__(self, processes, verbose=False):
+        """
+        Parameters
+        ----------
+        processes : list of :class:`~pyUSID.processing.process.Process`
+            Processes operating on the same source dataset. The processes
+            are applied to each batch in this order
+        verbose : bool, Optional, default = False
+            Whether or not to print debugging statements
+
+        Attributes
+        ----------
+        self.processes : list of :class:`~pyUSID.processing.process.Process`
+            Processes operating on the same source dataset
+        self.h5_main : :class:`~pyUSID.io.usi_data.USIDataset`
+            Source dataset shared by all processes
+        self.verbose : bool
+            Whether or not to print debugging statements
+        self.mpi_comm : :class:`mpi4py.MPI.COMM_WORLD`
+            MPI communicator. None if not running in an MPI context
+        self.mpi_rank: uint
+            MPI rank. Always 0 if not running in an MPI context
+        self.mpi_size: uint
+            Number of ranks in COMM_WORLD. 1 if not running in an MPI context
+        self._max_pos_per_read : uint
+            Number of positions to read per batch. The memory budget of the
+            processes is divided among them such that a batch fits within the
+            budget even if each process holds on to its own share of memory
+        """
+        if not isinstance(processes, (list, tuple)):
+            raise TypeError('processes should be a list of Process objects')
+        if len(processes) == 0:
+            raise ValueError('processes should contain at least one Process')
+        for proc in processes:
+            if not isinstance(proc, Process):
+                raise TypeError('processes should be a list of Process objects. '
+                                'Provided object of type: {}'.format(type(proc)))
+        h5_main = processes[0].h5_main
+        for proc in processes[1:]:
+            if proc.h5_main.file != h5_main.file or proc.h5_main.name != h5_main.name:
+                raise ValueError('All processes should operate on the same source dataset. '
+                                 '{} != {}'.format(proc.h5_main.name, h5_main.name))
+        self.processes = list(processes)
+        self.h5_main = h5_main
+        self.verbose = verbose
+        self.mpi_comm = processes[0].mpi_comm
+        self.mpi_rank = processes[0].mpi_rank
+        self.mpi_size = processes[0].mpi_size
+        # A position takes up 1 / _max_pos_per_read of the memory budget in each process
+        self._max_pos_per_read = max(1, int(1 / sum([1 / proc._max_pos_per_read for proc in processes])))
+
+    @classmethod
+    def sweep(cls, proc_class, h5_main, parms_list, verbose=False, **kwargs):
+        """
+        Sets up a pipeline that evaluates several sets of parameters of the
+        same process with a single pass of reads over the source dataset.
+        Each set of parameters gets its own results group which can be found
+        via :func:`~pyUSID.io.hdf_utils.check_for_old` just like results
+        computed via :meth:`~pyUSID.processing.process.Process.compute`
+
+        Parameters
+        ----------
+        proc_class : class
+            Child class of :class:`~pyUSID.processing.process.Process`
+        h5_main : :class:`~pyUSID.io.usi_data.USIDataset`
+            The USID main HDF5 dataset over which the analysis will be performed
+        parms_list : list of dict
+            Keyword arguments for `proc_class` for each set of parameters
+        verbose : bool, Optional, default = False
+            Whether or not to print debugging statements
+        kwargs : dict
+            Keyword arguments for `proc_class` common to all sets of
+            parameters, such as `cores` or `max_mem_mb`
+
+        Returns
+        -------
+        pipeline : ProcessPipeline
+            Pipeline with one process per set of parameters, in the same order
+            as `parms_list`
+        """
+        if not isinstance(proc_class, type) or not issubclass(proc_class, Process):
+            raise TypeError('proc_class should be a child class of Process')
+        if not isinstance(parms_list, (list, tuple)):
+            raise TypeError('parms_list should be a list of dictionaries')
+        for parms in parms_list:
+            if not isinstance(parms, dict):
+                raise TypeError('parms_list should be a list of dictionaries')
+        processes = []
+        for parms in parms_list:
+            proc_kwargs = kwargs.copy()
+            proc_kwargs.update(parms)
+            processes.append(proc_class(h5_main, **proc_kwargs))
+        return cls(processes, verbose=verbose)
+
+    def compute(self, override=False, stage_args=None, stage_kwargs=None):
+        """
+        Computes and writes the results of all processes with a single pass of
+        reads over the source dataset
+
+        Parameters
+        ----------
+        override : bool, optional. default = False
+            By default, processes with existing complete results are skipped
+            and processes with partial results are resumed. Set to True to
+            force fresh computation for all processes
+        stage_args : list of list, optional
+            Arguments to the mapped function of each process
+        stage_kwargs : list of dict, optional
+            Keyword arguments to the mapped function of each process
+
+        Returns
+        -------
+        h5_results_grps : list of :class:`h5py.Group`
+            Group containing the results of each process
+        """
+        num_stages = len(self.processes)
+        if stage_args is None:
+            stage_args = [[] for _ in range(num_stages)]
+        if stage_kwargs is None:
+            stage_kwargs = [dict() for _ in range(num_stages)]
+        if len(stage_args) != num_stages or len(stage_kwargs) != num_stages:
+            raise ValueError('stage_args and stage_kwargs should have one entry per process')
+
+        stage_jobs = [proc._start_pipeline_stage(override, *args, **kwargs)
+                      for proc, args, kwargs in zip(self.processes, stage_args, stage_kwargs)]
+        all_jobs = np.unique(np.hstack(stage_jobs)).astype(np.int64)
+        # Each rank reads an equal share of the positions
+        rank_jobs = np.array_split(all_jobs, self.mpi_size)[self.mpi_rank]
+
+        if self.verbose:
+            print('Rank {} - will read {} positions for {} processes in batches of {} positions'
+                  '.'.format(self.mpi_rank, len(rank_jobs), num_stages, self._max_pos_per_read))
+
+        try:
+            for start in range(0, len(rank_jobs), self._max_pos_per_read):
+                pixels = rank_jobs[start: start + self._max_pos_per_read]
+                t_start = tm.time()
+                data = _read_positions(self.h5_main, pixels)
+                read_time = tm.time() - t_start
+
+                for proc, jobs, args, kwargs in zip(self.processes, stage_jobs,
+                                                    stage_args, stage_kwargs):
+                    needed = np.isin(pixels, jobs)
+                    if not np.any(needed):
+                        continue
+                    if np.all(needed):
+                        proc._compute_pipeline_batch(pixels, data, read_time, *args, **kwargs)
+                    else:
+                        proc._compute_pipeline_batch(pixels[needed], data[needed],
+                                                     read_time, *args, **kwargs)
+
+                if self.mpi_rank == 0 or self.verbose:
+                    percent_complete = int(100 * min(len(rank_jobs), start + len(pixels)) /
+                                           len(rank_jobs))
+                    print('Rank {} - {}% complete'.format(self.mpi_rank, percent_complete))
+        except BaseException:
+            # Checkpoint whatever was written by each process
+            for proc in self.processes:
+                proc._end_pipeline_stage(completed=False)
+            raise
+
+        for proc in self.processes:
+            proc._end_pipeline_stage()
+
+        return [proc.h5_results_grp for proc in self.processes]
@@ -9,27 +9,1242 @@ Created on 7/17/16 10:08 AM
 
 from __future__ import division, unicode_literals, print_function, \
     absolute_import
+import os
+import sys
+import glob
+import threading
+import tempfile
+import tracemalloc
 import numpy as np
 import psutil
 import time as tm
 import h5py
+import joblib
+import dask
+import dask.array as da
+from threadpoolctl import threadpool_limits
+from copy import copy
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from warnings import warn
 from numbers import Number
-from multiprocessing import cpu_count
+from math import gcd
+from multiprocessing import cpu_count, get_context, get_all_start_methods
 
 from sidpy.proc.comp_utils import parallel_compute, get_MPI, \
     group_ranks_by_socket, get_available_memory
-from sidpy.base.num_utils import integers_to_slices
 from sidpy.base.string_utils import validate_single_string_arg, format_time, \
     format_size
 from sidpy.hdf.hdf_utils import write_simple_attrs, lazy_load_array
 
-from ..io.hdf_utils import check_if_main, check_for_old
+from ..io.hdf_utils import check_if_main, check_for_old, index_results_group, get_all_main
+from ..io.hdf_utils.simple import _placeholder_datasets, _supports_virtual_datasets
 from ..io.usi_data import USIDataset
 
 # TODO: internalize as many attributes as possible. Expose only those that will be required by the user
 
 
+def _get_consecutive_runs(positions):
+    """
+    Splits a sorted array of unique positions into runs of consecutive positions
+
+    Parameters
+    ----------
+    positions : :class:`numpy.ndarray`
+        1D array of sorted, unique, unsigned integers
+
+    Returns
+    -------
+    runs : list of tuple
+        (start, stop) bounds of each run such that positions within a run are
+        given by range(start, stop)
+    """
+    positions = np.asarray(positions)
+    if positions.size == 0:
+        return []
+    breaks = np.where(np.diff(positions) != 1)[0] + 1
+    starts = positions[np.hstack(([0], breaks))]
+    stops = positions[np.hstack((breaks - 1, [positions.size - 1]))] + 1
+    return [(int(start), int(stop)) for start, stop in zip(starts, stops)]
+
+
+def _read_positions(h5_dset, positions, spectral_slice=slice(None), out=None):
+    """
+    Reads the requested positions from a 2D dataset, reading each run of
+    consecutive positions as a hyperslab which is far cheaper than a point
+    selection of the same positions
+
+    Parameters
+    ----------
+    h5_dset : :class:`h5py.Dataset`
+        2D dataset of shape (positions, spectral steps)
+    positions : :class:`numpy.ndarray`
+        1D array of sorted, unique, unsigned integers
+    spectral_slice : slice, optional. Default = all spectral steps
+        Contiguous range of spectral steps to read for each position
+    out : :class:`numpy.ndarray`, optional
+        C-contiguous 2D array whose leading rows the data is read into
+        instead of a new array
+
+    Returns
+    -------
+    data : :class:`numpy.ndarray`
+        2D array of shape (positions, spectral steps). A view of `out` if
+        provided
+    """
+    runs = _get_consecutive_runs(positions)
+    if len(runs) == 1 and out is None:
+        return h5_dset[runs[0][0]: runs[0][1], spectral_slice]
+
+    num_steps = len(range(*spectral_slice.indices(h5_dset.shape[1])))
+    if out is None:
+        data = np.empty(shape=(len(positions), num_steps), dtype=h5_dset.dtype)
+    else:
+        data = out[:len(positions)]
+    offset = 0
+    for run_start, run_end in runs:
+        num_pos = run_end - run_start
+        h5_dset.read_direct(data,
+                            source_sel=np.s_[run_start: run_end, spectral_slice],
+                            dest_sel=np.s_[offset: offset + num_pos, :])
+        offset += num_pos
+    return data
+
+
+def _write_nothing(h5_dset):
+    """
+    Takes part in a collective write to the provided dataset without writing
+    any data. Ranks without results to write call this so that collective
+    writes by the other ranks can proceed
+
+    Parameters
+    ----------
+    h5_dset : :class:`h5py.Dataset`
+        Dataset being written to
+    """
+    file_space = h5_dset.id.get_space()
+    file_space.select_none()
+    mem_space = h5py.h5s.create_simple((1,))
+    mem_space.select_none()
+    dxpl = h5py.h5p.create(h5py.h5p.DATASET_XFER)
+    if h5py.get_config().mpi:
+        dxpl.set_dxpl_mpio(h5py.h5fd.MPIO_COLLECTIVE)
+    h5_dset.id.write(mem_space, file_space, np.zeros(1, dtype=h5_dset.dtype), dxpl=dxpl)
+
+
+class _CompletedRanges(object):
+    """
+    Compact record of the positions that have been computed, stored as
+    sorted, non-overlapping [start, stop) ranges of positions
+    """
+
+    # Attributes of the status dataset that hold this summary
+    count_attr = 'num_completed'
+    ranges_attr = 'completed_ranges'
+    # Keeps the ranges attribute well within the 64 kB limit for attributes
+    max_ranges_in_attr = 2048
+
+    def __init__(self, ranges=None):
+        """
+        Parameters
+        ----------
+        ranges : array-like, optional
+            N x 2 array of [start, stop) ranges of completed positions
+        """
+        if ranges is None:
+            ranges = np.zeros(shape=(0, 2), dtype=np.int64)
+        self.ranges = _merge_ranges(np.asarray(ranges, dtype=np.int64).reshape(-1, 2))
+
+    @classmethod
+    def from_status_dataset(cls, h5_status):
+        """
+        Reads the summary written to the status dataset if it is available
+        and consistent. Otherwise, the entire status dataset is read
+
+        Parameters
+        ----------
+        h5_status : :class:`h5py.Dataset`
+            1D uint8 dataset with 1 for each completed position
+
+        Returns
+        -------
+        completed : _CompletedRanges
+            Ranges of completed positions
+        """
+        attrs = h5_status.attrs
+        if cls.count_attr in attrs and cls.ranges_attr in attrs:
+            completed = cls(attrs[cls.ranges_attr])
+            if completed.num_completed == attrs[cls.count_attr]:
+                return completed
+        edges = np.diff(np.hstack(([0], h5_status[()].astype(np.int8), [0])))
+        return cls(np.vstack((np.where(edges == 1)[0], np.where(edges == -1)[0])).T)
+
+    @classmethod
+    def get_num_completed(cls, h5_status):
+        """
+        Returns the number of completed positions using the summary written
+        to the status dataset if available instead of reading the dataset
+
+        Parameters
+        ----------
+        h5_status : :class:`h5py.Dataset`
+            1D uint8 dataset with 1 for each completed position
+
+        Returns
+        -------
+        num_completed : uint
+            Number of completed positions
+        """
+        if cls.count_attr in h5_status.attrs:
+            return int(h5_status.attrs[cls.count_attr])
+        return int(np.sum(h5_status[()]))
+
+    @property
+    def num_completed(self):
+        """
+        Number of completed positions
+        """
+        return int(np.sum(self.ranges[:, 1] - self.ranges[:, 0]))
+
+    def add(self, ranges):
+        """
+        Marks the provided ranges of positions as completed
+
+        Parameters
+        ----------
+        ranges : array-like
+            N x 2 array of [start, stop) ranges of completed positions
+        """
+        ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+        self.ranges = _merge_ranges(np.vstack((self.ranges, ranges)))
+
+    def get_incomplete(self, num_positions):
+        """
+        Returns the positions that have not been completed
+
+        Parameters
+        ----------
+        num_positions : uint
+            Total number of positions
+
+        Returns
+        -------
+        positions : :class:`numpy.ndarray`
+            Sorted 1D array of incomplete positions
+        """
+        gap_starts = np.hstack(([0], self.ranges[:, 1]))
+        gap_stops = np.hstack((self.ranges[:, 0], [num_positions]))
+        return np.hstack([np.arange(start, stop) for start, stop in zip(gap_starts, gap_stops)
+                          if stop > start] + [np.zeros(0, dtype=np.int64)])
+
+    def write(self, h5_status):
+        """
+        Writes the summary as attributes of the status dataset. The ranges
+        are omitted if there are too many of them to fit in an attribute.
+        This call is collective when the file is opened with the mpio driver
+
+        Parameters
+        ----------
+        h5_status : :class:`h5py.Dataset`
+            1D uint8 dataset with 1 for each completed position
+        """
+        h5_status.attrs[self.count_attr] = self.num_completed
+        if len(self.ranges) <= self.max_ranges_in_attr:
+            h5_status.attrs[self.ranges_attr] = self.ranges
+        elif self.ranges_attr in h5_status.attrs:
+            del h5_status.attrs[self.ranges_attr]
+
+    @classmethod
+    def invalidate(cls, h5_status):
+        """
+        Removes the summary from the status dataset so that it is not relied
+        upon while ranks update the status dataset independently.
+        This call is collective when the file is opened with the mpio driver
+
+        Parameters
+        ----------
+        h5_status : :class:`h5py.Dataset`
+            1D uint8 dataset with 1 for each completed position
+        """
+        for attr_name in [cls.count_attr, cls.ranges_attr]:
+            if attr_name in h5_status.attrs:
+                del h5_status.attrs[attr_name]
+
+
+def _merge_ranges(ranges):
+    """
+    Merges overlapping or adjacent [start, stop) ranges
+
+    Parameters
+    ----------
+    ranges : :class:`numpy.ndarray`
+        N x 2 array of [start, stop) ranges in any order
+
+    Returns
+    -------
+    ranges : :class:`numpy.ndarray`
+        M x 2 array of sorted, non-overlapping, non-adjacent ranges
+    """
+    ranges = ranges[ranges[:, 1] > ranges[:, 0]]
+    if len(ranges) < 2:
+        return ranges
+    ranges = ranges[np.argsort(ranges[:, 0], kind='stable')]
+    max_stops = np.maximum.accumulate(ranges[:, 1])
+    is_new = np.hstack(([True], ranges[1:, 0] > max_stops[:-1]))
+    starts = np.where(is_new)[0]
+    ends = np.hstack((starts[1:] - 1, [len(ranges) - 1]))
+    return np.vstack((ranges[starts, 0], max_stops[ends])).T
+
+
+def _parse_cpu_list(cpu_list):
+    """
+    Parses a list of CPUs in the format used by the Linux kernel
+
+    Parameters
+    ----------
+    cpu_list : str
+        Comma separated CPUs or ranges of CPUs, e.g. - '0-3,8-11'
+
+    Returns
+    -------
+    cpus : list of int
+        Sorted CPUs
+    """
+    cpus = []
+    for item in cpu_list.strip().split(','):
+        if not item:
+            continue
+        bounds = [int(bound) for bound in item.split('-')]
+        cpus += list(range(bounds[0], bounds[-1] + 1))
+    return sorted(cpus)
+
+
+def _get_numa_cpus():
+    """
+    Returns the CPUs this process may run on grouped by NUMA node. Assumes a
+    single node if the topology cannot be read, as outside Linux
+
+    Returns
+    -------
+    nodes : list of list of int
+        CPUs on each NUMA node that this process may run on
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        allowed = set(os.sched_getaffinity(0))
+    else:
+        allowed = set(range(cpu_count()))
+    nodes = []
+    paths = glob.glob('/sys/devices/system/node/node[0-9]*/cpulist')
+    for path in sorted(paths, key=lambda item: int(item.split('/')[-2][4:])):
+        with open(path) as file_handle:
+            cpus = [cpu for cpu in _parse_cpu_list(file_handle.read()) if cpu in allowed]
+        if len(cpus) > 0:
+            nodes.append(cpus)
+    if len(nodes) == 0:
+        nodes = [sorted(allowed)]
+    return nodes
+
+
+def _split_cpus(nodes, num_parts):
+    """
+    Splits the CPUs of the NUMA nodes among the provided number of ranks or
+    workers such that each spans as few NUMA nodes as possible
+
+    Parameters
+    ----------
+    nodes : list of list of int
+        CPUs on each NUMA node
+    num_parts : uint
+        Number of ranks or workers
+
+    Returns
+    -------
+    cpu_sets : list of list of int
+        CPUs for each rank or worker
+    """
+    if num_parts <= len(nodes):
+        # Each part gets one or more whole nodes
+        return [sum([nodes[ind] for ind in group], [])
+                for group in np.array_split(np.arange(len(nodes)), num_parts)]
+    cpu_sets = []
+    for node, parts in zip(nodes, np.array_split(np.arange(num_parts), len(nodes))):
+        for cpus in np.array_split(node, len(parts)):
+            # More parts than CPUs on this node. Parts share the node
+            cpu_sets.append([int(cpu) for cpu in cpus] if len(cpus) > 0 else list(node))
+    return cpu_sets
+
+
+def _pin_to_next_cpus(cpu_sets, counter):
+    """
+    Pins the calling process, or thread on Linux, to the next set of CPUs.
+    Meant to be the initializer of the workers of a pool
+
+    Parameters
+    ----------
+    cpu_sets : list of list of int
+        CPUs for each worker
+    counter : :class:`multiprocessing.Value`
+        Number of workers pinned so far. Shared by all workers of the pool
+    """
+    with counter.get_lock():
+        ind = counter.value
+        counter.value += 1
+    os.sched_setaffinity(0, cpu_sets[ind % len(cpu_sets)])
+
+
+# Function and arguments shipped once to each worker of a persistent pool
+_POOL_WORKER_STATE = dict()
+
+
+def _get_pool_context():
+    """
+    Returns the multiprocessing context used to start pool workers. Forking a
+    process that holds open HDF5 files, MPI state or threads is unsafe, so
+    workers are started from a fork server or spawned where fork servers are
+    unavailable
+
+    Returns
+    -------
+    context : multiprocessing.context.BaseContext
+        Context for starting worker processes
+    """
+    if 'forkserver' in get_all_start_methods():
+        return get_context('forkserver')
+    return get_context('spawn')
+
+
+# Environment variables read by BLAS / OpenMP libraries when a process starts
+_BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                     'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+
+@contextmanager
+def _limit_blas_threads(blas_threads):
+    """
+    Limits the threads used by BLAS / OpenMP within this process and within
+    worker processes started in this context. Limits set via threadpoolctl
+    do not cross process boundaries, so workers started afresh (e.g. by
+    joblib's loky backend or dask) are limited via environment variables
+    instead. Workers of the persistent pool apply the limit themselves
+    since they are started from a fork server that does not see these
+    variables
+
+    Parameters
+    ----------
+    blas_threads : uint or None
+        Number of threads. Nothing is limited if None
+    """
+    if blas_threads is None:
+        yield
+        return
+    orig_env = dict([(var, os.environ.get(var)) for var in _BLAS_THREAD_VARS])
+    os.environ.update(dict([(var, str(blas_threads)) for var in _BLAS_THREAD_VARS]))
+    try:
+        with threadpool_limits(limits=blas_threads):
+            yield
+    finally:
+        for var, val in orig_env.items():
+            if val is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = val
+
+
+def _init_pool_worker(func, func_args, func_kwargs, blas_threads=None,
+                      cpu_sets=None, counter=None):
+    """
+    Stores the function that will be mapped, along with its arguments, within
+    a worker of a persistent pool so that they need not be sent per task
+
+    Parameters
+    ----------
+    func : callable
+        Function to map to each position
+    func_args : tuple
+        arguments to the function
+    func_kwargs : dict
+        keyword arguments to the function
+    blas_threads : uint, optional
+        Number of threads that BLAS / OpenMP may use within this worker
+    cpu_sets : list of list of int, optional
+        CPUs for each worker of the pool. The worker is not pinned if None
+    counter : :class:`multiprocessing.Value`, optional
+        Number of workers of the pool pinned so far
+    """
+    if cpu_sets is not None:
+        _pin_to_next_cpus(cpu_sets, counter)
+    if blas_threads is not None:
+        threadpool_limits(limits=blas_threads)
+    _POOL_WORKER_STATE['func'] = func
+    _POOL_WORKER_STATE['args'] = func_args
+    _POOL_WORKER_STATE['kwargs'] = func_kwargs
+
+
+def _map_block_in_pool_worker(block):
+    """
+    Applies the function stored in this worker to each position in the block
+
+    Parameters
+    ----------
+    block : :class:`numpy.ndarray`
+        2D array of shape (positions, spectral steps)
+
+    Returns
+    -------
+    results : tuple
+        Result of the function for each position in the block along with the
+        process ID and peak resident memory of this worker
+    """
+    return _with_peak_rss(_apply_stored_function(block, True))
+
+
+def _apply_to_block_in_pool_worker(block):
+    """
+    Applies the function stored in this worker to the entire block at once
+
+    Parameters
+    ----------
+    block : :class:`numpy.ndarray`
+        2D array of shape (positions, spectral steps)
+
+    Returns
+    -------
+    results : tuple
+        Result of the function for the block along with the process ID and
+        peak resident memory of this worker
+    """
+    return _with_peak_rss(_apply_stored_function(block, False))
+
+
+def _apply_stored_function(block, per_position):
+    """
+    Applies the function stored in this worker to each position in the block
+    or to the entire block
+
+    Parameters
+    ----------
+    block : :class:`numpy.ndarray`
+        2D array of shape (positions, spectral steps)
+    per_position : bool
+        If True, the function is called per position. Else, on the block
+
+    Returns
+    -------
+    results : object
+        Result of the function for the block
+    """
+    return _apply_to_block(_POOL_WORKER_STATE['func'], block, per_position,
+                           _POOL_WORKER_STATE['args'], _POOL_WORKER_STATE['kwargs'])
+
+
+def _with_peak_rss(results):
+    """
+    Pairs the results of a task in a pool worker with the peak resident
+    memory of the worker, which is not visible to the parent process since
+    workers are not its (waited for) children
+
+    Parameters
+    ----------
+    results : object
+        Results of the task
+
+    Returns
+    -------
+    results : tuple
+        (results, process ID, peak resident memory in bytes)
+    """
+    return results, os.getpid(), _get_peak_rss()
+
+
+def _apply_to_block(func, block, per_position, func_args, func_kwargs):
+    """
+    Applies the function to each position in the block or to the entire block
+
+    Parameters
+    ----------
+    func : callable
+        Function to apply
+    block : :class:`numpy.ndarray`
+        2D array of shape (positions, spectral steps)
+    per_position : bool
+        If True, `func` is applied to each position. Else, to the block
+    func_args : tuple
+        arguments to the function
+    func_kwargs : dict
+        keyword arguments to the function
+
+    Returns
+    -------
+    results : object
+        List with the result per position or the result for the block
+    """
+    if per_position:
+        return [func(vector, *func_args, **func_kwargs) for vector in block]
+    return func(block, *func_args, **func_kwargs)
+
+
+class _Failure(object):
+    """
+    Stands in for the result of a position whose computation raised an error
+    """
+
+    def __init__(self, error):
+        """
+        Parameters
+        ----------
+        error : Exception
+            Error raised when computing on the position
+        """
+        self.message = '{}: {}'.format(type(error).__name__, error)
+
+
+class _IsolatedFunction(object):
+    """
+    Calls a function such that errors only fail the positions the function
+    was called on rather than the entire computation. Picklable as long as the
+    wrapped function is, so that it can be sent to any worker
+    """
+
+    def __init__(self, func, per_position=True):
+        """
+        Parameters
+        ----------
+        func : callable
+            Function to call
+        per_position : bool, optional. Default = True
+            Whether `func` is called on a single position or on a block of
+            positions
+        """
+        self.func = func
+        self.per_position = per_position
+
+    def __eq__(self, other):
+        # Lets persistent worker pools be reused across batches
+        return isinstance(other, _IsolatedFunction) and self.func == other.func and \
+            self.per_position == other.per_position
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.func, self.per_position))
+
+    def __call__(self, data, *args, **kwargs):
+        try:
+            return self.func(data, *args, **kwargs)
+        except Exception as error:
+            failure = _Failure(error)
+            if self.per_position:
+                return failure
+            return [failure] * len(data)
+
+
+def _fill_failures(results):
+    """
+    Replaces the results of the positions that failed with NaNs, or zeros for
+    integer results, shaped like the results of the other positions
+
+    Parameters
+    ----------
+    results : list or :class:`numpy.ndarray`
+        Results for each position, with a :class:`_Failure` for each position
+        that failed
+
+    Returns
+    -------
+    results : list or :class:`numpy.ndarray`
+        Results for each position with the failures replaced. Unchanged if
+        all positions failed
+    failed : :class:`numpy.ndarray`
+        Indices of the positions that failed within `results`
+    """
+    if isinstance(results, np.ndarray):
+        # Stacked, hence nothing failed
+        return results, np.zeros(0, dtype=np.int64)
+    failed = np.array([ind for ind, item in enumerate(results) if isinstance(item, _Failure)],
+                      dtype=np.int64)
+    if len(failed) in [0, len(results)]:
+        return results, failed
+    template = [item for item in results if not isinstance(item, _Failure)][0]
+    try:
+        fill = np.zeros_like(np.asarray(template))
+        if fill.dtype.kind in 'fc':
+            fill[...] = np.nan
+    except (TypeError, ValueError):
+        # Not array-like. Flagged as failed either way
+        fill = template
+    results = list(results)
+    for ind in failed:
+        results[ind] = copy(fill)
+    return results, failed
+
+
+def _compute_lazy_isolated(results, compute_kwargs, blocks_per_round=1):
+    """
+    Computes lazy results one block of positions at a time such that errors
+    only fail the positions in the block they were raised for. Blocks are
+    computed together in rounds and the blocks of a round that raised an error
+    are computed again one by one to find the blocks that failed
+
+    Parameters
+    ----------
+    results : :class:`dask.array.core.Array` or list
+        Lazy results with positions along the first axis, or a list of such
+        arrays
+    compute_kwargs : dict
+        Keyword arguments to :func:`dask.compute`
+    blocks_per_round : uint, optional. Default = 1
+        Number of blocks of positions computed together
+
+    Returns
+    -------
+    results : :class:`numpy.ndarray` or list
+        Computed results, with those of the positions that failed filled with
+        NaNs or zeros for integer results
+    failed : :class:`numpy.ndarray`
+        Indices of the positions that failed
+    """
+    single = isinstance(results, da.core.Array)
+    arrays = [results] if single else list(results)
+    # All results are split into the same blocks of positions
+    chunks = arrays[0].chunks[0]
+    arrays = [da.asarray(array).rechunk({0: chunks}) for array in arrays]
+    bounds = np.cumsum((0,) + chunks)
+    blocks = [[array.blocks[ind] for array in arrays] for ind in range(len(chunks))]
+
+    computed = []
+    for start in range(0, len(blocks), blocks_per_round):
+        round_blocks = blocks[start: start + blocks_per_round]
+        try:
+            computed += list(dask.compute(round_blocks, **compute_kwargs)[0])
+        except Exception:
+            for block in round_blocks:
+                try:
+                    computed.append(dask.compute(block, **compute_kwargs)[0])
+                except Exception as error:
+                    computed.append(_Failure(error))
+
+    failed = [np.arange(bounds[ind], bounds[ind + 1]) for ind, item in enumerate(computed)
+              if isinstance(item, _Failure)]
+    failed = np.hstack(failed + [np.zeros(0)]).astype(np.int64)
+    if len(failed) == bounds[-1]:
+        # Nothing to write
+        return results, failed
+    stacked = []
+    for array_ind, array in enumerate(arrays):
+        parts = []
+        for ind, item in enumerate(computed):
+            if not isinstance(item, _Failure):
+                parts.append(np.asarray(item[array_ind]))
+                continue
+            fill = np.zeros((chunks[ind],) + array.shape[1:], dtype=array.dtype)
+            if fill.dtype.kind in 'fc':
+                fill[...] = np.nan
+            parts.append(fill)
+        stacked.append(np.concatenate(parts, axis=0))
+    return (stacked[0] if single else stacked), failed
+
+
+def _open_shared_buffer(desc):
+    """
+    Opens a buffer shared by the parent process within a worker. The most
+    recently opened buffers are cached in the worker
+
+    Parameters
+    ----------
+    desc : tuple
+        (path, shape, dtype) as provided by :meth:`_SharedBuffer.describe`
+
+    Returns
+    -------
+    array : :class:`numpy.memmap`
+        Array backed by the shared buffer
+    """
+    buffers = _POOL_WORKER_STATE.setdefault('buffers', dict())
+    path, shape, dtype = desc
+    array = buffers.get(path)
+    if array is None:
+        if len(buffers) > 1:
+            # Drop buffers that the parent process has since replaced
+            buffers.clear()
+        array = np.memmap(path, dtype=np.dtype(dtype), mode='r+', shape=shape)
+        buffers[path] = array
+    return array
+
+
+def _compute_on_shared_block(task):
+    """
+    Applies the function stored in this worker to a block of positions
+    within a buffer shared with the parent process
+
+    Parameters
+    ----------
+    task : tuple
+        (data buffer description, start, end, per position, results buffer
+        description). The results buffer description is None if results
+        should be returned rather than written in place
+
+    Returns
+    -------
+    results : tuple
+        Result of the function for the block, or None if written in place,
+        along with the process ID and peak resident memory of this worker
+    """
+    data_desc, start, end, per_position, result_desc = task
+    block = _open_shared_buffer(data_desc)[start: end]
+    results = _apply_stored_function(block, per_position)
+    if result_desc is None:
+        return _with_peak_rss(results)
+    _open_shared_buffer(result_desc)[start: end] = results
+    return _with_peak_rss(None)
+
+
+class _SharedBuffer(object):
+    """
+    Array backed by a memory-mapped file (in shared memory where available)
+    that worker processes can open without the array being copied to them
+    """
+
+    def __init__(self, shape, dtype):
+        """
+        Parameters
+        ----------
+        shape : tuple
+            Shape of the array
+        dtype : :class:`numpy.dtype`
+            Data type of the array
+        """
+        folder = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        handle, self.path = tempfile.mkstemp(prefix='pyUSID_', suffix='.dat', dir=folder)
+        os.close(handle)
+        self.array = np.memmap(self.path, dtype=dtype, mode='w+', shape=shape)
+
+    @classmethod
+    def reuse_or_create(cls, buffer, shape, dtype):
+        """
+        Returns the provided buffer if it is large enough for an array of
+        the requested shape and data type. Otherwise, a new buffer is created
+        and the provided buffer is closed
+
+        Parameters
+        ----------
+        buffer : _SharedBuffer or None
+            Existing buffer
+        shape : tuple
+            Shape of the required array. Only the first axis may differ
+        dtype : :class:`numpy.dtype`
+            Data type of the required array
+
+        Returns
+        -------
+        buffer : _SharedBuffer
+            Buffer whose leading rows can hold the required array
+        """
+        if buffer is not None:
+            if buffer.array.dtype == dtype and buffer.array.shape[1:] == tuple(shape[1:]) and \
+                    buffer.array.shape[0] >= shape[0]:
+                return buffer
+            buffer.close()
+        return cls(shape, dtype)
+
+    def describe(self):
+        """
+        Returns
+        -------
+        desc : tuple
+            (path, shape, dtype) that workers can use to open this buffer
+        """
+        return self.path, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        """
+        Releases the array and deletes the backing file
+        """
+        self.array = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _stack_block_results(block_results):
+    """
+    Stacks the results computed on consecutive blocks of positions
+
+    Parameters
+    ----------
+    block_results : list
+        Results for each block. Either arrays whose first axis is positions
+        or lists with one item per position
+
+    Returns
+    -------
+    results : :class:`numpy.ndarray` or list
+        Results for all positions
+    """
+    if all([isinstance(item, np.ndarray) for item in block_results]):
+        return np.concatenate(block_results, axis=0)
+    results = list()
+    for item in block_results:
+        results += list(item)
+    return results
+
+
+def _is_same_pool_key(key_1, key_2):
+    """
+    Checks whether two (function, arguments, keyword arguments) tuples refer
+    to the very same objects. Identity rather than equality is checked since
+    arguments may be arrays
+
+    Parameters
+    ----------
+    key_1 : tuple
+        (function, arguments, keyword arguments)
+    key_2 : tuple
+        (function, arguments, keyword arguments)
+
+    Returns
+    -------
+    same : bool
+        Whether or not the two keys refer to the same objects
+    """
+    func_1, args_1, kwargs_1 = key_1
+    func_2, args_2, kwargs_2 = key_2
+    if func_1 != func_2 or len(args_1) != len(args_2) or set(kwargs_1) != set(kwargs_2):
+        return False
+    return all([item_1 is item_2 for item_1, item_2 in zip(args_1, args_2)]) and \
+        all([kwargs_1[key] is kwargs_2[key] for key in kwargs_1])
+
+
+class _WorkCounter(object):
+    """
+    Counter that can be atomically incremented by all MPI ranks without the
+    participation of the rank holding the counter (rank 0). Falls back to a
+    plain counter outside the MPI context.
+    """
+
+    def __init__(self, comm=None):
+        """
+        Parameters
+        ----------
+        comm : :class:`mpi4py.MPI.Comm`, optional
+            Communicator shared by all ranks that increment this counter.
+            This call is collective over this communicator
+        """
+        self.__comm = comm
+        self.__value = 0
+        self.__win = None
+        if comm is None:
+            return
+        MPI = get_MPI()
+        # Only rank 0 exposes memory for the counter
+        self.__mem = np.zeros(int(comm.Get_rank() == 0), dtype=np.int64)
+        self.__win = MPI.Win.Create(self.__mem, disp_unit=self.__mem.itemsize,
+                                    comm=comm)
+
+    def fetch_and_add(self, increment=1):
+        """
+        Increments the counter and returns the value prior to incrementing
+
+        Parameters
+        ----------
+        increment : int, optional
+            Value to add to the counter
+
+        Returns
+        -------
+        value : int
+            Value of the counter before it was incremented
+        """
+        if self.__win is None:
+            value = self.__value
+            self.__value += increment
+            return value
+        MPI = get_MPI()
+        incr = np.array([increment], dtype=np.int64)
+        value = np.zeros(1, dtype=np.int64)
+        self.__win.Lock(0, MPI.LOCK_SHARED)
+        self.__win.Fetch_and_op(incr, value, 0, 0, MPI.SUM)
+        self.__win.Unlock(0)
+        return int(value[0])
+
+    @property
+    def value(self):
+        """
+        Current value of the counter
+        """
+        return self.fetch_and_add(0)
+
+    def free(self):
+        """
+        Releases the resources held by the counter.
+        This call is collective over the communicator
+        """
+        if self.__win is not None:
+            self.__win.Free()
+            self.__win = None
+
+
+def _get_nbytes(obj):
+    """
+    Returns the number of bytes held by arrays within the provided object
+
+    Parameters
+    ----------
+    obj : object
+        Array or (nested) list or tuple of arrays
+
+    Returns
+    -------
+    nbytes : uint
+        Number of bytes. Objects other than arrays are not counted
+    """
+    if isinstance(obj, (list, tuple)):
+        return sum([_get_nbytes(item) for item in obj])
+    return int(getattr(obj, 'nbytes', 0))
+
+
+def _get_peak_rss():
+    """
+    Returns the largest resident memory over the lifetime of this process.
+    Falls back to the current resident memory of this process where
+    getrusage is unavailable, as on Windows
+
+    Returns
+    -------
+    peak_rss : uint
+        Resident memory in bytes
+    """
+    try:
+        import resource
+    except ImportError:
+        return psutil.Process().memory_info().rss
+    # Kilobytes on Linux but bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return scale * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _get_tree_rss():
+    """
+    Returns the current resident memory of this process and all of its
+    descendants, such as workers started by joblib or a fork server
+
+    Returns
+    -------
+    rss : uint
+        Resident memory in bytes
+    """
+    proc = psutil.Process()
+    rss = proc.memory_info().rss
+    for child in proc.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            # Exited in the meantime
+            continue
+    return rss
+
+
+def _get_bytes_per_row(h5_dsets):
+    """
+    Returns the number of bytes in a row, i.e. a position, of the provided
+    datasets combined
+
+    Parameters
+    ----------
+    h5_dsets : list of :class:`h5py.Dataset`
+        Datasets with positions along the first axis
+
+    Returns
+    -------
+    nbytes : uint
+        Number of bytes per row
+    """
+    return int(sum([h5_dset.dtype.itemsize * np.prod(h5_dset.shape[1:]) for h5_dset in h5_dsets]))
+
+
+class ComputeProfile(object):
+    """
+    Timings, data volumes, and memory usage recorded for each batch of
+    positions computed by :meth:`~pyUSID.processing.process.Process.compute`
+    """
+
+    # Name, dtype of each column recorded per batch
+    fields = [('rank', np.uint32), ('batch', np.uint32),
+              ('start', np.uint64), ('num_positions', np.uint64),
+              ('read_time', np.float64), ('compute_time', np.float64),
+              ('write_time', np.float64), ('flush_time', np.float64),
+              ('status_time', np.float64), ('bytes_read', np.uint64),
+              ('bytes_written', np.uint64), ('rss', np.uint64)]
+
+    def __init__(self, rank=0):
+        """
+        Parameters
+        ----------
+        rank : uint, optional
+            MPI rank that is recording this profile
+        """
+        self.rank = rank
+        self.records = []
+        # Seconds spent by each rank within its compute loop
+        self.elapsed = {rank: 0.0}
+        # Peak resident memory in bytes of each rank along with its workers
+        self.peak_rss_per_rank = {rank: 0}
+        # Peak resident memory in bytes reported by each worker of this rank
+        self.worker_peak_rss = dict()
+
+    def add_batch(self, start, num_positions, read_time=0.0, bytes_read=0):
+        """
+        Starts the record for a new batch of positions
+
+        Parameters
+        ----------
+        start : uint
+            First position in the batch
+        num_positions : uint
+            Number of positions in the batch
+        read_time : float, optional
+            Time in seconds spent waiting for the batch to be read
+        bytes_read : uint, optional
+            Number of bytes read from the source dataset
+
+        Returns
+        -------
+        record : dict
+            Record of this batch. Remaining fields are filled in as the batch
+            is computed and written
+        """
+        record = dict([(name, 0) for name, _ in self.fields])
+        record.update({'rank': self.rank, 'batch': len(self.records),
+                       'start': start, 'num_positions': num_positions,
+                       'read_time': read_time, 'bytes_read': bytes_read})
+        self.records.append(record)
+        return record
+
+    def gather(self, comm):
+        """
+        Collects the records from all ranks into this profile.
+        This call is collective
+
+        Parameters
+        ----------
+        comm : :class:`mpi4py.MPI.Comm`
+            Communicator of the ranks that recorded profiles
+        """
+        all_records = comm.allgather(self.records)
+        all_elapsed = comm.allgather(self.elapsed)
+        all_peak_rss = comm.allgather(self.peak_rss_per_rank)
+        self.records = [record for records in all_records for record in records]
+        for elapsed, peak_rss in zip(all_elapsed, all_peak_rss):
+            self.elapsed.update(elapsed)
+            self.peak_rss_per_rank.update(peak_rss)
+
+    def add_worker_peak_rss(self, pid, peak_rss):
+        """
+        Records the peak resident memory reported by a pool worker
+
+        Parameters
+        ----------
+        pid : int
+            Process ID of the worker
+        peak_rss : uint
+            Peak resident memory of the worker in bytes
+        """
+        self.worker_peak_rss[pid] = max(peak_rss, self.worker_peak_rss.get(pid, 0))
+
+    def record_peak_rss(self):
+        """
+        Records the peak resident memory of this rank plus that of each of
+        its workers, since the workers run alongside each other
+        """
+        self.peak_rss_per_rank[self.rank] = _get_peak_rss() + sum(self.worker_peak_rss.values())
+
+    def to_array(self):
+        """
+        Returns the records as a structured array with one row per batch
+
+        Returns
+        -------
+        table : :class:`numpy.ndarray`
+            Structured array with the columns listed in `fields`
+        """
+        return np.array([tuple(record[name] for name, _ in self.fields)
+                         for record in self.records], dtype=self.fields)
+
+    @property
+    def positions_per_second(self):
+        """
+        Dictionary of the number of positions computed per second by each rank
+        """
+        rates = dict()
+        for rank, elapsed in self.elapsed.items():
+            num_pos = sum([record['num_positions'] for record in self.records
+                           if record['rank'] == rank])
+            rates[rank] = num_pos / elapsed if elapsed > 0 else 0.0
+        return rates
+
+    @property
+    def peak_rss(self):
+        """
+        Largest peak resident memory in bytes of any rank along with its
+        workers, or resident memory sampled after computing any batch if larger
+        """
+        return max(list(self.peak_rss_per_rank.values()) +
+                   [record['rss'] for record in self.records] + [0])
+
+    def summary(self):
+        """
+        Returns the total time spent in each phase along with data volumes
+
+        Returns
+        -------
+        summary : dict
+            Totals over all recorded batches
+        """
+        table = self.to_array()
+        summary = dict([(name, table[name].sum()) for name, _ in self.fields
+                        if name.endswith('_time') or name.startswith('bytes_')])
+        summary.update({'num_batches': len(table),
+                        'num_positions': int(table['num_positions'].sum()),
+                        'positions_per_second': self.positions_per_second,
+                        'peak_rss': self.peak_rss})
+        return summary
+
+    def write(self, h5_group, dset_name='compute_profile'):
+        """
+        Appends the records to a table dataset within the provided group.
+        This call is collective when the file is opened with the mpio driver.
+        All ranks must have gathered the same records beforehand
+
+        Parameters
+        ----------
+        h5_group : :class:`h5py.Group`
+            Group to write the table into
+        dset_name : str, optional
+            Name of the table dataset
+
+        Returns
+        -------
+        h5_profile : :class:`h5py.Dataset`
+            Dataset holding the records of this and previous calls to compute
+        """
+        table = self.to_array()
+        if dset_name in h5_group:
+            h5_profile = h5_group[dset_name]
+            offset = h5_profile.shape[0]
+            h5_profile.resize((offset + len(table),))
+        else:
+            offset = 0
+            h5_profile = h5_group.create_dataset(dset_name, shape=(len(table),),
+                                                 maxshape=(None,),
+                                                 dtype=self.fields,
+                                                 chunks=True)
+        if len(table) > 0:
+            h5_profile[offset:] = table
+        ranks = sorted(self.elapsed.keys())
+        h5_profile.attrs['positions_per_second'] = [self.positions_per_second[rank] for rank in ranks]
+        h5_profile.attrs['peak_rss'] = self.peak_rss
+        return h5_profile
+
+
 class Process(object):
     """
     An abstract class for formulating scientific problems as computational problems. This class handles the tedious,
@@ -37,9 +1252,19 @@ class Process(object):
     only need to specify application-relevant code for processing the data.
     """
 
+    # Supported ways of mapping _map_function over the positions in a batch
+    _backends = ('joblib', 'processes', 'dask', 'threads')
+    _rank_file_modes = ('virtual', 'copy')
+
     def __init__(self, h5_main, process_name, parms_dict=None, cores=None,
                  max_mem_mb=4*1024, mem_multiplier=1.0, lazy=False,
-                 h5_target_group=None, verbose=False):
+                 h5_target_group=None, prefetch=False, async_write=False,
+                 checkpoint_every_s=None, dynamic_scheduling=False,
+                 backend='joblib', shared_memory=False, dask_scheduler=None,
+                 save_profile=False, flush_every_n_batches=1,
+                 flush_every_s=None, spectral_tile_size=None, rank_files=None,
+                 collective_writes=False, isolate_failures=False,
+                 pin_cpus=False, verbose=False):
         """
         Parameters
         ----------
@@ -47,11 +1272,14 @@ class Process(object):
             The USID main HDF5 dataset over which the analysis will be performed.
         process_name : str
             Name of the process
-        cores : uint, optional
-            How many cores to use for the computation. Default: all available cores - 2 if operating outside MPI context
+        cores : uint or str, optional
+            How many cores to use for the computation. Default: all available cores - 2 if operating outside MPI context.
+            Set to 'auto' to time the computation on a sample of positions with different numbers of cores at the
+            start of compute() and use the fastest. The threads used by BLAS / OpenMP libraries within each worker are
+            limited such that the workers together do not use more threads than the physical cores
         max_mem_mb : uint, optional
             How much memory to use for the computation.  Default 1024 Mb
-        mem_multiplier : float, optional. Default = 1
+        mem_multiplier : float or str, optional. Default = 1
             mem_multiplier is the number that will be multiplied with the
             (byte) size of a single position in the source dataset in order to
             better estimate the number of positions that can be processed at
@@ -60,15 +1288,188 @@ class Process(object):
             for the source dataset. A value greater than 1 would account for
             the size of results datasets as well. For example, if the result
             dataset is the same size and precision as the source dataset,
-            the multiplier will be 2 (1 for source, 1 for result)
+            the multiplier will be 2 (1 for source, 1 for result).
+            Set to 'auto' to measure the memory allocated while computing a
+            few positions at the start of compute() and derive the multiplier
+            from this measurement
         lazy : bool, optional. Default = False
             If True, read_data_chunk and write_results_chunk will operate on
-            dask arrays. If False - everything will be in numpy.
+            dask arrays. If False - everything will be in numpy. Each batch is
+            a slice of a dask view of `h5_main` that is built once with blocks
+            aligned to the chunks of `h5_main`. If the child class implements
+            _dask_function, the default _unit_computation only builds the
+            dask graph for the results of the batch, which can be written
+            block by block via _store_results_chunk() without materializing
+            the batch
         h5_target_group : h5py.Group, optional. Default = None
             Location where to look for existing results and to place newly
             computed results. Use this kwarg if the results need to be written
             to a different HDF5 file. By default, this value is set to the
             parent group containing `h5_main`
+        prefetch : bool, optional. Default = False
+            If True, the next batch of positions will be read from `h5_main`
+            by a background thread while the current batch is being computed
+            upon. This hides the cost of reading (and decompressing) the
+            source dataset at the expense of holding two batches in memory.
+            The number of positions per batch is halved to stay within
+            `max_mem_mb`. Ignored when `lazy` is True
+        async_write : bool, optional. Default = False
+            If True, the results of each batch will be written to the file,
+            flushed, and marked as completed in the status dataset by a
+            background thread while the next batch is being computed upon.
+            Positions are only marked as completed after their results have
+            been flushed to the file. The writer is handed a snapshot of the
+            results, pixels and spectroscopic slice of the batch, which
+            `self._results`, _get_pixels_in_current_batch() and
+            _get_spectral_slice_in_current_batch() return within
+            :meth:`~pyUSID.processing.process.Process._write_results_chunk`.
+            Therefore,
+            :meth:`~pyUSID.processing.process.Process._unit_computation` must
+            assign new objects to `self._results` rather than modifying them
+            in place, and _write_results_chunk() must not rely on `self.data`.
+            Up to two batches of results are held in memory, so the number of
+            positions per batch is halved to stay within `max_mem_mb`
+        checkpoint_every_s : float, optional. Default = None
+            Desired time in seconds between consecutive checkpoints (writing
+            a batch of results to the file). If provided, the number of
+            positions in each batch will be adjusted based on the measured
+            time to compute and write each position such that each batch
+            takes roughly this long. The number of positions per batch will
+            never exceed the limit set by the available memory. By default,
+            every batch holds as many positions as memory allows
+        dynamic_scheduling : bool, optional. Default = False
+            If True, MPI ranks will claim batches of positions one at a time
+            from a shared counter as they become free, instead of being
+            assigned an equal share of the positions up front. Recommended
+            when the time to compute each position varies substantially.
+            The batches are sized once at the start of compute()
+        backend : str, optional. Default = 'joblib'
+            How the default
+            :meth:`~pyUSID.processing.process.Process._unit_computation`
+            maps `_map_function` over the positions in each batch:
+
+            * 'joblib' - via :func:`~sidpy.proc.comp_utils.parallel_compute`
+              which starts a new pool of workers for every batch
+            * 'processes' - via a pool of `cores` worker processes that is
+              started once and reused for all batches within compute().
+              `_map_function` and its arguments are sent to each worker once.
+              Workers are started from a fork server (or spawned where fork
+              servers are unavailable) rather than forked from a process that
+              may hold open HDF5 files, MPI state and threads. Therefore,
+              `_map_function` and its arguments must be picklable
+            * 'dask' - by splitting the batch into blocks of positions and
+              computing a dask graph over the blocks with `dask_scheduler`.
+              This also works with `lazy` = True without loading the batch
+              into memory up front
+            * 'threads' - via a pool of `cores` threads that operate on views
+              of the batch without copying or pickling it. Meant for
+              functions that release the GIL, such as most numpy / scipy
+              routines. The speedup from threads is measured on a sample of
+              positions at the start of compute(). The pool of worker
+              processes ('processes') is used instead if the function does
+              not benefit from threads
+        shared_memory : bool, optional. Default = False
+            If True, each batch is placed in a memory-mapped buffer shared
+            with the workers, and only the bounds of each block of positions
+            are sent to the workers, instead of pickling the data. If
+            :meth:`~pyUSID.processing.process.Process._get_results_buffer_spec`
+            is implemented, workers also write their results in place into a
+            shared buffer. Requires `backend` = 'processes'
+        dask_scheduler : str or :class:`distributed.Client`, optional
+            Scheduler used to compute each batch when `backend` = 'dask'.
+            For example - 'threads', 'processes', 'synchronous' or a client
+            connected to a :class:`distributed.LocalCluster`. By default, the
+            scheduler configured in dask (or the active client) is used
+        save_profile : bool, optional. Default = False
+            If True, the timings and data volumes recorded for each batch by
+            compute() are also appended to a 'compute_profile' table dataset
+            within the results group. The profile is always available as
+            `self.profile` after compute()
+        flush_every_n_batches : uint, optional. Default = 1
+            Number of batches to write to the file between consecutive
+            flushes of the file. Positions are only marked as completed in the
+            status dataset once their results have been flushed, so resuming
+            picks up from the last flush. Set to None to only flush based on
+            `flush_every_s`. When both are None, the file is flushed only at
+            the end of compute() or when compute() is interrupted
+        flush_every_s : float, optional. Default = None
+            Minimum time in seconds between consecutive flushes of the file.
+            If provided along with `flush_every_n_batches`, the file is
+            flushed when either condition is met
+        spectral_tile_size : uint, optional. Default = None
+            Number of spectroscopic steps to read per position in each batch.
+            Meant for datasets where even a single position does not fit in
+            memory, such as long time series. Each batch then covers a set of
+            positions within one tile of the spectroscopic axis, so the
+            mapped function is applied to each tile of each position
+            independently and is only suitable for computations that are
+            separable along the spectroscopic axis. _write_results_chunk()
+            should write to the tile given by
+            _get_spectral_slice_in_current_batch(). The status dataset tracks
+            each tile of each position. By default, all spectroscopic steps
+            of a position are read together
+        rank_files : str, optional. Default = None
+            By default, all ranks write results directly to the results
+            group. Set to 'virtual' or 'copy' to have each rank write the
+            results for the `Main` datasets in the results group to its own
+            compressed HDF5 file next to the file containing the results,
+            without contending with the other ranks. Attributes of this object
+            that point to these datasets, such as `self.h5_results`, point to
+            the datasets in this rank's file within compute(). Once all
+            positions are computed, these datasets are replaced by virtual
+            datasets that map to the files of all ranks ('virtual') or the
+            results in the files of all ranks are copied into these datasets
+            and the files are deleted ('copy'). In 'virtual' mode, empty `Main`
+            datasets created via write_main_dataset() or create_empty_dataset()
+            within _create_results_datasets() are placeholders without any
+            storage, so that the file containing the results only holds the
+            final virtual datasets. _create_results_datasets() must not write
+            to these placeholders. Interrupted computations are
+            resumed from the results in the files of all ranks.
+            Not supported along with `spectral_tile_size`
+        collective_writes : bool, optional. Default = False
+            If True and running via MPI, all ranks write the results of each
+            batch to the `Main` datasets in the results group together via
+            collective writes, which allows these datasets to be compressed.
+            Ranks without any more batches take part in the writes of the
+            other ranks without writing any data. _write_results_chunk() is
+            expected to write once to each of these datasets per batch.
+            Batches are aligned to the chunks of these datasets such that
+            ranks do not write to the same chunks. Not supported along with
+            `async_write` or `rank_files`. Ignored outside MPI. Datasets in
+            files opened with the "mpio" driver are only compressed if
+            _create_results_datasets() passes `self._parallel_compression` as
+            `parallel_compression` to
+            :func:`~pyUSID.io.hdf_utils.write_main_dataset` or
+            :func:`~pyUSID.io.hdf_utils.create_empty_dataset`
+        isolate_failures : bool, optional. Default = False
+            If True, errors raised by _map_function or _batch_function only
+            fail the positions they were raised for, rather than aborting the
+            computation. Errors raised while computing the lazy results of
+            _dask_function fail the block of positions they were raised for.
+            Such results are therefore computed before
+            _write_results_chunk() is called. Results of failed positions are
+            filled with NaNs, or zeros for integer results, or are not written
+            at all if all positions in the batch failed. These positions are
+            flagged in a `failed_positions` dataset next to the status dataset
+            and are not marked as completed, such that they are computed
+            again when the computation is resumed. If the child class
+            implements _retry_function, it is applied to the failed positions
+            once all positions are computed and positions that succeed are
+            marked as completed. Only applies to computations via the default
+            _unit_computation
+        pin_cpus : bool, optional. Default = False
+            If True, the CPUs on each node are split among the MPI ranks on
+            that node, grouped by NUMA node, and each rank is pinned to its
+            CPUs within compute() unless the MPI launcher already bound the
+            ranks. The original binding is restored once compute() returns.
+            Workers of the 'processes' and 'threads' backends are likewise
+            pinned to the CPUs of their rank such that they do not migrate
+            across sockets. Each batch, including the buffers shared with the
+            workers when `shared_memory` is True, is read by the rank itself
+            and therefore resides on the NUMA node(s) of the rank rather than
+            those of the individual workers. Workers of the other backends may
+            run on any CPU of their rank. Only supported on Linux
         verbose : bool, Optional, default = False
             Whether or not to print debugging statements
 
@@ -77,6 +1478,10 @@ class Process(object):
         self.h5_results_grp : :class:`h5py.Group`
             HDF5 group containing the HDF5 datasets that contain the results
             of the computation
+        self.profile : ComputeProfile
+            Per-batch timings, data volumes and memory usage from the last
+            call to compute(). Contains the batches from all ranks when
+            running with MPI. None before compute() is called
         self.verbose : bool
             Whether or not to print debugging statements
         self.parms_dict : dict
@@ -96,8 +1501,58 @@ class Process(object):
         self._cores : uint
             Number of CPU cores to use for parallel computations.
             Ignored in the MPI context. Each rank gets 1 CPU core
+        self.__auto_cores : bool
+            Whether or not the number of cores should be calibrated at the
+            start of compute()
+        self.__blas_threads : uint
+            Number of threads that BLAS / OpenMP libraries may use within each
+            worker such that all workers on a socket together do not exceed
+            the physical cores
         self._max_pos_per_read : uint
             Number of positions in the dataset to read per chunk
+        self.__checkpoint_every_s : float
+            Desired time in seconds between consecutive checkpoints
+        self.__pos_per_batch : uint
+            Number of positions to read in the next batch when adjusting the
+            batch size to meet self.__checkpoint_every_s. Capped by
+            self._max_pos_per_read. None when not adjusting batch sizes
+        self.__dynamic_scheduling : bool
+            Whether or not batches are claimed from a shared counter
+        self.__work_units : :class:`numpy.ndarray`
+            Bounds within self.__compute_jobs of the batches that ranks claim
+            when scheduling dynamically
+        self.__work_counter : _WorkCounter
+            Counter shared by all ranks with the index of the next unclaimed
+            batch in self.__work_units. None unless scheduling dynamically
+        self.__backend : str
+            How _map_function is mapped over the positions in each batch
+        self.__use_threads : bool
+            Whether or not threads are used to map over the positions. Set to
+            False when the function does not benefit from threads
+        self.__thread_pool : concurrent.futures.ThreadPoolExecutor
+            Pool of threads reused for all batches. None outside compute()
+        self.__worker_pool : concurrent.futures.ProcessPoolExecutor
+            Pool of workers reused for all batches. None outside compute()
+        self.__worker_pool_key : tuple
+            Function and arguments that the workers in the pool were given
+        self.__shared_memory : bool
+            Whether or not batches are shared with workers via shared memory
+        self.__dask_scheduler : str or :class:`distributed.Client`
+            Scheduler used to compute each batch when using dask
+        self.__lazy_main : :class:`dask.array.core.Array`
+            Dask view of `h5_main` that batches are sliced from when lazy.
+            None till the first batch is read
+        self.__shared_data : _SharedBuffer
+            Buffer shared with the workers that the current batch is copied
+            into if it was not read into one of self.__shared_inputs
+        self.__shared_inputs : list of _SharedBuffer
+            Buffers shared with the workers that batches are read into, in
+            turn, when using shared memory. One per batch held in memory
+        self.__num_shared_reads : uint
+            Number of batches read into self.__shared_inputs so far
+        self.__shared_results : _SharedBuffer
+            Buffer shared with the workers that holds the results of the
+            current batch
         self._status_dset_name : str
             Name of the HDF5 dataset that keeps track of the positions in the
             source dataset thave already been computed
@@ -112,6 +1567,16 @@ class Process(object):
             self._get_existing_datasets() function
         self.__bytes_per_pos : uint
             Number of bytes used by one position of the source dataset
+            multiplied by the memory multiplier
+        self.__man_mem_limit : uint
+            Memory in MB that the user allowed the computation to use
+        self.__auto_mem_multiplier : bool
+            Whether or not the memory multiplier should be measured at the
+            start of compute()
+        self.__mem_multiplier : float
+            Memory multiplier last used to set self._max_pos_per_read
+        self.__reserved_bytes : float
+            Memory per worker last set aside for intermediates
         self.mpi_comm : :class:`mpi4py.MPI.COMM_WORLD`
             MPI communicator. None if not running in an MPI context
         self.mpi_rank: uint
@@ -138,6 +1603,86 @@ class Process(object):
             positions.
         self.__pixels_in_batch : array-like
             The positions being computed on by the current compute worker
+        self.__completed : _CompletedRanges
+            Ranges of positions that have been computed. Also written as
+            attributes of the status dataset so that completeness can be
+            checked without reading the entire status dataset
+        self.__prefetch : bool
+            Whether or not the next batch should be read in the background
+        self.__prefetcher : concurrent.futures.ThreadPoolExecutor
+            Single background thread that reads the next batch of positions.
+            None when not prefetching or outside compute()
+        self.__prefetched : tuple
+            (start, end, future) for the batch being read in the background
+        self.__async_write : bool
+            Whether or not results should be written in the background
+        self.__writer : concurrent.futures.ThreadPoolExecutor
+            Single background thread that writes results. None when not
+            writing asynchronously or outside compute()
+        self.__pending_write : concurrent.futures.Future
+            Future for the batch currently being written in the background
+        self.__write_snapshot : dict
+            State of the batch being written in the background, as returned
+            by __snapshot_batch() along with the writer thread. None if no
+            batch is being written in the background
+        self.__results : list
+            Results of the current batch, accessed via `self._results`
+        self.__save_profile : bool
+            Whether or not the profile should be written to the results group
+        self.__batch_record : dict
+            Profile record of the batch that is being computed or written
+        self.__flush_every_n_batches : uint
+            Number of batches written between flushes. None if not flushing
+            based on the number of batches
+        self.__flush_every_s : float
+            Time in seconds between flushes. None if not flushing based on time
+        self.__unflushed : dict
+            Positions whose results were written, and those among them that
+            failed, but not yet flushed along with the number of such batches
+            and the time of the last flush.
+            Updated by the thread writing results in the background
+        self.__spectral_tile_size : uint
+            Number of spectroscopic steps per tile. None if not tiling
+        self.__num_tiles : uint
+            Number of tiles along the spectroscopic axis. Work is tracked in
+            units of one tile of one position, numbered tile after tile, such
+            that unit = tile * positions + position
+        self.__spectral_slice : slice
+            Spectroscopic steps covered by the current batch
+        self.__rank_files : str
+            How results written to per-rank files are merged into the results
+            group. None if writing to the results group directly
+        self.__rank_h5_file : :class:`h5py.File`
+            File this rank writes results to. None outside compute()
+        self.__rank_completed : _CompletedRanges
+            Positions whose results are in the file of this rank
+        self.__swapped_attrs : dict
+            Attributes of this object that pointed to the datasets in the
+            results group that are written to the file of this rank instead
+        self.__collective_writes : bool
+            Whether or not results are written collectively under MPI
+        self.__collective_dsets : list of :class:`h5py.Dataset`
+            Datasets written to collectively. None if not writing collectively
+        self._parallel_compression : bool
+            Whether or not results datasets may be compressed in files opened
+            with the "mpio" driver since they will only be written to
+            collectively
+        self.__pin_cpus : bool
+            Whether or not ranks and workers are pinned to CPUs
+        self.__launch_affinity : set of int
+            CPUs this rank could run on when this object was created, before
+            it was ever pinned. None if not pinning
+        self.__local_rank : uint
+            Index of this rank among the ranks on its socket
+        self.__isolate_failures : bool
+            Whether or not errors only fail the positions they were raised for
+        self.__failed_in_batch : :class:`numpy.ndarray`
+            Units of work in the current batch that failed
+        self._failed_dset_name : str
+            Name of the dataset flagging the positions that failed
+        self._h5_failed_dset : :class:`h5py.Dataset`
+            Dataset flagging the positions that failed. None unless isolating
+            failures
         """
         MPI = get_MPI()
 
@@ -231,11 +1776,105 @@ class Process(object):
         # Saving these as properties of the object:
         self.verbose = verbose
         self.__lazy = lazy
+        self.__lazy_main = None
+        self.__prefetch = bool(prefetch) and not lazy
+        self.__prefetcher = None
+        self.__prefetched = None
+        self.__async_write = bool(async_write)
+        self.__writer = None
+        self.__pending_write = None
+        self.__write_snapshot = None
+        if checkpoint_every_s is not None:
+            if not isinstance(checkpoint_every_s, Number) or isinstance(checkpoint_every_s, complex):
+                raise TypeError('checkpoint_every_s must be a real number')
+            if checkpoint_every_s <= 0:
+                raise ValueError('checkpoint_every_s must be a positive number')
+        self.__checkpoint_every_s = checkpoint_every_s
+        self.__pos_per_batch = None
+        self.__dynamic_scheduling = bool(dynamic_scheduling)
+        self.__work_units = None
+        self.__work_counter = None
+        backend = validate_single_string_arg(backend, 'backend')
+        if backend not in self._backends:
+            raise ValueError('backend must be one of: {}. Provided: {}'.format(self._backends, backend))
+        self.__backend = backend
+        self.__use_threads = backend == 'threads'
+        self.__thread_pool = None
+        self.__worker_pool = None
+        self.__worker_pool_key = None
+        if shared_memory and backend != 'processes':
+            raise ValueError("shared_memory requires backend='processes'")
+        self.__shared_memory = bool(shared_memory)
+        self.__shared_data = None
+        self.__shared_results = None
+        # Two batches are held at a time when prefetching
+        self.__shared_inputs = [None] * (2 if self.__prefetch else 1)
+        self.__num_shared_reads = 0
+        self.__dask_scheduler = dask_scheduler
+        self.__save_profile = bool(save_profile)
+        if flush_every_n_batches is not None:
+            if not isinstance(flush_every_n_batches, (int, np.integer)) or isinstance(flush_every_n_batches, bool):
+                raise TypeError('flush_every_n_batches must be an integer')
+            if flush_every_n_batches < 1:
+                raise ValueError('flush_every_n_batches must be a positive integer')
+        self.__flush_every_n_batches = flush_every_n_batches
+        if flush_every_s is not None:
+            if not isinstance(flush_every_s, Number) or isinstance(flush_every_s, complex):
+                raise TypeError('flush_every_s must be a real number')
+            if flush_every_s <= 0:
+                raise ValueError('flush_every_s must be a positive number')
+        self.__flush_every_s = flush_every_s
+        self.__unflushed = None
+        self.__batch_record = None
+        self.profile = None
+        if spectral_tile_size is not None:
+            if not isinstance(spectral_tile_size, (int, np.integer)) or isinstance(spectral_tile_size, bool):
+                raise TypeError('spectral_tile_size must be an integer')
+            if spectral_tile_size < 1:
+                raise ValueError('spectral_tile_size must be a positive integer')
+            spectral_tile_size = int(min(spectral_tile_size, h5_main.shape[1]))
+        self.__spectral_tile_size = spectral_tile_size
+        self.__num_tiles = self.__get_num_tiles(spectral_tile_size)
+        self.__spectral_slice = slice(None)
+        if rank_files is not None:
+            rank_files = validate_single_string_arg(rank_files, 'rank_files')
+            if rank_files not in self._rank_file_modes:
+                raise ValueError('rank_files must be one of: {}. Provided: {}'.format(self._rank_file_modes,
+                                                                                    rank_files))
+            if spectral_tile_size is not None:
+                raise ValueError('rank_files is not supported along with spectral_tile_size')
+            if rank_files == 'virtual' and not _supports_virtual_datasets():
+                raise ValueError("rank_files='virtual' requires h5py 2.9 or newer built against HDF5 1.10 "
+                                 "or newer. Use rank_files='copy' instead")
+        self.__rank_files = rank_files
+        if collective_writes and (async_write or rank_files is not None):
+            raise ValueError('collective_writes is not supported along with async_write or rank_files')
+        self.__collective_writes = bool(collective_writes)
+        self.__collective_dsets = None
+        self._parallel_compression = self.__collective_writes and self.mpi_comm is not None
+        self.__isolate_failures = bool(isolate_failures)
+        self.__failed_in_batch = np.zeros(0, dtype=np.int64)
+        self._h5_failed_dset = None
+        self.__rank_h5_file = None
+        self.__rank_completed = None
+        self.__swapped_attrs = {}
+        if pin_cpus and not hasattr(os, 'sched_setaffinity'):
+            warn('pin_cpus is only supported on Linux. CPUs will not be pinned')
+            pin_cpus = False
+        self.__pin_cpus = bool(pin_cpus)
+        self.__launch_affinity = os.sched_getaffinity(0) if self.__pin_cpus else None
+        self.__local_rank = 0
         self._cores = None
+        self.__auto_cores = False
+        self.__blas_threads = None
         self.__ranks_on_socket = 1
         self.__socket_master_rank = 0
         self._max_pos_per_read = None
         self.__bytes_per_pos = None
+        self.__man_mem_limit = None
+        self.__auto_mem_multiplier = False
+        self.__mem_multiplier = 1.0
+        self.__reserved_bytes = 0
 
         # Now have to be careful here since the below properties are a function of the MPI rank
         self.__start_pos = None
@@ -243,6 +1882,7 @@ class Process(object):
         self.__end_pos = None
         self.__pixels_in_batch = None
         self.__compute_jobs = None
+        self.__completed = None
 
         # Determining the max size of the data that can be put into memory
         # all ranks go through this and they need to have this value any
@@ -263,6 +1903,8 @@ class Process(object):
         variable before checking for duplicates
         """
         self._status_dset_name = 'completed_positions'
+        # Likewise for the positions that failed when isolating failures
+        self._failed_dset_name = 'failed_positions'
 
         self._results = None
         self.h5_results_grp = None
@@ -291,7 +1933,7 @@ class Process(object):
         Sets the start and end indices for each MPI rank
         """
         # First figure out what positions need to be computed
-        self.__compute_jobs = np.where(self._h5_status_dset[()] == 0)[0]
+        self.__compute_jobs = self.__completed.get_incomplete(self.__get_num_units())
         if self.verbose and self.mpi_rank == 0:
             if len(self.__compute_jobs) > 100:
                 print('Among the {} positions in this dataset, {} positions '
@@ -303,6 +1945,16 @@ class Process(object):
                       'positions need to be computed: {}'
                       '.'.format(self.h5_main.shape[0], self.__compute_jobs))
 
+        if self.__dynamic_scheduling:
+            # Ranks will claim batches from anywhere in the list as they become free
+            self.__start_pos = 0
+            self.__rank_end_pos = self.__compute_jobs.size
+            self.__end_pos = self.__get_batch_end(self.__start_pos)
+            if self.verbose and self.mpi_rank == 0:
+                print('Ranks will claim batches of the {} (remaining) positions in this dataset as they become free'
+                      '.'.format(self.__compute_jobs.size))
+            return
+
         # integer division
         pos_per_rank = self.__compute_jobs.size // self.mpi_size
         if self.verbose and self.mpi_rank == 0:
@@ -310,16 +1962,259 @@ class Process(object):
                   '.'.format(pos_per_rank, self.__compute_jobs.size))
 
         # The start and end indices now correspond to the indices in the incomplete jobs rather than the h5 dataset
-        self.__start_pos = self.mpi_rank * pos_per_rank
-        self.__rank_end_pos = (self.mpi_rank + 1) * pos_per_rank
-        self.__end_pos = int(min(self.__rank_end_pos, self.__start_pos + self._max_pos_per_read))
+        # Ranks are split at HDF5 chunk boundaries so that no two ranks decompress the same chunk
+        self.__start_pos = 0
+        if self.mpi_rank > 0:
+            self.__start_pos = self.__align_to_chunk(self.mpi_rank * pos_per_rank)
+        self.__rank_end_pos = self.__align_to_chunk((self.mpi_rank + 1) * pos_per_rank)
         if self.mpi_rank == self.mpi_size - 1:
             # Force the last rank to go to the end of the dataset
             self.__rank_end_pos = self.__compute_jobs.size
+        self.__end_pos = self.__get_batch_end(self.__start_pos)
+
+        if self.verbose:
+            print('Rank {} will read positions {} to {} of {}'.format(self.mpi_rank, self.__start_pos,
+                                                                      self.__rank_end_pos, self.h5_main.shape[0]))
+
+    def __get_num_tiles(self, spectral_tile_size):
+        """
+        Returns the number of tiles along the spectroscopic axis
+
+        Parameters
+        ----------
+        spectral_tile_size : uint
+            Number of spectroscopic steps per tile. None if not tiling
+
+        Returns
+        -------
+        num_tiles : uint
+            Number of tiles along the spectroscopic axis
+        """
+        if not spectral_tile_size:
+            return 1
+        return int(np.ceil(self.h5_main.shape[1] / spectral_tile_size))
+
+    def __get_num_units(self):
+        """
+        Returns the number of units of work, and therefore the length of the
+        status dataset
+
+        Returns
+        -------
+        num_units : uint
+            Number of positions times the number of spectroscopic tiles
+        """
+        return self.h5_main.shape[0] * self.__num_tiles
+
+    def __get_tile_slice(self, tile=0):
+        """
+        Returns the spectroscopic steps covered by the provided tile
+
+        Parameters
+        ----------
+        tile : uint, optional. Default = 0
+            Index of the tile along the spectroscopic axis
+
+        Returns
+        -------
+        spectral_slice : slice
+            Spectroscopic steps in this tile. All steps if not tiling
+        """
+        if self.__spectral_tile_size is None:
+            return slice(None)
+        start = tile * self.__spectral_tile_size
+        return slice(start, min(start + self.__spectral_tile_size, self.h5_main.shape[1]))
+
+    def __split_units(self, units):
+        """
+        Splits units of work from a single batch into the tile and positions
+
+        Parameters
+        ----------
+        units : :class:`numpy.ndarray`
+            1D array of sorted units of work within a single tile
+
+        Returns
+        -------
+        spectral_slice : slice
+            Spectroscopic steps of the tile containing these units
+        positions : :class:`numpy.ndarray`
+            Positions corresponding to these units
+        """
+        num_pos = self.h5_main.shape[0]
+        tile = int(units[0] // num_pos) if len(units) > 0 else 0
+        return self.__get_tile_slice(tile), units - tile * num_pos
+
+    def __get_chunk_rows(self):
+        """
+        Returns the number of positions in each HDF5 chunk of the source dataset
+
+        Returns
+        -------
+        chunk_rows : uint
+            Number of positions per chunk. 1 if the dataset is not chunked
+        """
+        chunk_rows = 1 if self.h5_main.chunks is None else self.h5_main.chunks[0]
+        if self.__collective_dsets:
+            # Ranks should not write to the same chunks of the results
+            # Least common multiple without np.lcm, which needs numpy 1.15
+            for h5_dset in self.__collective_dsets:
+                if h5_dset.chunks is not None:
+                    chunk_rows = chunk_rows * h5_dset.chunks[0] // gcd(chunk_rows, h5_dset.chunks[0])
+        return chunk_rows
+
+    def __align_to_chunk(self, index):
+        """
+        Moves the provided index within self.__compute_jobs back to the first
+        position that falls within the same HDF5 chunk of the source dataset.
+
+        Parameters
+        ----------
+        index : uint
+            Index within self.__compute_jobs
+
+        Returns
+        -------
+        index : uint
+            Index within self.__compute_jobs of the first incomplete position
+            in the HDF5 chunk that contains the position at the provided index
+        """
+        chunk_rows = self.__get_chunk_rows()
+        if chunk_rows == 1 or index >= self.__compute_jobs.size:
+            return int(min(index, self.__compute_jobs.size))
+        unit = self.__compute_jobs[index]
+        # Units of each tile follow the positions
+        chunk_start = unit - (unit % self.h5_main.shape[0]) % chunk_rows
+        return int(np.searchsorted(self.__compute_jobs, chunk_start))
+
+    def __get_batch_end(self, start):
+        """
+        Returns the index within self.__compute_jobs that the batch beginning
+        at the provided index should end at. Batches end at HDF5 chunk
+        boundaries of the source dataset wherever possible.
+
+        Parameters
+        ----------
+        start : uint
+            Index within self.__compute_jobs of the first position in the batch
+
+        Returns
+        -------
+        end : uint
+            Index within self.__compute_jobs of the position after the batch
+        """
+        pos_per_batch = self._max_pos_per_read
+        if self.__pos_per_batch is not None:
+            pos_per_batch = min(pos_per_batch, self.__pos_per_batch)
+        end = int(min(self.__rank_end_pos, start + pos_per_batch))
+        if self.__num_tiles > 1 and start < self.__compute_jobs.size:
+            # A batch covers a single tile
+            num_pos = self.h5_main.shape[0]
+            tile_end = (self.__compute_jobs[start] // num_pos + 1) * num_pos
+            end = min(end, int(np.searchsorted(self.__compute_jobs, tile_end)))
+        if end < self.__rank_end_pos:
+            aligned_end = self.__align_to_chunk(end)
+            if aligned_end > start:
+                end = aligned_end
+        return end
+
+    def __create_work_units(self):
+        """
+        Splits the positions that need to be computed into batches that ranks
+        will claim one at a time via a counter shared by all ranks
+        """
+        pos_per_unit = self._max_pos_per_read
+        if self.__pos_per_batch is not None:
+            pos_per_unit = min(pos_per_unit, self.__pos_per_batch)
+        if self.mpi_comm is not None:
+            # Memory may differ across nodes. All ranks need the same batches
+            pos_per_unit = self.mpi_comm.allreduce(pos_per_unit, op=get_MPI().MIN)
+        self.__pos_per_batch = pos_per_unit
+
+        bounds = [0]
+        while bounds[-1] < self.__compute_jobs.size:
+            bounds.append(self.__get_batch_end(bounds[-1]))
+        self.__work_units = np.array(bounds)
+
+        if self.verbose and self.mpi_rank == 0:
+            print('Split the {} positions into {} batches of up to {} positions'
+                  '.'.format(self.__compute_jobs.size, self.__work_units.size - 1, pos_per_unit))
+
+        self.__work_counter = _WorkCounter(self.mpi_comm)
+
+    def __claim_next_batch(self, start):
+        """
+        Returns the bounds of the next batch of positions that this rank
+        should compute
+
+        Parameters
+        ----------
+        start : uint
+            Index within self.__compute_jobs that the next batch would begin
+            at when positions are statically assigned to ranks
+
+        Returns
+        -------
+        bounds : tuple or None
+            (start, end) indices within self.__compute_jobs of the next batch.
+            None if there are no more positions for this rank to compute
+        """
+        if self.__work_counter is not None:
+            unit = self.__work_counter.fetch_and_add(1)
+            if unit >= self.__work_units.size - 1:
+                return None
+            return int(self.__work_units[unit]), int(self.__work_units[unit + 1])
+        if start >= self.__rank_end_pos:
+            return None
+        return start, self.__get_batch_end(start)
+
+    def __set_pos_per_batch(self, time_per_pos):
+        """
+        Sets the number of positions per batch such that each batch is
+        computed and written in roughly self.__checkpoint_every_s seconds
+
+        Parameters
+        ----------
+        time_per_pos : float
+            Time in seconds to compute and write a single position
+        """
+        if self.__checkpoint_every_s is None or time_per_pos <= 0:
+            return
+        pos_per_batch = int(min(self._max_pos_per_read,
+                                max(1, self.__checkpoint_every_s // time_per_pos)))
+        chunk_rows = self.__get_chunk_rows()
+        if pos_per_batch >= chunk_rows:
+            pos_per_batch -= pos_per_batch % chunk_rows
+        if self.verbose and pos_per_batch != self.__pos_per_batch:
+            print('Rank {} will compute {} positions per batch to write results every ~{}'
+                  '.'.format(self.mpi_rank, pos_per_batch, format_time(self.__checkpoint_every_s)))
+        self.__pos_per_batch = pos_per_batch
+
+    def __set_initial_pos_per_batch(self, *args, **kwargs):
+        """
+        Sets the number of positions for the first batch using an estimate of
+        the time taken to compute a single position
 
-        if self.verbose:
-            print('Rank {} will read positions {} to {} of {}'.format(self.mpi_rank, self.__start_pos,
-                                                                      self.__rank_end_pos, self.h5_main.shape[0]))
+        Parameters
+        ----------
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        if self.__checkpoint_every_s is None:
+            return
+        try:
+            time_per_pos = self._estimate_compute_time_per_pixel(*args, **kwargs) / self._cores
+        except Exception as exc:
+            # _map_function may not be implemented or usable outside _unit_computation
+            if self.verbose:
+                print('Rank {} could not estimate the compute time per position: {}. Starting with a small batch'
+                      '.'.format(self.mpi_rank, exc))
+            self.__pos_per_batch = int(min(self._max_pos_per_read,
+                                           max(self._cores, self.__get_chunk_rows())))
+            return
+        self.__set_pos_per_batch(time_per_pos)
 
     def _estimate_compute_time_per_pixel(self, *args, **kwargs):
         """
@@ -331,12 +2226,162 @@ class Process(object):
         -------
 
         """
-        chosen_pos = np.random.randint(0, high=self.h5_main.shape[0]-1, size=5)
+        # h5py requires the positions to be sorted and unique
+        chosen_pos = np.unique(np.random.randint(0, high=self.h5_main.shape[0]-1, size=5))
+        data = self.h5_main[chosen_pos, self.__get_tile_slice()]
         t0 = tm.time()
-        _ = parallel_compute(self.h5_main[chosen_pos, :], self._map_function, cores=1,
-                             lengthy_computation=False, func_args=args, func_kwargs=kwargs, verbose=False)
+        if self._has_batch_function():
+            _ = self._batch_function(data, *args, **kwargs)
+        else:
+            _ = parallel_compute(data, self._map_function, cores=1,
+                                 lengthy_computation=False, func_args=args, func_kwargs=kwargs, verbose=False)
         return (tm.time() - t0) / len(chosen_pos)
 
+    def _estimate_memory_per_pixel(self, *args, **kwargs):
+        """
+        Estimates the memory allocated while computing an average pixel's
+        worth of data, excluding the source data, by measuring the memory
+        allocated via :mod:`tracemalloc` while computing a few positions.
+        This function is exposed to the developer of the child classes. An
+        approximate can be derived if it is simpler
+
+        Parameters
+        ----------
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        bytes_per_pos : float
+            Bytes per position retained by the results
+        transient_bytes : float
+            Bytes of intermediates each worker allocates and releases while
+            computing a single position, independent of the batch size
+        """
+        # h5py requires the positions to be sorted and unique
+        chosen_pos = np.unique(np.random.randint(0, high=self.h5_main.shape[0]-1, size=5))
+        data = self.h5_main[chosen_pos, self.__get_tile_slice()]
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        try:
+            if was_tracing and hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            base_mem = tracemalloc.get_traced_memory()[0]
+            if self._has_batch_function():
+                results = self._batch_function(data, *args, **kwargs)
+            else:
+                results = [self._map_function(spectrum, *args, **kwargs) for spectrum in data]
+            curr_mem, peak_mem = tracemalloc.get_traced_memory()
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+        del results
+        if self._has_batch_function():
+            # Intermediates of a batch kernel likely scale with the batch
+            return (peak_mem - base_mem) / len(chosen_pos), 0.0
+        return (curr_mem - base_mem) / len(chosen_pos), float(peak_mem - curr_mem)
+
+    def __calibrate_cores(self, *args, **kwargs):
+        """
+        Times the computation on a sample of positions with a few different
+        numbers of cores and uses the fastest when cores was set to 'auto'
+
+        Parameters
+        ----------
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        max_cores = self._cores
+        candidates = sorted(set([2 ** power for power in range(int(np.log2(max_cores)) + 1)] + [max_cores]))
+        num_pos = int(min(self.h5_main.shape[0], self._max_pos_per_read, max(16, 8 * max_cores)))
+        start = np.random.randint(0, self.h5_main.shape[0] - num_pos + 1)
+        data = self.h5_main[start: start + num_pos, self.__get_tile_slice()]
+
+        times = []
+        try:
+            for cores in candidates:
+                self._cores = cores
+                self.__set_blas_threads()
+                with _limit_blas_threads(self.__blas_threads):
+                    if self.__backend in ['processes', 'threads']:
+                        # The pool is started once and reused for all batches
+                        _ = self.__apply_to_data(data, *args, **kwargs)
+                    t_start = tm.time()
+                    _ = self.__apply_to_data(data, *args, **kwargs)
+                    times.append(tm.time() - t_start)
+                self.__shutdown_worker_pool()
+        except Exception as exc:
+            # _map_function may not be implemented or usable outside _unit_computation
+            warn('Could not time the computation with different numbers of cores: {}. Using {} cores'
+                 '.'.format(exc, max_cores))
+            self.__shutdown_worker_pool()
+            self._cores = max_cores
+            self.__set_blas_threads()
+            return
+
+        # Prefer fewer cores unless more cores are appreciably faster
+        best_time = min(times)
+        self._cores = [cores for cores, duration in zip(candidates, times) if duration <= 1.05 * best_time][0]
+        if self.verbose:
+            print('Rank {} - seconds to compute {} positions with {} cores: {}. Using {} cores'
+                  '.'.format(self.mpi_rank, num_pos, candidates, np.round(times, 3), self._cores))
+        self.__set_blas_threads()
+        # The memory available to each worker depends on the number of workers
+        self.__set_memory(man_mem_limit=self.__man_mem_limit,
+                          mem_multiplier=self.__mem_multiplier,
+                          reserved_bytes=self.__reserved_bytes)
+
+    def __calibrate_memory(self, *args, **kwargs):
+        """
+        Sets the number of positions per batch based on the memory measured
+        while computing a few positions when mem_multiplier was set to 'auto'
+
+        Parameters
+        ----------
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        bytes_per_src_pos = self.h5_main.dtype.itemsize * self.__get_tile_width()
+        try:
+            bytes_per_pos, transient_bytes = self._estimate_memory_per_pixel(*args, **kwargs)
+        except Exception as exc:
+            # _map_function may not be implemented or usable outside _unit_computation
+            warn('Could not measure the memory required per position: {}. Only accounting for the source dataset'
+                 '.'.format(exc))
+            bytes_per_pos, transient_bytes = 0.0, 0.0
+        mem_multiplier = 1 + max(0.0, bytes_per_pos) / bytes_per_src_pos
+        transient_bytes = max(0.0, transient_bytes)
+        if self.mpi_comm is not None:
+            # Conservatively size batches on all ranks alike
+            mem_multiplier = self.mpi_comm.allreduce(mem_multiplier, op=get_MPI().MAX)
+            transient_bytes = self.mpi_comm.allreduce(transient_bytes, op=get_MPI().MAX)
+        if self.verbose and self.mpi_rank == 0:
+            print('Measured a memory multiplier of {} and {} of intermediates per worker'
+                  '.'.format(np.round(mem_multiplier, 2), format_size(transient_bytes)))
+        self.__set_memory(man_mem_limit=self.__man_mem_limit,
+                          mem_multiplier=float(mem_multiplier),
+                          reserved_bytes=transient_bytes)
+
+    def __get_tile_width(self):
+        """
+        Returns the number of spectroscopic steps read per position
+
+        Returns
+        -------
+        num_steps : uint
+            Spectroscopic steps per tile or per position if not tiling
+        """
+        if self.__spectral_tile_size is None:
+            return self.h5_main.shape[1]
+        return self.__spectral_tile_size
+
     def _get_pixels_in_current_batch(self):
         """
         Returns the indices of the pixels that will be processed in this batch.
@@ -346,7 +2391,53 @@ class Process(object):
         pixels_in_batch : :class:`numpy.ndarray`
             1D array of unsigned integers denoting the pixels that will be read, processed, and written back to
         """
-        return self.__pixels_in_batch
+        return self.__write_state('pixels', self.__pixels_in_batch)
+
+    def _get_spectral_slice_in_current_batch(self):
+        """
+        Returns the spectroscopic steps of the positions that will be processed in this batch. This is only a part of
+        the spectroscopic axis when spectral_tile_size was provided
+
+        Returns
+        -------
+        spectral_slice : slice
+            Spectroscopic steps that will be read, processed, and written back to for each position in this batch
+        """
+        return self.__write_state('spectral_slice', self.__spectral_slice)
+
+    @property
+    def _results(self):
+        return self.__write_state('results', self.__results)
+
+    @_results.setter
+    def _results(self, results):
+        snapshot = self.__write_snapshot
+        if snapshot is not None and snapshot['thread'] == threading.get_ident():
+            snapshot['results'] = results
+        else:
+            self.__results = results
+
+    def __write_state(self, key, current):
+        """
+        Returns the state of the batch being written when called from the
+        thread writing results in the background, else the current state
+
+        Parameters
+        ----------
+        key : str
+            Entry in the snapshot of the batch being written
+        current : object
+            State of the current batch
+
+        Returns
+        -------
+        state : object
+            State of the batch that the calling thread works on
+        """
+        snapshot = self.__write_snapshot
+        if snapshot is not None and snapshot['thread'] == threading.get_ident():
+            return snapshot[key]
+        return current
 
     def test(self, **kwargs):
         """
@@ -368,6 +2459,206 @@ class Process(object):
         # All children classes should call super() OR ensure that they only work for self.mpi_rank == 0
         raise NotImplementedError('test_on_subset has not yet been implemented')
 
+    def plan(self, override=False, *args, **kwargs):
+        """
+        Reports what :meth:`~pyUSID.processing.process.Process.compute` would
+        do with the current settings without creating or modifying any
+        results. This call is collective
+
+        Parameters
+        ----------
+        override : bool, optional. default = False
+            Plan a fresh computation instead of returning duplicate results
+            or resuming partial results as compute() would
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        plan : dict
+            Contains:
+
+            * num_positions - positions (times spectroscopic tiles) to compute
+            * batches - per rank, array with the first position, number of
+              positions and spectroscopic tile of each batch. When
+              scheduling dynamically, every rank may claim any of the batches
+            * num_batches - total number of batches across ranks
+            * bytes_read - bytes of the source dataset read by all ranks
+            * bytes_written - bytes of results written by all ranks, per the
+              dtype and shape of the `Main` datasets in the results group
+            * chunks_decompressed - HDF5 chunks of the source dataset
+              decompressed by all batches. None if not chunked
+            * chunks_decompressed_again - chunks decompressed by more than
+              one batch. None if not chunked
+            * decompression_amplification - ratio of bytes in the chunks
+              decompressed to bytes read
+            * memory_per_worker - estimated bytes held by each worker
+            * time_per_position - estimated seconds to compute a position
+              with all cores on a rank
+            * compute_time - projected seconds spent computing by the
+              slowest rank, excluding reading and writing
+        """
+        completed = _CompletedRanges()
+        if not override and len(self.duplicate_h5_groups) > 0:
+            completed.add([[0, self.__get_num_units()]])
+        elif not override and len(self.partial_h5_groups) > 0:
+            h5_grp = self.h5_results_grp
+            if h5_grp is None:
+                h5_grp = self.partial_h5_groups[-1]
+            completed = _CompletedRanges.from_status_dataset(h5_grp[self._status_dset_name])
+
+        # Same schedule as compute(). Restored afterwards
+        orig_state = (self.__completed, self.__pos_per_batch, self.__compute_jobs,
+                      self.__start_pos, self.__end_pos, self.__rank_end_pos)
+        self.__completed = completed
+        try:
+            verbose, self.verbose = self.verbose, False
+            try:
+                self.__assign_job_indices()
+            finally:
+                self.verbose = verbose
+            try:
+                time_per_pos = self._estimate_compute_time_per_pixel(*args, **kwargs) / self._cores
+            except Exception as exc:
+                # _map_function may not be implemented or usable outside _unit_computation
+                warn('Could not estimate the compute time per position: {}'.format(exc))
+                time_per_pos = None
+            if time_per_pos is not None:
+                self.__set_pos_per_batch(time_per_pos)
+            if self.__dynamic_scheduling:
+                pos_per_unit = self._max_pos_per_read
+                if self.__pos_per_batch is not None:
+                    pos_per_unit = min(pos_per_unit, self.__pos_per_batch)
+                if self.mpi_comm is not None:
+                    pos_per_unit = self.mpi_comm.allreduce(pos_per_unit, op=get_MPI().MIN)
+                self.__pos_per_batch = pos_per_unit
+            bounds = []
+            start = self.__start_pos
+            while start < self.__rank_end_pos:
+                end = self.__get_batch_end(start)
+                bounds.append((start, end))
+                start = end
+            compute_jobs = self.__compute_jobs
+        finally:
+            self.__completed, self.__pos_per_batch, self.__compute_jobs, \
+                self.__start_pos, self.__end_pos, self.__rank_end_pos = orig_state
+
+        try:
+            results_bytes_per_unit = self.__get_results_bytes_per_unit()
+        except Exception as exc:
+            warn('Could not determine the bytes of results per position: {}'.format(exc))
+            results_bytes_per_unit = None
+
+        rank_time = None
+        if time_per_pos is not None:
+            rank_time = time_per_pos * sum([end - start for start, end in bounds])
+        all_bounds = [bounds]
+        rank_times = [rank_time]
+        if self.__dynamic_scheduling:
+            # Any rank may claim any of the batches
+            all_bounds = [bounds] * self.mpi_size
+            rank_times = [None if rank_time is None else rank_time / self.mpi_size]
+        elif self.mpi_comm is not None:
+            all_bounds = self.mpi_comm.allgather(bounds)
+            rank_times = self.mpi_comm.allgather(rank_time)
+
+        itemsize = self.h5_main.dtype.itemsize
+        num_steps = self.h5_main.shape[1]
+        bytes_read = 0
+        chunk_ids = []
+        all_batches = []
+        for rank_bounds in all_bounds[:1] if self.__dynamic_scheduling else all_bounds:
+            batches = []
+            for start, end in rank_bounds:
+                spectral_slice, pixels = self.__split_units(compute_jobs[start: end])
+                step_start, step_end = spectral_slice.indices(num_steps)[:2]
+                tile = step_start // self.__spectral_tile_size if self.__num_tiles > 1 else 0
+                batches.append([pixels[0], len(pixels), tile])
+                bytes_read += len(pixels) * (step_end - step_start) * itemsize
+                if self.h5_main.chunks is not None:
+                    chunk_rows, chunk_cols = self.h5_main.chunks
+                    row_ids = np.unique(pixels // chunk_rows)
+                    col_ids = np.arange(step_start // chunk_cols, (step_end - 1) // chunk_cols + 1)
+                    num_col_chunks = int(np.ceil(num_steps / chunk_cols))
+                    chunk_ids.append((row_ids[:, None] * num_col_chunks + col_ids[None, :]).ravel())
+            all_batches.append(np.array(batches, dtype=np.int64).reshape(-1, 3))
+        unique_batches = np.vstack(all_batches)
+        if self.__dynamic_scheduling:
+            all_batches = all_batches * self.mpi_size
+
+        chunks_decompressed = None
+        chunks_decompressed_again = None
+        amplification = 1.0
+        if self.h5_main.chunks is not None:
+            chunk_ids = np.hstack(chunk_ids) if len(chunk_ids) > 0 else np.zeros(0, dtype=np.int64)
+            chunks_decompressed = int(chunk_ids.size)
+            _, counts = np.unique(chunk_ids, return_counts=True)
+            chunks_decompressed_again = int(np.sum(counts > 1))
+            if bytes_read > 0:
+                amplification = chunks_decompressed * int(np.prod(self.h5_main.chunks)) * itemsize / bytes_read
+
+        max_batch = int(unique_batches[:, 1].max()) if len(unique_batches) > 0 else 0
+        plan = {'num_positions': int(compute_jobs.size),
+                'batches': all_batches,
+                'num_batches': int(len(unique_batches)),
+                'bytes_read': int(bytes_read),
+                'bytes_written': None if results_bytes_per_unit is None else
+                int(results_bytes_per_unit * compute_jobs.size),
+                'chunks_decompressed': chunks_decompressed,
+                'chunks_decompressed_again': chunks_decompressed_again,
+                'decompression_amplification': amplification,
+                'memory_per_worker': self.__bytes_per_pos * max_batch + self.__reserved_bytes,
+                'time_per_position': time_per_pos,
+                'compute_time': None if None in rank_times else max(rank_times)}
+
+        if self.mpi_rank == 0:
+            print('Plan: {} positions in {} batches on {} ranks with {} cores each. {} to read ({}x decompressed), '
+                  '~{} of memory per worker, ~{} of computation'
+                  '.'.format(plan['num_positions'], plan['num_batches'], self.mpi_size, self._cores,
+                             format_size(plan['bytes_read']), np.round(amplification, 2),
+                             format_size(plan['memory_per_worker']),
+                             'unknown time' if plan['compute_time'] is None else format_time(plan['compute_time'])))
+        return plan
+
+    def __get_results_bytes_per_unit(self):
+        """
+        Returns the bytes of results written per unit of work based on the
+        dtype and shape of the `Main` datasets in the results group. Unless
+        results already exist, the results datasets are created as
+        placeholders in a temporary in-memory file to find their dtype and
+        shape, after which the attributes of this object are restored
+
+        Returns
+        -------
+        bytes_per_unit : float
+            Bytes written to all `Main` datasets per unit of work
+        """
+        h5_groups = [self.h5_results_grp] + self.partial_h5_groups + self.duplicate_h5_groups
+        h5_groups = [h5_grp for h5_grp in h5_groups if h5_grp is not None]
+        if len(h5_groups) > 0:
+            return _get_bytes_per_row(get_all_main(h5_groups[-1])) / self.__num_tiles
+
+        state = dict(vars(self))
+        try:
+            # Ancillary datasets copied into the scratch file are written
+            # through its file name, so keep that name inside a temporary folder
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                with h5py.File(os.path.join(tmp_dir, 'plan.h5'), mode='w', driver='core',
+                               backing_store=False) as h5_scratch:
+                    self._h5_target_group = h5_scratch
+                    self.h5_results_grp = None
+                    with _placeholder_datasets():
+                        self._create_results_datasets()
+                    return _get_bytes_per_row(get_all_main(h5_scratch)) / self.__num_tiles
+        finally:
+            # Attributes may point to the temporary results
+            for key in list(vars(self).keys()):
+                if key not in state:
+                    delattr(self, key)
+            vars(self).update(state)
+
     def _check_for_duplicates(self):
         """
         Checks for instances where the process was applied to the same dataset with the same parameters
@@ -414,7 +2705,10 @@ class Process(object):
                               '.'.format(curr_group, self._status_dset_name))
                     continue
 
-                if self.h5_main.shape[0] != status_dset.shape[0] or len(status_dset.shape) > 1 or \
+                # Results may have been computed with or without tiling the spectroscopic axis
+                status_tile_size = int(status_dset.attrs.get('spectral_tile_size', 0))
+                num_units = self.h5_main.shape[0] * self.__get_num_tiles(status_tile_size)
+                if num_units != status_dset.shape[0] or len(status_dset.shape) > 1 or \
                         status_dset.dtype != np.uint8:
                     if self.mpi_rank == 0:
                         print('Status dataset: {} was not of the expected shape or datatype'.format(status_dset))
@@ -422,15 +2716,20 @@ class Process(object):
 
                 # ##### ACTUAL COMPLETENESS TEST HERE #########
 
-                completed_positions = np.sum(status_dset[()])
+                completed_positions = _CompletedRanges.get_num_completed(status_dset)
 
                 if self.verbose and self.mpi_rank == 0:
                     print('{} has results that are {} % complete'
                           '.'.format(status_dset.name,
-                                     int(100 * completed_positions / self.h5_main.shape[0])))
+                                     int(100 * completed_positions / num_units)))
 
                 # Case 1.A: Incomplete computation?
-                if completed_positions < self.h5_main.shape[0]:
+                if completed_positions < num_units:
+                    if status_tile_size != (self.__spectral_tile_size or 0):
+                        if self.mpi_rank == 0:
+                            print('Partial results in {} were computed with a different spectral_tile_size'
+                                  '.'.format(curr_group.name))
+                        continue
                     # If there are pixels uncompleted
                     # remove from duplicates and move to partial
                     if self.verbose and self.mpi_rank == 0:
@@ -469,6 +2768,11 @@ class Process(object):
 
                 # Case 3.A: Partial
                 if last_pixel < self.h5_main.shape[0]:
+                    if self.__num_tiles > 1:
+                        if self.mpi_rank == 0:
+                            print('Partial results in {} were computed without tiling the spectroscopic axis'
+                                  '.'.format(curr_group.name))
+                        continue
                     # move to partial
                     if self.verbose and self.mpi_rank == 0:
                         print('moving {} to partial since computation was {} % complete'
@@ -533,12 +2837,19 @@ class Process(object):
 
         Parameters
         ----------
-        cores : uint, optional, Default = None (all or nearly all available)
-            How many CPU cores to use for the computation.
+        cores : uint or str, optional, Default = None (all or nearly all available)
+            How many CPU cores to use for the computation. If 'auto', all or
+            nearly all available cores will be used till calibrated in compute()
         """
         if self.mpi_comm is None:
             min_free_cores = 1 + int(psutil.cpu_count() > 4)
 
+            if isinstance(cores, str):
+                if cores != 'auto':
+                    raise ValueError("cores should be an integer or 'auto' but got: {}".format(cores))
+                self.__auto_cores = True
+                cores = None
+
             if cores is None:
                 self._cores = max(1, psutil.cpu_count() - min_free_cores)
             else:
@@ -557,12 +2868,67 @@ class Process(object):
             ranks_on_this_socket = np.where(ranks_by_socket == self.__socket_master_rank)[0]
             # how many in this socket?
             self.__ranks_on_socket = ranks_on_this_socket.size
+            self.__local_rank = int(np.where(ranks_on_this_socket == self.mpi_rank)[0][0])
             # Force usage of all available memory
             man_mem_limit = None
             self._cores = 1
             # Disabling the following line since mpi4py and joblib didn't play well for Bayesian Inference
             # self._cores = self.__cores_per_rank = psutil.cpu_count() // self.__ranks_on_socket
 
+        self.__set_blas_threads()
+
+    def __pin_rank(self):
+        """
+        Pins this rank to its share of the CPUs on this node such that ranks
+        span as few NUMA nodes as possible
+
+        Returns
+        -------
+        orig_affinity : set of int
+            CPUs this rank could run on before it was pinned, to be restored
+            at the end of compute(). None if this rank was not pinned
+        """
+        if not self.__pin_cpus or self.mpi_comm is None:
+            return None
+        if len(self.__launch_affinity) < psutil.cpu_count():
+            # Respect the binding of the MPI launcher
+            if self.verbose:
+                print('Rank {} already bound to CPUs: {}'.format(self.mpi_rank, sorted(self.__launch_affinity)))
+            return None
+        orig_affinity = os.sched_getaffinity(0)
+        cpus = _split_cpus(_get_numa_cpus(), self.__ranks_on_socket)[self.__local_rank]
+        os.sched_setaffinity(0, cpus)
+        if self.verbose:
+            print('Rank {} pinned to CPUs: {}'.format(self.mpi_rank, cpus))
+        return orig_affinity
+
+    def __get_worker_pinning(self):
+        """
+        Returns the arguments that pin the workers of a pool to CPUs
+
+        Returns
+        -------
+        cpu_sets : list of list of int
+            CPUs of this rank for each worker. None if not pinning
+        counter : :class:`multiprocessing.Value`
+            Number of workers pinned so far. None if not pinning
+        """
+        if not self.__pin_cpus:
+            return None, None
+        return _split_cpus(_get_numa_cpus(), self._cores), _get_pool_context().Value('i', 0)
+
+    def __set_blas_threads(self):
+        """
+        Limits the threads used by BLAS / OpenMP libraries within each worker
+        such that the workers on this socket do not oversubscribe the physical
+        cores
+        """
+        physical_cores = psutil.cpu_count(logical=False) or psutil.cpu_count()
+        self.__blas_threads = max(1, physical_cores // (self._cores * self.__ranks_on_socket))
+        if self.verbose and self.mpi_rank == self.__socket_master_rank:
+            print('Rank {}: Each of the {} workers on this socket may use {} BLAS / OpenMP threads'
+                  '.'.format(self.mpi_rank, self._cores * self.__ranks_on_socket, self.__blas_threads))
+
     def _set_memory_and_cores(self, cores=None, man_mem_limit=None,
                               mem_multiplier=1.0):
         """
@@ -576,7 +2942,7 @@ class Process(object):
             How many cores to use for the computation.
         man_mem_limit : uint, optional, Default = None (all available memory)
             The amount a memory in Mb to use in the computation
-        mem_multiplier : float, optional. Default = 1
+        mem_multiplier : float or str, optional. Default = 1
             mem_multiplier is the number that will be multiplied with the
             (byte) size of a single position in the source dataset in order to
             better estimate the number of positions that can be processed at
@@ -585,19 +2951,34 @@ class Process(object):
             for the source dataset. A value greater than 1 would account for
             the size of results datasets as well. For example, if the result
             dataset is the same size and precision as the source dataset,
-            the multiplier will be 2 (1 for source, 1 for result)
+            the multiplier will be 2 (1 for source, 1 for result).
+            Set to 'auto' to derive the multiplier from the memory measured
+            while computing a few positions at the start of compute()
         """
         self.__set_cores(cores=cores)
 
+        self.__man_mem_limit = man_mem_limit
+        self.__auto_mem_multiplier = isinstance(mem_multiplier, str)
+        if self.__auto_mem_multiplier:
+            if mem_multiplier != 'auto':
+                raise ValueError("mem_multiplier must be a number or 'auto'")
+            # Only accounting for the source dataset till calibrated in compute()
+            mem_multiplier = 1.0
+
         self.__set_memory(man_mem_limit=man_mem_limit,
                           mem_multiplier=mem_multiplier)
 
-    def __set_memory(self, man_mem_limit=None, mem_multiplier=1.0):
+    def __set_memory(self, man_mem_limit=None, mem_multiplier=1.0,
+                     reserved_bytes=0):
         """
         Checks memory capabilities of each node and sets the recommended data
         chunk sizes to be used by analysis methods.
         This function can work with clusters with heterogeneous memory sizes
-        (e.g. CADES SHPC Condo).
+        (e.g. CADES SHPC Condo). The chunk size is halved when prefetching or
+        writing asynchronously since two batches are held in memory then.
+        Results copied out of the buffer shared with the workers are
+        accounted for as well. Batches themselves are read straight into the
+        shared buffers.
 
         Parameters
         ----------
@@ -613,12 +2994,17 @@ class Process(object):
             the size of results datasets as well. For example, if the result
             dataset is the same size and precision as the source dataset,
             the multiplier will be 2 (1 for source, 1 for result)
+        reserved_bytes : float, optional. Default = 0
+            Memory set aside per worker for intermediates that do not scale
+            with the number of positions in a batch
         """
         if not isinstance(mem_multiplier, float):
             raise TypeError('mem_multiplier must be a floating point number')
         mem_multiplier = abs(mem_multiplier)
         if mem_multiplier < 1:
             raise ValueError('mem_multiplier must be at least 1')
+        self.__mem_multiplier = mem_multiplier
+        self.__reserved_bytes = reserved_bytes
 
         avail_mem_bytes = get_available_memory()  # in bytes
         if self.verbose and self.mpi_rank == self.__socket_master_rank:
@@ -655,18 +3041,45 @@ class Process(object):
 
         # Now calculate the number of positions OF RAW DATA ONLY that can be
         # stored in memory in one go PER worker
-        self.__bytes_per_pos = self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+        self.__bytes_per_pos = self.h5_main.dtype.itemsize * self.__get_tile_width()
         if self.verbose and self.mpi_rank == 0:
-            print('Each position in the SOURCE dataset is {} large'
-                  '.'.format(format_size(self.__bytes_per_pos)))
+            print('Each position{} in the SOURCE dataset is {} large'
+                  '.'.format(' (tile)' if self.__num_tiles > 1 else '',
+                             format_size(self.__bytes_per_pos)))
         # Now multiply this with a factor that takes into account the expected
         # sizes of the results (Final and intermediate) datasets.
         self.__bytes_per_pos *= mem_multiplier
         if self.verbose and self.mpi_rank == 0 and mem_multiplier > 1:
             print('Each position of the source and results dataset(s) is {} '
                   'large.'.format(format_size(self.__bytes_per_pos)))
+        if self.__shared_memory:
+            spec = self._get_results_buffer_spec()
+            if spec is not None:
+                # Results are copied out of the shared buffer for each batch
+                self.__bytes_per_pos += np.dtype(spec[1]).itemsize * int(np.prod(spec[0]))
+
+        if reserved_bytes > 0:
+            # Leave room for at least one position
+            max_mem_per_worker = max(max_mem_per_worker - reserved_bytes,
+                                     self.__bytes_per_pos)
 
         self._max_pos_per_read = int(np.floor(max_mem_per_worker / self.__bytes_per_pos))
+        if self.__prefetch or self.__async_write:
+            # Two batches are held in memory at a time
+            self._max_pos_per_read //= 2
+        if self._max_pos_per_read < 1:
+            raise MemoryError('A single position of the source dataset ({}) does not fit in the {} of memory '
+                              'available to each worker. Consider providing a smaller spectral_tile_size'
+                              '.'.format(format_size(self.__bytes_per_pos), format_size(max_mem_per_worker)))
+
+        # Reading whole HDF5 chunks per batch avoids decompressing a chunk twice
+        chunk_rows = self.__get_chunk_rows()
+        if chunk_rows > 1 and self._max_pos_per_read >= chunk_rows:
+            self._max_pos_per_read -= self._max_pos_per_read % chunk_rows
+            if self.verbose and self.mpi_rank == 0:
+                print('Positions per chunk rounded down to {} to match the '
+                      'HDF5 chunks of {} positions in the source dataset'
+                      '.'.format(self._max_pos_per_read, chunk_rows))
 
         if self.verbose and self.mpi_rank == self.__socket_master_rank:
             title = 'SOURCE dataset only'
@@ -685,54 +3098,334 @@ class Process(object):
 
         Parameters
         ----------
-        args : list
-            arguments to the function in the correct order
-        kwargs : dict
-            keyword arguments to the function
+        args : list
+            arguments to the function in the correct order
+        kwargs : dict
+            keyword arguments to the function
+        Returns
+        -------
+        object
+        """
+        raise NotImplementedError('Please override the _unit_function specific to your process')
+
+    @staticmethod
+    def _batch_function(data, *args, **kwargs):
+        """
+        Optional, vectorized alternative to
+        :meth:`~pyUSID.processing.process.Process._map_function` that
+        manipulates the data for several positions at once. If implemented,
+        the default :meth:`~pyUSID.processing.process.Process._unit_computation`
+        will split each batch into one block per core and call this function
+        on each block instead of calling `_map_function` per position.
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            2D array of shape (positions, spectral steps)
+        args : list
+            arguments to the function in the correct order
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        results : :class:`numpy.ndarray` or list
+            Results for each position in `data` stacked along the first axis
+        """
+        raise NotImplementedError('Please override the _batch_function specific to your process')
+
+    def _has_batch_function(self):
+        """
+        Checks whether this (child) class implements
+        :meth:`~pyUSID.processing.process.Process._batch_function`
+
+        Returns
+        -------
+        has_batch_function : bool
+            Whether or not _batch_function has been implemented
+        """
+        return type(self)._batch_function is not Process._batch_function
+
+    @staticmethod
+    def _retry_function(*args, **kwargs):
+        """
+        Optional alternative to
+        :meth:`~pyUSID.processing.process.Process._map_function` applied to
+        each position that failed once all positions have been computed, when
+        isolating failures. This could, for example, use a slower but more
+        robust method or different starting conditions
+
+        Parameters
+        ----------
+        args : list
+            arguments to the function in the correct order
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        object
+        """
+        raise NotImplementedError('Please override the _retry_function specific to your process')
+
+    def _has_retry_function(self):
+        """
+        Checks whether this (child) class implements
+        :meth:`~pyUSID.processing.process.Process._retry_function`
+
+        Returns
+        -------
+        has_retry_function : bool
+            Whether or not _retry_function has been implemented
+        """
+        return type(self)._retry_function is not Process._retry_function
+
+    @staticmethod
+    def _dask_function(data, *args, **kwargs):
+        """
+        Optional, lazy alternative to
+        :meth:`~pyUSID.processing.process.Process._map_function` used by the
+        default :meth:`~pyUSID.processing.process.Process._unit_computation`
+        when `lazy` is True. It should express the computation for all
+        positions in the batch as block-wise dask operations, such as
+        :func:`dask.array.map_blocks`, and return the results without
+        computing them. The results can then be computed and written block by
+        block via :meth:`~pyUSID.processing.process.Process._store_results_chunk`
+
+        Parameters
+        ----------
+        data : :class:`dask.array.core.Array`
+            2D array of shape (positions, spectral steps)
+        args : list
+            arguments to the function in the correct order
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        results : :class:`dask.array.core.Array` or list
+            Lazy results with positions along the first axis, or a list of
+            such arrays
+        """
+        raise NotImplementedError('Please override the _dask_function specific to your process')
+
+    def _has_dask_function(self):
+        """
+        Checks whether this (child) class implements
+        :meth:`~pyUSID.processing.process.Process._dask_function`
+
+        Returns
+        -------
+        has_dask_function : bool
+            Whether or not _dask_function has been implemented
+        """
+        return type(self)._dask_function is not Process._dask_function
+
+    def _read_data_chunk(self):
+        """
+        Reads a chunk of data for the intended computation into memory
+        """
+        if self.__prefetched is not None:
+            # The batch being read in the background was already claimed by this rank
+            bounds = self.__prefetched[:2]
+        else:
+            bounds = self.__claim_next_batch(self.__start_pos)
+
+        if bounds is not None:
+            self.__start_pos, self.__end_pos = bounds
+
+            # DON'T DIRECTLY apply the start and end indices anymore to the h5 dataset. Find out what it means first
+            self.__spectral_slice, self.__pixels_in_batch = \
+                self.__split_units(self.__compute_jobs[self.__start_pos: self.__end_pos])
+
+            if self.verbose:
+                print('Rank {} will read positions: {}'.format(self.mpi_rank, self.__pixels_in_batch))
+                if self.__num_tiles > 1:
+                    print('Rank {} will read spectroscopic steps {} to {}'
+                          '.'.format(self.mpi_rank, *self.__spectral_slice.indices(self.h5_main.shape[1])[:2]))
+                bytes_this_read = self.__bytes_per_pos * len(self.__pixels_in_batch)
+                print('Rank {} will read {} of the SOURCE dataset'
+                      '.'.format(self.mpi_rank, format_size(bytes_this_read)))
+                if self.mpi_rank == self.__socket_master_rank:
+                    tot_workers = self.__ranks_on_socket * self._cores
+                    print('Rank: {} available memory: {}. '
+                          '{} workers on this socket will in total read ~ {}'
+                          '.'.format(self.mpi_rank,
+                                     format_size(get_available_memory()),
+                                     tot_workers,
+                                     format_size(bytes_this_read * tot_workers)
+                                     ))
+
+            self.data = self.__get_batch_data(self.__start_pos, self.__end_pos)
+            # DON'T update the start position
+
+            self.__prefetch_next_batch()
+
+        else:
+            if self.verbose:
+                print('Rank {} - Finished reading all data!'.format(self.mpi_rank))
+            self.data = None
+
+    def __read_units(self, units, shared=False):
+        """
+        Reads the requested units of work from the source dataset
+
+        Parameters
+        ----------
+        units : :class:`numpy.ndarray`
+            1D array of unsigned integers denoting the units to read. These
+            are the positions to read unless tiling the spectroscopic axis
+        shared : bool, optional. Default = False
+            If True and batches are shared with the workers via shared
+            memory, the data is read straight into the next shared buffer
+
+        Returns
+        -------
+        data : :class:`numpy.ndarray` or :class:`dask.array.core.Array`
+            2D array of shape (positions, spectral steps)
+        """
+        spectral_slice, pixels = self.__split_units(units)
+        # Reading as Dask array to minimize memory copies when restructuring in child classes
+        if self.__lazy:
+            if pixels[-1] - pixels[0] + 1 == len(pixels):
+                # Slicing keeps the blocks of the view intact
+                pixels = slice(int(pixels[0]), int(pixels[-1]) + 1)
+            return self.__get_lazy_main()[pixels, spectral_slice]
+
+        if shared and self.__shared_memory:
+            return self.__read_into_shared_buffer(pixels, spectral_slice)
+        return _read_positions(self.h5_main, pixels, spectral_slice)
+
+    def __read_into_shared_buffer(self, pixels, spectral_slice):
+        """
+        Reads the requested positions straight into a buffer shared with the
+        workers so that the batch is not copied into the buffer later. Buffers
+        are used in turn so that a batch read in the background does not
+        overwrite the batch being computed on
+
+        Parameters
+        ----------
+        pixels : :class:`numpy.ndarray`
+            1D array of sorted, unique positions to read
+        spectral_slice : slice
+            Contiguous range of spectral steps to read for each position
+
+        Returns
+        -------
+        data : :class:`numpy.ndarray`
+            2D view of the leading rows of the shared buffer
+        """
+        num_steps = len(range(*spectral_slice.indices(self.h5_main.shape[1])))
+        shape = (max(len(pixels), self._max_pos_per_read), num_steps)
+        ind = self.__num_shared_reads % len(self.__shared_inputs)
+        self.__num_shared_reads += 1
+        self.__shared_inputs[ind] = _SharedBuffer.reuse_or_create(self.__shared_inputs[ind], shape,
+                                                                  self.h5_main.dtype)
+        data = _read_positions(self.h5_main, pixels, spectral_slice, out=self.__shared_inputs[ind].array)
+        # Plain array rather than a memmap for the computation
+        return np.asarray(data)
+
+    def __get_shared_input(self, data):
+        """
+        Returns the shared buffer whose leading rows hold the provided data
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            2D array of shape (positions, spectral steps)
+
         Returns
         -------
-        object
+        buffer : _SharedBuffer or None
+            Buffer that `data` was read into. None if `data` is not in a
+            shared buffer, e.g. - if it was modified after being read
         """
-        raise NotImplementedError('Please override the _unit_function specific to your process')
+        for buffer in self.__shared_inputs:
+            if buffer is None or buffer.array is None or not data.flags['C_CONTIGUOUS']:
+                continue
+            if data.__array_interface__['data'][0] == buffer.array.__array_interface__['data'][0] and \
+                    data.dtype == buffer.array.dtype and data.shape[1:] == buffer.array.shape[1:]:
+                return buffer
+        return None
 
-    def _read_data_chunk(self):
+    def __release_shared_inputs(self):
         """
-        Reads a chunk of data for the intended computation into memory
+        Releases the shared buffers that batches are read into
         """
-        if self.__start_pos < self.__rank_end_pos:
-            self.__end_pos = int(min(self.__rank_end_pos, self.__start_pos + self._max_pos_per_read))
+        for buffer in self.__shared_inputs:
+            if buffer is not None:
+                buffer.close()
+        self.__shared_inputs = [None] * len(self.__shared_inputs)
 
-            # DON'T DIRECTLY apply the start and end indices anymore to the h5 dataset. Find out what it means first
-            self.__pixels_in_batch = self.__compute_jobs[self.__start_pos: self.__end_pos]
+    def __get_lazy_main(self):
+        """
+        Returns the dask view of the source dataset, built on first use, whose
+        blocks span whole chunks of the source dataset and about as many
+        positions as each worker computes on per batch
 
-            if self.verbose:
-                print('Rank {} will read positions: {}'.format(self.mpi_rank, self.__pixels_in_batch))
-                bytes_this_read = self.__bytes_per_pos * len(self.__pixels_in_batch)
-                print('Rank {} will read {} of the SOURCE dataset'
-                      '.'.format(self.mpi_rank, format_size(bytes_this_read)))
-                if self.mpi_rank == self.__socket_master_rank:
-                    tot_workers = self.__ranks_on_socket * self._cores
-                    print('Rank: {} available memory: {}. '
-                          '{} workers on this socket will in total read ~ {}'
-                          '.'.format(self.mpi_rank,
-                                     format_size(get_available_memory()),
-                                     tot_workers,
-                                     format_size(bytes_this_read * tot_workers)
-                                     ))
+        Returns
+        -------
+        lazy_main : :class:`dask.array.core.Array`
+            2D array of shape (positions, spectral steps)
+        """
+        if self.__lazy_main is None:
+            chunk_rows = self.__get_chunk_rows()
+            block_rows = max(1, self._max_pos_per_read // self._cores)
+            block_rows = chunk_rows * int(np.ceil(block_rows / chunk_rows))
+            # h5py datasets should not be read by several threads at once
+            self.__lazy_main = da.from_array(self.h5_main, chunks=(block_rows, -1), lock=True)
+            if self.verbose and self.mpi_rank == 0:
+                print('Reading the source dataset lazily in blocks of {} positions'.format(block_rows))
+        return self.__lazy_main
 
-            # Reading as Dask array to minimize memory copies when restructuring in child classes
-            if self.__lazy:
-                main_dset = lazy_load_array(self.h5_main)
-            else:
-                main_dset = self.h5_main
+    def __get_batch_data(self, start, end):
+        """
+        Returns the data for the batch spanning the provided indices within
+        self.__compute_jobs, using the data read in the background if available
 
-            self.data = main_dset[self.__pixels_in_batch, :]
-            # DON'T update the start position
+        Parameters
+        ----------
+        start : uint
+            Index within self.__compute_jobs of the first position in the batch
+        end : uint
+            Index within self.__compute_jobs of the position after the batch
 
-        else:
+        Returns
+        -------
+        data : :class:`numpy.ndarray` or :class:`dask.array.core.Array`
+            2D array of shape (positions, spectral steps)
+        """
+        if self.__prefetched is not None:
+            pref_start, pref_end, future = self.__prefetched
+            self.__prefetched = None
+            # Always wait so that an errant read does not overlap with the next
+            data = future.result()
+            if (pref_start, pref_end) == (start, end):
+                if self.verbose:
+                    print('Rank {} using data for positions {} to {} read in '
+                          'the background'.format(self.mpi_rank, start, end))
+                return data
             if self.verbose:
-                print('Rank {} - Finished reading all data!'.format(self.mpi_rank))
-            self.data = None
+                print('Rank {} discarding data read in the background for '
+                      'positions {} to {} since positions {} to {} were '
+                      'requested'.format(self.mpi_rank, pref_start, pref_end,
+                                         start, end))
+        return self.__read_units(self.__compute_jobs[start: end], shared=True)
+
+    def __prefetch_next_batch(self):
+        """
+        Starts reading the batch of positions that follows the current batch
+        in the background, if prefetching is enabled
+        """
+        if self.__prefetcher is None:
+            return
+        bounds = self.__claim_next_batch(self.__end_pos)
+        if bounds is None:
+            return
+        next_start, next_end = bounds
+        future = self.__prefetcher.submit(self.__read_units,
+                                          self.__compute_jobs[next_start: next_end], shared=True)
+        self.__prefetched = (next_start, next_end, future)
 
     def _write_results_chunk(self):
         """
@@ -744,6 +3437,48 @@ class Process(object):
         # This line can remain as is
         raise NotImplementedError('Please override the _set_results specific to your process')
 
+    def _store_results_chunk(self, h5_dsets, results=None):
+        """
+        Writes the results of the current batch, such as the lazy results from
+        :meth:`~pyUSID.processing.process.Process._dask_function`, to the rows
+        of the positions in the provided datasets via
+        :func:`dask.array.store` such that results are computed and written
+        one block at a time. Meant to be called from
+        :meth:`~pyUSID.processing.process.Process._write_results_chunk`
+
+        Parameters
+        ----------
+        h5_dsets : :class:`h5py.Dataset` or list of :class:`h5py.Dataset`
+            Datasets to write the results to
+        results : array-like or list, optional
+            Results for each dataset with positions along the first axis and
+            the remaining axes shaped like those of the dataset. Default =
+            self._results
+        """
+        if results is None:
+            results = self._results
+        if isinstance(h5_dsets, h5py.Dataset):
+            h5_dsets, results = [h5_dsets], [results]
+        if len(h5_dsets) != len(results):
+            raise ValueError('Provided {} datasets but {} results'.format(len(h5_dsets), len(results)))
+        pixels = self._get_pixels_in_current_batch()
+
+        if self.__collective_dsets is not None:
+            # Each dataset is written to once per batch when writing collectively
+            for h5_dset, result in zip(h5_dsets, results):
+                h5_dset[pixels] = np.asarray(result)
+            return
+
+        sources, targets, regions = [], [], []
+        offset = 0
+        for run_start, run_end in _get_consecutive_runs(pixels):
+            for h5_dset, result in zip(h5_dsets, results):
+                sources.append(da.asarray(result)[offset: offset + run_end - run_start])
+                targets.append(h5_dset)
+                regions.append((slice(run_start, run_end),) + (slice(None),) * (h5_dset.ndim - 1))
+            offset += run_end - run_start
+        da.store(sources, targets, regions=regions, lock=True, **self.__get_dask_compute_kwargs())
+
     def _create_results_datasets(self):
         """
         Process specific call that will write the h5 group, guess dataset, corresponding spectroscopic datasets and also
@@ -763,20 +3498,37 @@ class Process(object):
             if not isinstance(self._h5_status_dset, h5py.Dataset):
                 raise ValueError('Provided results group: {} contains an expected object ({}) that is not a dataset'
                                  '.'.format(self.h5_results_grp, self._h5_status_dset))
-            if self.h5_main.shape[0] != self._h5_status_dset.shape[0] or len(self._h5_status_dset.shape) > 1 or \
-                    self._h5_status_dset.dtype != np.uint8:
+            if self.__get_num_units() != self._h5_status_dset.shape[0] or len(self._h5_status_dset.shape) > 1 or \
+                    self._h5_status_dset.dtype != np.uint8 or \
+                    self._h5_status_dset.attrs.get('spectral_tile_size', 0) != (self.__spectral_tile_size or 0):
                 if self.mpi_rank == 0:
-                    raise ValueError('Status dataset: {} was not of the expected shape or datatype'
-                                     '.'.format(self._h5_status_dset))
+                    raise ValueError('Status dataset: {} was not of the expected shape or datatype or was written '
+                                     'with a different spectral_tile_size'.format(self._h5_status_dset))
         else:
             self._h5_status_dset = self.h5_results_grp.create_dataset(self._status_dset_name, dtype=np.uint8,
-                                                                      shape=(self.h5_main.shape[0],))
+                                                                      shape=(self.__get_num_units(),))
+            if self.__spectral_tile_size is not None:
+                self._h5_status_dset.attrs['spectral_tile_size'] = self.__spectral_tile_size
             #  Could be fresh computation or resuming from a legacy computation
             if 'last_pixel' in self.h5_results_grp.attrs.keys():
                 completed_pixels = self.h5_results_grp.attrs['last_pixel']
                 if completed_pixels > 0:
                     self._h5_status_dset[:completed_pixels] = 1
 
+        self.__completed = _CompletedRanges.from_status_dataset(self._h5_status_dset)
+
+        if not self.__isolate_failures:
+            return
+        if self._failed_dset_name in self.h5_results_grp.keys():
+            self._h5_failed_dset = self.h5_results_grp[self._failed_dset_name]
+            if not isinstance(self._h5_failed_dset, h5py.Dataset) or \
+                    self._h5_failed_dset.shape != self._h5_status_dset.shape:
+                raise ValueError('Failed positions dataset: {} was not of the expected shape'
+                                 '.'.format(self._h5_failed_dset))
+        else:
+            self._h5_failed_dset = self.h5_results_grp.create_dataset(self._failed_dset_name, dtype=np.uint8,
+                                                                      shape=self._h5_status_dset.shape)
+
     def _write_source_dset_provenance(self):
         """
         Writes path of HDF5 file and path of h5_main to the results group
@@ -805,10 +3557,400 @@ class Process(object):
         if self.verbose and self.mpi_rank == 0:
             print("Rank {} at Process class' default _unit_computation() that "
                   "will call parallel_compute()".format(self.mpi_rank))
-        self._results = parallel_compute(self.data, self._map_function, cores=self._cores,
-                                         lengthy_computation=False,
-                                         func_args=args, func_kwargs=kwargs,
-                                         verbose=self.verbose)
+        self._results = self.__apply_to_data(self.data, *args, **kwargs)
+
+    def __apply_to_data(self, data, *args, **kwargs):
+        """
+        Applies _batch_function or _map_function to the provided data with
+        self._cores workers using the configured backend
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray` or :class:`dask.array.core.Array`
+            2D array of shape (positions, spectral steps)
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        results : list or :class:`numpy.ndarray`
+            Results for each position in `data`
+        """
+        if self.__lazy and self._has_dask_function():
+            # Only builds the graph. Computed when written
+            return self._dask_function(lazy_load_array(data), *args, **kwargs)
+        map_func = self._map_function
+        if self.__isolate_failures:
+            map_func = _IsolatedFunction(map_func)
+        if self.__backend == 'dask':
+            if self._has_batch_function():
+                return self.__compute_with_dask(data, self.__get_batch_function(), *args,
+                                                per_position=False, **kwargs)
+            return self.__compute_with_dask(data, map_func, *args, **kwargs)
+        if self._has_batch_function():
+            return self.__compute_batch_function(data, *args, **kwargs)
+        if self.__use_threads and self._cores > 1:
+            return self.__map_in_threads(data, map_func, *args, **kwargs)
+        if self.__backend in ['processes', 'threads'] and self._cores > 1:
+            return self.__map_in_worker_pool(data, map_func, *args, **kwargs)
+        return parallel_compute(data, map_func, cores=self._cores,
+                                lengthy_computation=False,
+                                func_args=args, func_kwargs=kwargs,
+                                verbose=self.verbose)
+
+    def __compute_batch_function(self, data, *args, **kwargs):
+        """
+        Applies _batch_function to one block of positions per core
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            2D array of shape (positions, spectral steps)
+        args : list
+            arguments to the function in the correct order
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        results : :class:`numpy.ndarray` or list
+            Results for each position in `data` stacked along the first axis
+        """
+        batch_func = self.__get_batch_function()
+        num_blocks = min(len(data), self._cores)
+        if num_blocks < 2:
+            return batch_func(data, *args, **kwargs)
+
+        if self.__use_threads:
+            return self.__map_in_threads(data, batch_func, *args,
+                                         per_position=False, **kwargs)
+
+        if self.__backend in ['processes', 'threads']:
+            return self.__map_in_worker_pool(data, batch_func, *args,
+                                            per_position=False, **kwargs)
+
+        blocks = np.array_split(np.asarray(data), num_blocks)
+        block_results = joblib.Parallel(n_jobs=num_blocks)(
+            joblib.delayed(batch_func)(block, *args, **kwargs) for block in blocks)
+        return _stack_block_results(block_results)
+
+    def __get_batch_function(self):
+        """
+        Returns _batch_function, made to return a failure per position in the
+        block rather than raise errors when isolating failures
+
+        Returns
+        -------
+        batch_func : callable
+            Function to apply to each block of positions
+        """
+        if self.__isolate_failures:
+            return _IsolatedFunction(self._batch_function, per_position=False)
+        return self._batch_function
+
+    def __compute_with_dask(self, data, func, *args, **kwargs):
+        """
+        Splits the data into blocks of positions and applies the function to
+        each block via a dask graph computed with self.__dask_scheduler
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray` or :class:`dask.array.core.Array`
+            2D array of shape (positions, spectral steps)
+        func : callable
+            Function to apply to each position or block of positions
+        args : list
+            arguments to the function in the correct order
+        per_position : bool, optional. Default = True
+            If True, `func` is called per position. Else, on each block
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        results : :class:`numpy.ndarray` or list
+            Results for each position in `data` stacked along the first axis
+        """
+        per_position = kwargs.pop('per_position', True)
+        num_blocks = min(len(data), 4 * self._cores if per_position else self._cores)
+        rows_per_block = int(np.ceil(len(data) / num_blocks))
+
+        if isinstance(data, da.core.Array):
+            blocks = data.rechunk((rows_per_block, -1)).to_delayed().ravel()
+        else:
+            blocks = [data[start: start + rows_per_block] for start in range(0, len(data), rows_per_block)]
+        tasks = [dask.delayed(_apply_to_block)(func, block, per_position, args, kwargs) for block in blocks]
+
+        block_results = dask.compute(*tasks, **self.__get_dask_compute_kwargs())
+        return _stack_block_results(list(block_results))
+
+    def __get_dask_compute_kwargs(self):
+        """
+        Returns the keyword arguments for computing dask graphs with
+        self.__dask_scheduler and self._cores workers
+
+        Returns
+        -------
+        compute_kwargs : dict
+            Keyword arguments to :func:`dask.compute`
+        """
+        compute_kwargs = {'scheduler': self.__dask_scheduler}
+        if self.__dask_scheduler in ['threads', 'threading', 'processes', 'multiprocessing']:
+            compute_kwargs['num_workers'] = self._cores
+        return compute_kwargs
+
+    def _get_results_buffer_spec(self):
+        """
+        Optional. Provides the shape and data type of the result for a single
+        position so that workers can write results in place into a buffer
+        shared with this process when using `shared_memory`. By default,
+        results are sent back from the workers. This buffer is accounted for
+        when sizing batches, so this is called from the constructor of Process
+        as well and should not rely on attributes set afterwards.
+
+        Returns
+        -------
+        spec : tuple or None
+            (shape, dtype) of the result for a single position, e.g. -
+            ((), np.float32) for a scalar or ((3,), np.complex64) for a
+            vector. None if results should be sent back from the workers
+        """
+        return None
+
+    def __map_in_worker_pool(self, data, func, *args, **kwargs):
+        """
+        Maps the provided function over the positions in the provided data
+        using a pool of self._cores worker processes that persists till the
+        end of compute(). The pool is only restarted if a different function
+        or different arguments are provided.
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            2D array of shape (positions, spectral steps)
+        func : callable
+            Function to map to each position or block of positions
+        args : list
+            arguments to the function in the correct order
+        per_position : bool, optional. Default = True
+            If True, `func` is called per position and `data` is split into
+            a few blocks per worker. If False, `data` is split into one block
+            per worker and `func` is called on each block
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        results : list or :class:`numpy.ndarray`
+            Result of the function for each position
+        """
+        per_position = kwargs.pop('per_position', True)
+        pool_key = (func, args, kwargs)
+        if self.__worker_pool is not None and not _is_same_pool_key(self.__worker_pool_key, pool_key):
+            self.__shutdown_worker_pool()
+        if self.__worker_pool is None:
+            if self.verbose:
+                print('Rank {} starting a pool of {} workers'.format(self.mpi_rank, self._cores))
+            cpu_sets, counter = self.__get_worker_pinning()
+            self.__worker_pool = ProcessPoolExecutor(max_workers=self._cores,
+                                                     mp_context=_get_pool_context(),
+                                                     initializer=_init_pool_worker,
+                                                     initargs=(func, args, kwargs, self.__blas_threads,
+                                                               cpu_sets, counter))
+            self.__worker_pool_key = pool_key
+
+        # A few blocks per worker balance the load without sending each position separately
+        num_blocks = min(len(data), 4 * self._cores if per_position else self._cores)
+        bounds = np.linspace(0, len(data), num_blocks + 1).astype(int)
+
+        if self.__shared_memory:
+            block_results = self.__map_over_shared_buffers(data, bounds, per_position)
+        else:
+            blocks = [np.asarray(data[start: end]) for start, end in zip(bounds[:-1], bounds[1:])]
+            if per_position:
+                block_results = self.__worker_pool.map(_map_block_in_pool_worker, blocks)
+            else:
+                block_results = self.__worker_pool.map(_apply_to_block_in_pool_worker, blocks)
+            block_results = self.__record_worker_peak_rss(block_results)
+
+        if isinstance(block_results, np.ndarray):
+            # Written in place by the workers
+            return block_results
+        return _stack_block_results(list(block_results))
+
+    def __map_over_shared_buffers(self, data, bounds, per_position):
+        """
+        Places the data in a buffer shared with the workers and only sends the
+        bounds of each block to the workers
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            2D array of shape (positions, spectral steps)
+        bounds : :class:`numpy.ndarray`
+            Start and end of each block of positions within `data`
+        per_position : bool
+            Whether the function in the workers is applied per position or
+            per block
+
+        Returns
+        -------
+        results : iterable or :class:`numpy.ndarray`
+            Results of each block as returned by the workers or, if the
+            workers wrote results in place, all results in a new array
+        """
+        data = np.asarray(data)
+        shared_data = self.__get_shared_input(data)
+        if shared_data is None:
+            # Only copied if the batch was not read into a shared buffer
+            self.__shared_data = _SharedBuffer.reuse_or_create(self.__shared_data, data.shape, data.dtype)
+            self.__shared_data.array[:len(data)] = data
+            shared_data = self.__shared_data
+
+        result_desc = None
+        spec = self._get_results_buffer_spec()
+        # Failures cannot be written in place
+        if spec is not None and not self.__isolate_failures:
+            res_shape = (len(data),) + tuple(spec[0])
+            self.__shared_results = _SharedBuffer.reuse_or_create(self.__shared_results, res_shape, spec[1])
+            result_desc = self.__shared_results.describe()
+
+        tasks = [(shared_data.describe(), start, end, per_position, result_desc)
+                 for start, end in zip(bounds[:-1], bounds[1:])]
+        block_results = self.__record_worker_peak_rss(self.__worker_pool.map(_compute_on_shared_block, tasks))
+        if result_desc is None:
+            return block_results
+        # Copy out since the buffer will be overwritten by the next batch
+        return np.array(self.__shared_results.array[:len(data)])
+
+    def __record_worker_peak_rss(self, worker_results):
+        """
+        Records the peak resident memory reported by the pool workers along
+        with the results of each task
+
+        Parameters
+        ----------
+        worker_results : iterable
+            (results, process ID, peak resident memory) of each task
+
+        Returns
+        -------
+        results : list
+            Results of each task
+        """
+        results = []
+        for block_results, pid, peak_rss in worker_results:
+            if self.profile is not None:
+                self.profile.add_worker_peak_rss(pid, peak_rss)
+            results.append(block_results)
+        return results
+
+    def __map_in_threads(self, data, func, *args, **kwargs):
+        """
+        Maps the provided function over views of the provided data using a
+        pool of self._cores threads that persists till the end of compute()
+
+        Parameters
+        ----------
+        data : :class:`numpy.ndarray`
+            2D array of shape (positions, spectral steps)
+        func : callable
+            Function to map to each position or block of positions
+        args : list
+            arguments to the function in the correct order
+        per_position : bool, optional. Default = True
+            If True, `func` is called per position and `data` is split into
+            a few blocks per thread. If False, `data` is split into one block
+            per thread and `func` is called on each block
+        kwargs : dict
+            keyword arguments to the function
+
+        Returns
+        -------
+        results : list or :class:`numpy.ndarray`
+            Result of the function for each position
+        """
+        per_position = kwargs.pop('per_position', True)
+        if self.__thread_pool is None:
+            cpu_sets, counter = self.__get_worker_pinning()
+            if cpu_sets is None:
+                self.__thread_pool = ThreadPoolExecutor(max_workers=self._cores)
+            else:
+                self.__thread_pool = ThreadPoolExecutor(max_workers=self._cores, initializer=_pin_to_next_cpus,
+                                                        initargs=(cpu_sets, counter))
+
+        data = np.asarray(data)
+        # A few blocks per thread balance the load
+        num_blocks = min(len(data), 4 * self._cores if per_position else self._cores)
+        bounds = np.linspace(0, len(data), num_blocks + 1).astype(int)
+        futures = [self.__thread_pool.submit(_apply_to_block, func, data[start: end],
+                                             per_position, args, kwargs)
+                   for start, end in zip(bounds[:-1], bounds[1:])]
+        return _stack_block_results([future.result() for future in futures])
+
+    def __check_thread_speedup(self, *args, **kwargs):
+        """
+        Compares the time taken to compute a sample of positions with one and
+        with self._cores threads. Worker processes are used instead of threads
+        if threads do not speed up the computation, as is the case for
+        functions that hold the GIL
+
+        Parameters
+        ----------
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        num_pos = int(min(self.h5_main.shape[0], self._max_pos_per_read, 4 * self._cores))
+        start = np.random.randint(0, self.h5_main.shape[0] - num_pos + 1)
+        data = self.h5_main[start: start + num_pos, self.__get_tile_slice()]
+        per_position = not self._has_batch_function()
+        func = self._map_function if per_position else self._batch_function
+        try:
+            with threadpool_limits(limits=self.__blas_threads):
+                t_start = tm.time()
+                _ = _apply_to_block(func, data, per_position, args, kwargs)
+                serial_time = tm.time() - t_start
+                t_start = tm.time()
+                _ = self.__map_in_threads(data, func, *args, per_position=per_position, **kwargs)
+                thread_time = tm.time() - t_start
+        except Exception as exc:
+            # _map_function may not be implemented or usable outside _unit_computation
+            if self.verbose:
+                print('Rank {} could not measure the speedup from threads: {}. Using threads'
+                      '.'.format(self.mpi_rank, exc))
+            return
+        speedup = serial_time / max(thread_time, 1E-9)
+        # Functions holding the GIL do not get faster (if not slower) with threads
+        self.__use_threads = speedup >= 1.5
+        if not self.__use_threads:
+            self.__shutdown_worker_pool()
+        if self.verbose or not self.__use_threads:
+            print('Rank {} - {} threads computed {} positions {}x faster than one. Using {}'
+                  '.'.format(self.mpi_rank, self._cores, num_pos, np.round(speedup, 2),
+                             'threads' if self.__use_threads else 'worker processes'))
+
+    def __shutdown_worker_pool(self):
+        """
+        Stops the workers in the persistent pool, if any, and releases the
+        buffers shared with them
+        """
+        if self.__thread_pool is not None:
+            self.__thread_pool.shutdown(wait=True)
+            self.__thread_pool = None
+        for buffer in [self.__shared_data, self.__shared_results]:
+            if buffer is not None:
+                buffer.close()
+        self.__shared_data = None
+        self.__shared_results = None
+        if self.__worker_pool is None:
+            return
+        self.__worker_pool.shutdown(wait=True)
+        self.__worker_pool = None
+        self.__worker_pool_key = None
 
     def compute(self, override=False, *args, **kwargs):
         """
@@ -858,95 +4000,542 @@ class Process(object):
                 Adds the item to the internal queue. If the size of the queue exceeds its capacity, the oldest
                 item is removed.
 
-                Parameters
-                ----------
-                item : float or int
-                    Any real valued number
-                """
-                if (not isinstance(item, Number)) or isinstance(item, complex):
-                    raise TypeError('Provided item: {} is not a Number'.format(item))
-                self.__queue.append(item)
-                self.__count += 1
-                if len(self.__queue) > self.__max_length:
-                    _ = self.__queue.pop(0)
+                Parameters
+                ----------
+                item : float or int
+                    Any real valued number
+                """
+                if (not isinstance(item, Number)) or isinstance(item, complex):
+                    raise TypeError('Provided item: {} is not a Number'.format(item))
+                self.__queue.append(item)
+                self.__count += 1
+                if len(self.__queue) > self.__max_length:
+                    _ = self.__queue.pop(0)
+
+            def get_mean(self):
+                """
+                Returns the average of the elements within the queue
+
+                Returns
+                -------
+                avg : number.Number
+                    Mean of all elements within the queue
+                """
+                return np.mean(self.__queue)
+
+            def get_cycles(self):
+                """
+                Returns the number of items that have been added to the queue in total
+
+                Returns
+                -------
+                count : int
+                    number of items that have been added to the queue in total
+                """
+                return self.__count
+
+        if self.__use_duplicate_results(override):
+            return self.h5_results_grp
+
+        # Ranks are only pinned while computing
+        orig_affinity = self.__pin_rank()
+        try:
+            self.__compute_all(SimpleFIFO(5), SimpleFIFO(5), *args, **kwargs)
+        finally:
+            if orig_affinity is not None:
+                os.sched_setaffinity(0, orig_affinity)
+
+        return self.h5_results_grp
+
+    def __compute_all(self, compute_times, write_times, *args, **kwargs):
+        """
+        Opens the results and computes on all positions assigned to this
+        rank, followed by retrying failed positions and merging the results
+
+        Parameters
+        ----------
+        compute_times : SimpleFIFO
+            Moving average of the compute time per position
+        write_times : SimpleFIFO
+            Moving average of the write time per position
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        self.__open_results(*args, **kwargs)
+
+        self.__assign_job_indices()
+
+        if self.mpi_size > 1:
+            # Ranks will update the status dataset independently till the end
+            _CompletedRanges.invalidate(self._h5_status_dset)
+
+        # Not sure if this is necessary but I don't think it would hurt either
+        if self.mpi_comm is not None:
+            self.mpi_comm.barrier()
+
+        self.__set_initial_pos_per_batch(*args, **kwargs)
+        if self.__dynamic_scheduling:
+            self.__create_work_units()
+
+        self.profile = ComputeProfile(rank=self.mpi_rank)
+        orig_rank_start = self.__start_pos
+
+        if self.mpi_rank == 0 and self.mpi_size == 1:
+            if self.__resume_implemented:
+                print('\tThis class (likely) supports interruption and resuming of computations!\n'
+                      '\tIf you are operating in a python console, press Ctrl+C or Cmd+C to abort\n'
+                      '\tIf you are in a Jupyter notebook, click on "Kernel">>"Interrupt"\n'
+                      '\tIf you are operating on a cluster and your job gets killed, re-run the job to resume\n')
+            else:
+                print('\tThis class does NOT support interruption and resuming of computations.\n'
+                      '\tIn order to enable this feature, simply implement the _get_existing_datasets() function')
+
+        if self.verbose and self.mpi_rank == self.__socket_master_rank:
+            print('Rank: {} - with nothing loaded has {} free memory'
+                  ''.format(self.mpi_rank, format_size(get_available_memory())))
+
+        if self.__prefetch:
+            self.__prefetcher = ThreadPoolExecutor(max_workers=1)
+        if self.__async_write:
+            self.__writer = ThreadPoolExecutor(max_workers=1)
+        self.__unflushed = {'runs': [], 'failed': [], 'num_batches': 0, 'end_pos': None,
+                            't_flush': tm.time()}
+        try:
+            self.__compute_batches(orig_rank_start, compute_times, write_times,
+                                   *args, **kwargs)
+            # Surface any errors from the last batch written in the background
+            self.__wait_for_pending_write()
+            if self.__work_counter is not None:
+                self.__work_counter.free()
+                self.__work_counter = None
+            self.__retry_failures(*args, **kwargs)
+        finally:
+            if self.__prefetcher is not None:
+                self.__prefetcher.shutdown(wait=True)
+                self.__prefetcher = None
+                self.__prefetched = None
+            if self.__writer is not None:
+                # Let the results that were already computed reach the file
+                self.__writer.shutdown(wait=True)
+                self.__writer = None
+                self.__pending_write = None
+            self.__shutdown_worker_pool()
+            self.__release_shared_inputs()
+            # Checkpoint all batches written so far, even if interrupted
+            try:
+                self.__flush_pending()
+            finally:
+                self.__unflushed = None
+                self.__close_rank_file()
 
-            def get_mean(self):
-                """
-                Returns the average of the elements within the queue
+        self.__finish_compute()
 
-                Returns
-                -------
-                avg : number.Number
-                    Mean of all elements within the queue
-                """
-                return np.mean(self.__queue)
+    def __use_duplicate_results(self, override=False):
+        """
+        Picks up previously computed results with the same parameters, if any
 
-            def get_cycles(self):
-                """
-                Returns the number of items that have been added to the queue in total
+        Parameters
+        ----------
+        override : bool, optional. default = False
+            Set to True to ignore existing results and force fresh computation
 
-                Returns
-                -------
-                count : int
-                    number of items that have been added to the queue in total
-                """
-                return self.__count
+        Returns
+        -------
+        is_duplicate : bool
+            Whether or not self.h5_results_grp now points to complete results
+            computed previously
+        """
+        if override:
+            return False
+        if len(self.duplicate_h5_groups) > 0:
+            if self.mpi_rank == 0:
+                print('Returned previously computed results at ' + self.duplicate_h5_groups[-1].name)
+            self.h5_results_grp = self.duplicate_h5_groups[-1]
+            return True
+        if len(self.partial_h5_groups) > 0 and self.h5_results_grp is None:
+            if self.mpi_rank == 0:
+                print('Resuming computation in group: ' + self.partial_h5_groups[-1].name)
+            self.use_partial_computation()
+        return False
 
-        if not override:
-            if len(self.duplicate_h5_groups) > 0:
-                if self.mpi_rank == 0:
-                    print('Returned previously computed results at ' + self.duplicate_h5_groups[-1].name)
-                self.h5_results_grp = self.duplicate_h5_groups[-1]
-                return self.duplicate_h5_groups[-1]
-            elif len(self.partial_h5_groups) > 0 and self.h5_results_grp is None:
-                if self.mpi_rank == 0:
-                    print('Resuming computation in group: ' + self.partial_h5_groups[-1].name)
-                self.use_partial_computation()
+    def __open_results(self, *args, **kwargs):
+        """
+        Creates the results group and datasets or gets them when resuming,
+        along with the status dataset
 
+        Parameters
+        ----------
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
         resuming = False
         if self.h5_results_grp is None:
             # starting fresh
             if self.verbose and self.mpi_rank == 0:
                 print('Creating HDF5 group and datasets to hold results')
-            self._create_results_datasets()
+            if self.__rank_files == 'virtual':
+                # Results only take up space in the files of the ranks
+                with _placeholder_datasets():
+                    self._create_results_datasets()
+            else:
+                self._create_results_datasets()
             self._write_source_dset_provenance()
+            # Lets future instances find these results without comparing attributes
+            index_results_group(self.h5_results_grp, self.h5_main,
+                                self.process_name, self.parms_dict)
         else:
             # resuming from previous checkpoint
             resuming = True
             self._get_existing_datasets()
 
         self.__create_compute_status_dataset()
+        self.__open_rank_file()
+        self.__find_collective_datasets()
+
+        if self.__backend == 'threads' and self._cores > 1:
+            self.__use_threads = True
+            self.__check_thread_speedup(*args, **kwargs)
+
+        if self.__auto_cores:
+            self.__calibrate_cores(*args, **kwargs)
+
+        if self.__auto_mem_multiplier:
+            self.__calibrate_memory(*args, **kwargs)
 
         if resuming and self.mpi_rank == 0:
-            percent_complete = int(100 * len(np.where(self._h5_status_dset[()] == 1)[0]) /
+            percent_complete = int(100 * self.__completed.num_completed /
                                    self._h5_status_dset.shape[0])
             print('Resuming computation. {}% completed already'.format(percent_complete))
 
-        self.__assign_job_indices()
+    def __get_rank_file_path(self, rank='*'):
+        """
+        Returns the path of the file that the provided rank writes results to
+
+        Parameters
+        ----------
+        rank : uint or str, optional. Default = '*'
+            MPI rank. The default returns a pattern matching the files of all
+            ranks
+
+        Returns
+        -------
+        path : str
+            Path of the file next to the file containing the results group
+        """
+        base = os.path.splitext(self.h5_results_grp.file.filename)[0]
+        grp_name = self.h5_results_grp.name.strip('/').replace('/', '-')
+        return '{}_{}_rank{}.h5'.format(base, grp_name, rank)
+
+    def __open_rank_file(self):
+        """
+        Opens the file this rank writes results to, creates compressed
+        counterparts of the `Main` datasets in the results group within it,
+        and points the attributes of this object at those datasets
+        """
+        if self.__rank_files is None:
+            return
+        h5_file = self.h5_results_grp.file
+        dset_names = [h5_dset.name for h5_dset in get_all_main(self.h5_results_grp)]
+        self.__rank_h5_file = h5py.File(self.__get_rank_file_path(self.mpi_rank), mode='a')
+        for name in dset_names:
+            if name in self.__rank_h5_file:
+                # Resuming
+                continue
+            h5_dset = h5_file[name]
+            self.__rank_h5_file.create_dataset(name, shape=h5_dset.shape, dtype=h5_dset.dtype,
+                                               chunks=h5_dset.chunks or True, compression='gzip',
+                                               fillvalue=h5_dset.fillvalue)
+        ranges = None
+        if 'completed_ranges' in self.__rank_h5_file:
+            ranges = self.__rank_h5_file['completed_ranges'][()]
+        self.__rank_completed = _CompletedRanges(ranges)
+
+        self.__swapped_attrs = {}
+        for attr, val in list(vars(self).items()):
+            if isinstance(val, h5py.Dataset) and val.file == h5_file and val.name in dset_names:
+                self.__swapped_attrs[attr] = val
+                setattr(self, attr, self.__rank_h5_file[val.name])
+        if self.verbose:
+            print('Rank {} will write {} to {}'.format(self.mpi_rank, dset_names, self.__rank_h5_file.filename))
+
+    def __write_rank_ranges(self):
+        """
+        Records the positions whose results are in the file of this rank
+        """
+        ranges = self.__rank_completed.ranges
+        if 'completed_ranges' not in self.__rank_h5_file:
+            self.__rank_h5_file.create_dataset('completed_ranges', data=ranges, maxshape=(None, 2))
+            return
+        h5_ranges = self.__rank_h5_file['completed_ranges']
+        h5_ranges.resize(ranges.shape)
+        h5_ranges[:] = ranges
+
+    def __close_rank_file(self):
+        """
+        Points the attributes of this object back at the datasets in the
+        results group and closes the file of this rank
+        """
+        if self.__rank_h5_file is None:
+            return
+        for attr, val in self.__swapped_attrs.items():
+            setattr(self, attr, val)
+        self.__rank_h5_file.close()
+        self.__rank_h5_file = None
+
+    def __merge_rank_files(self):
+        """
+        Replaces the `Main` datasets in the results group with virtual
+        datasets mapping to the files of all ranks or copies the results in
+        these files into the results group. When copying, the files are
+        split among the ranks, which write to the `Main` datasets
+        independently. This is possible since these datasets are not
+        compressed when running via MPI without `collective_writes`, which is
+        not supported along with `rank_files`. This call is collective
+        """
+        if self.__rank_files is None:
+            return
+        num_pos = self.h5_main.shape[0]
+        sources = None
+        if self.mpi_rank == 0:
+            # Files from earlier runs with more ranks hold results too
+            sources = []
+            covered = np.zeros(num_pos, dtype=bool)
+            for path in sorted(glob.glob(self.__get_rank_file_path())):
+                with h5py.File(path, mode='r') as h5_rank_file:
+                    if 'completed_ranges' not in h5_rank_file:
+                        continue
+                    ranges = h5_rank_file['completed_ranges'][()]
+                # Each position is taken from a single file
+                in_file = np.zeros(num_pos, dtype=bool)
+                for run_start, run_end in ranges:
+                    in_file[run_start: run_end] = True
+                in_file &= ~covered
+                covered |= in_file
+                sources.append((path, _get_consecutive_runs(np.where(in_file)[0])))
+        if self.mpi_comm is not None:
+            sources = self.mpi_comm.bcast(sources, root=0)
+
+        h5_file = self.h5_results_grp.file
+        dset_names = [h5_dset.name for h5_dset in get_all_main(self.h5_results_grp)]
+        if self.__rank_files == 'copy':
+            # Each rank copies the results from its share of the files
+            num_ranks = 1 if self.mpi_comm is None else self.mpi_comm.size
+            for path, runs in sources[self.mpi_rank::num_ranks]:
+                with h5py.File(path, mode='r') as h5_rank_file:
+                    for name in dset_names:
+                        for run_start, run_end in runs:
+                            for start in range(run_start, run_end, self._max_pos_per_read):
+                                end = min(run_end, start + self._max_pos_per_read)
+                                h5_file[name][start: end] = h5_rank_file[name][start: end]
+            if self.mpi_comm is not None:
+                self.mpi_comm.barrier()
+            # Flushing is collective
+            h5_file.flush()
+            if self.mpi_rank == 0:
+                for path, _ in sources:
+                    os.remove(path)
+            self.__swapped_attrs = {}
+            return
+
+        # Names are lost once the datasets are replaced
+        swapped_names = dict([(attr, val.name) for attr, val in self.__swapped_attrs.items()])
+        for name in dset_names:
+            h5_dset = h5_file[name]
+            layout = h5py.VirtualLayout(shape=h5_dset.shape, dtype=h5_dset.dtype)
+            for path, runs in sources:
+                # Relative to the file containing the virtual dataset
+                h5_source = h5py.VirtualSource(os.path.basename(path), name, shape=h5_dset.shape)
+                for run_start, run_end in runs:
+                    layout[run_start: run_end] = h5_source[run_start: run_end]
+            attrs = dict(h5_dset.attrs)
+            fill_value = h5_dset.fillvalue
+            h5_parent = h5_dset.parent
+            dset_name = name.split('/')[-1]
+            del h5_parent[dset_name]
+            h5_vds = h5_parent.create_virtual_dataset(dset_name, layout, fillvalue=fill_value)
+            for key, val in attrs.items():
+                h5_vds.attrs[key] = val
+        if self.verbose and self.mpi_rank == 0:
+            print('Replaced {} with virtual datasets mapping to {} files'.format(dset_names, len(sources)))
+
+        # Attributes pointed to the datasets that were replaced
+        for attr, val in self.__swapped_attrs.items():
+            h5_vds = h5_file[swapped_names[attr]]
+            if isinstance(val, USIDataset):
+                h5_vds = USIDataset(h5_vds)
+            setattr(self, attr, h5_vds)
+        self.__swapped_attrs = {}
+
+    def __finish_compute(self):
+        """
+        Summarizes the status dataset, saves the profile and updates the
+        legacy 'last_pixel' attribute once all ranks have finished computing.
+        This call is collective
+        """
+        if self.verbose:
+            print('Rank {} - Finished computing all jobs!'.format(self.mpi_rank))
+
+        self.profile.record_peak_rss()
 
-        # Not sure if this is necessary but I don't think it would hurt either
         if self.mpi_comm is not None:
             self.mpi_comm.barrier()
+            # Gather the positions completed by all ranks to summarize the status dataset
+            self.__completed.add(np.vstack(self.mpi_comm.allgather(self.__completed.ranges)))
+            self.__completed.write(self._h5_status_dset)
+            self.profile.gather(self.mpi_comm)
 
-        compute_times = SimpleFIFO(5)
-        write_times = SimpleFIFO(5)
-        orig_rank_start = self.__start_pos
+        self.__merge_rank_files()
 
-        if self.mpi_rank == 0 and self.mpi_size == 1:
-            if self.__resume_implemented:
-                print('\tThis class (likely) supports interruption and resuming of computations!\n'
-                      '\tIf you are operating in a python console, press Ctrl+C or Cmd+C to abort\n'
-                      '\tIf you are in a Jupyter notebook, click on "Kernel">>"Interrupt"\n'
-                      '\tIf you are operating on a cluster and your job gets killed, re-run the job to resume\n')
-            else:
-                print('\tThis class does NOT support interruption and resuming of computations.\n'
-                      '\tIn order to enable this feature, simply implement the _get_existing_datasets() function')
+        if self.__save_profile:
+            self.profile.write(self.h5_results_grp)
 
-        if self.verbose and self.mpi_rank == self.__socket_master_rank:
-            print('Rank: {} - with nothing loaded has {} free memory'
-                  ''.format(self.mpi_rank, format_size(get_available_memory())))
+        if self.mpi_rank == 0:
+            print('Finished processing the entire dataset!')
+            if self._h5_failed_dset is not None:
+                num_failed = int(np.sum(self._h5_failed_dset[()]))
+                if num_failed > 0:
+                    warn('Computation failed for {} positions. These are flagged in {} and will be computed '
+                         'again when resuming'.format(num_failed, self._h5_failed_dset.name))
+
+        # Update the legacy 'last_pixel' attribute here:
+        if self.mpi_rank == 0:
+            self.h5_results_grp.attrs['last_pixel'] = self.h5_main.shape[0]
+
+    def _start_pipeline_stage(self, override=False, *args, **kwargs):
+        """
+        Prepares this process to compute on batches of positions read by a
+        :class:`~pyUSID.processing.pipeline.ProcessPipeline` instead of
+        reading batches itself as in compute(). This call is collective
+
+        Parameters
+        ----------
+        override : bool, optional. default = False
+            Set to True to ignore existing results and force fresh computation
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        positions : :class:`numpy.ndarray`
+            Sorted positions that this process still needs to compute on.
+            Empty if complete results already exist
+        """
+        if self.__num_tiles > 1:
+            raise ValueError('Processes that tile the spectroscopic axis cannot be run within a ProcessPipeline')
+        if self.__collective_writes and self.mpi_comm is not None:
+            raise ValueError('Processes that write collectively cannot be run within a ProcessPipeline')
+        # The pipeline reads and sizes the batches itself
+        unsupported = [name for name, enabled in [('prefetch', self.__prefetch),
+                                                  ('async_write', self.__async_write),
+                                                  ('checkpoint_every_s', self.__checkpoint_every_s is not None),
+                                                  ('dynamic_scheduling', self.__dynamic_scheduling)]
+                       if enabled]
+        if len(unsupported) > 0:
+            raise ValueError('Processes with {} cannot be run within a ProcessPipeline'.format(unsupported))
+        if self.__use_duplicate_results(override):
+            self.__compute_jobs = None
+            return np.zeros(0, dtype=np.int64)
+
+        self.__open_results(*args, **kwargs)
+        self.__compute_jobs = self.__completed.get_incomplete(self.__get_num_units())
+
+        if self.mpi_size > 1:
+            # Ranks will update the status dataset independently till the end
+            _CompletedRanges.invalidate(self._h5_status_dset)
+
+        self.profile = ComputeProfile(rank=self.mpi_rank)
+        self.__unflushed = {'runs': [], 'failed': [], 'num_batches': 0, 'end_pos': None,
+                            't_flush': tm.time()}
+        return self.__compute_jobs.copy()
+
+    def _compute_pipeline_batch(self, pixels, data, read_time=0.0, *args, **kwargs):
+        """
+        Computes on and writes the results for a batch of positions that was
+        read by a :class:`~pyUSID.processing.pipeline.ProcessPipeline`
+
+        Parameters
+        ----------
+        pixels : :class:`numpy.ndarray`
+            Consecutive entries of the positions returned by
+            _start_pipeline_stage()
+        data : :class:`numpy.ndarray`
+            2D array with the source data for each of the positions
+        read_time : float, optional
+            Time in seconds taken to read the batch
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        self.__start_pos = int(np.searchsorted(self.__compute_jobs, pixels[0]))
+        self.__end_pos = self.__start_pos + len(pixels)
+        self.__pixels_in_batch = self.__compute_jobs[self.__start_pos: self.__end_pos]
+        if self.__lazy:
+            data = lazy_load_array(data)
+        self.data = data
+
+        self.__compute_current_batch(read_time, *args, **kwargs)
+        self.__commit_batch()
+        # Only one stage holds results at a time
+        self._results = None
+        self.data = None
+
+    def _end_pipeline_stage(self, completed=True):
+        """
+        Checkpoints the batches written so far and releases workers after a
+        :class:`~pyUSID.processing.pipeline.ProcessPipeline` has finished
+        computing on all batches. This call is collective if `completed`
+
+        Parameters
+        ----------
+        completed : bool, optional. default = True
+            Whether or not all batches were computed on. If False, the
+            results are only checkpointed, as when compute() is interrupted
+        """
+        if self.__compute_jobs is None:
+            # Complete results already existed
+            return
+        try:
+            self.__shutdown_worker_pool()
+            self.__release_shared_inputs()
+        finally:
+            try:
+                self.__flush_pending()
+            finally:
+                self.__unflushed = None
+                self.__close_rank_file()
+        if completed:
+            self.__finish_compute()
+
+    def __compute_batches(self, orig_rank_start, compute_times, write_times,
+                          *args, **kwargs):
+        """
+        Reads, computes, and writes back all batches of positions assigned to
+        this rank
 
+        Parameters
+        ----------
+        orig_rank_start : uint
+            Index within self.__compute_jobs this rank started computing from
+        compute_times : SimpleFIFO
+            Moving average of the compute time per position
+        write_times : SimpleFIFO
+            Moving average of the write time per position
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+        """
+        t_loop = tm.time()
+        t_read = tm.time()
         self._read_data_chunk()
+        read_time = tm.time() - t_read
 
         if self.mpi_comm is not None:
             self.mpi_comm.barrier()
@@ -959,18 +4548,17 @@ class Process(object):
 
             num_jobs_in_batch = self.__end_pos - self.__start_pos
 
-            t_start_1 = tm.time()
-
-            self._unit_computation(*args, **kwargs)
+            record = self.__compute_current_batch(read_time, *args, **kwargs)
 
-            comp_time = np.round(tm.time() - t_start_1, decimals=2)  # in seconds
+            # Not rounded, since fast batches would otherwise take no time at all when sizing batches
+            comp_time = record['compute_time']  # in seconds
             time_per_pix = comp_time / num_jobs_in_batch
             compute_times.put(time_per_pix)
 
             if self.verbose:
                 print('Rank {} - computed chunk in {} or {} per pixel. Average: {} per pixel'
-                      '.'.format(self.mpi_rank, format_time(comp_time), format_time(time_per_pix),
-                                 format_time(compute_times.get_mean())))
+                      '.'.format(self.mpi_rank, format_time(np.round(comp_time, decimals=2)),
+                                 format_time(time_per_pix), format_time(compute_times.get_mean())))
 
             # Ranks can become memory starved. Check memory usage - raw data + results in memory at this point
             if self.verbose and self.mpi_rank == self.__socket_master_rank:
@@ -978,51 +4566,396 @@ class Process(object):
                       ''.format(self.mpi_rank, format_size(get_available_memory())))
 
             t_start_2 = tm.time()
-            self._write_results_chunk()
+            if self.__writer is None:
+                write_times.put(self.__commit_batch())
+            else:
+                # Wait for the previous batch so that at most one batch is queued
+                time_per_pos = self.__wait_for_pending_write()
+                if time_per_pos is not None:
+                    write_times.put(time_per_pos)
+                self.__pending_write = self.__writer.submit(self.__commit_batch, self.__snapshot_batch())
 
             # NOW, update the positions. Users are NOT allowed to touch start and end pos
             self.__start_pos = self.__end_pos
-            # Leaving in this provision that will allow restarting of processes
-            if self.mpi_size == 1:
-                self.h5_results_grp.attrs['last_pixel'] = self.__end_pos
-            # Child classes don't even have to worry about flushing. Process will do it.
-            self.h5_main.file.flush()
 
-            dump_time = np.round(tm.time() - t_start_2, decimals=2)
-            write_times.put(dump_time / num_jobs_in_batch)
+            dump_time = tm.time() - t_start_2
+            # No batch has finished writing in the background yet
+            write_time = write_times.get_mean() if write_times.get_cycles() > 0 else 0
 
             if self.verbose:
                 print('Rank {} - wrote its {} pixel chunk in {}'.format(self.mpi_rank,
                                                                         num_jobs_in_batch,
-                                                                        format_time(dump_time)))
+                                                                        format_time(np.round(dump_time, decimals=2))))
+
+            if self.__work_counter is not None:
+                # Batches are claimed out of order and by all ranks, so progress is given by the
+                # batches claimed by all ranks. Remaining positions will be shared by all ranks
+                num_units = self.__get_num_units()
+                num_claimed = min(self.__work_counter.value, self.__work_units.size - 1)
+                num_remaining = self.__compute_jobs.size - int(self.__work_units[num_claimed])
+                time_remaining = num_remaining * (compute_times.get_mean() + write_time) / self.mpi_size
+                percent_complete = int(100 * (num_units - num_remaining) / num_units)
+            else:
+                time_remaining = (self.__rank_end_pos - self.__end_pos) * \
+                                 (compute_times.get_mean() + write_time)
+                percent_complete = int(100 * (self.__end_pos - orig_rank_start) /
+                                       (self.__rank_end_pos - orig_rank_start))
 
-            time_remaining = (self.__rank_end_pos - self.__end_pos) * \
-                             (compute_times.get_mean() + write_times.get_mean())
+            self.__set_pos_per_batch(compute_times.get_mean() + write_time)
 
             if self.verbose or self.mpi_rank == 0:
-                percent_complete = int(100 * (self.__end_pos - orig_rank_start) /
-                                       (self.__rank_end_pos - orig_rank_start))
                 print('Rank {} - {}% complete. Time remaining: {}'.format(self.mpi_rank, percent_complete,
                                                                           format_time(time_remaining)))
 
-            # All ranks should mark the pixels for this batch as completed. 'last_pixel' attribute will be updated later
-            # Setting each section to 1 independently
-            for curr_slice in integers_to_slices(self.__pixels_in_batch):
-                self._h5_status_dset[curr_slice] = 1
-
+            t_read = tm.time()
             self._read_data_chunk()
+            read_time = tm.time() - t_read
 
-        if self.verbose:
-            print('Rank {} - Finished computing all jobs!'.format(self.mpi_rank))
+        if self.__collective_dsets is not None:
+            # Keep taking part in the writes of the ranks that are still computing
+            while self.__write_collectively(has_batch=False):
+                if self.mpi_comm.allreduce(False, op=get_MPI().LOR):
+                    self.__flush_pending()
+
+        self.profile.elapsed[self.mpi_rank] = tm.time() - t_loop
+
+    def __compute_current_batch(self, read_time, *args, **kwargs):
+        """
+        Computes on the current batch of positions and records its profile
+
+        Parameters
+        ----------
+        read_time : float
+            Time in seconds spent waiting for the batch to be read
+        args : list
+            arguments to the mapped function in the correct order
+        kwargs : dict
+            keyword arguments to the mapped function
+
+        Returns
+        -------
+        record : dict
+            Profile record of this batch
+        """
+        num_jobs_in_batch = self.__end_pos - self.__start_pos
+        num_steps = len(range(*self.__spectral_slice.indices(self.h5_main.shape[1])))
+        bytes_per_src_pos = self.h5_main.dtype.itemsize * num_steps
+        record = self.profile.add_batch(int(self.__pixels_in_batch[0]),
+                                        num_jobs_in_batch,
+                                        read_time=read_time,
+                                        bytes_read=num_jobs_in_batch * bytes_per_src_pos)
+
+        t_start = tm.time()
+
+        # Also limits the workers started within
+        with _limit_blas_threads(self.__blas_threads):
+            self._unit_computation(*args, **kwargs)
+
+        if self.__isolate_failures:
+            self.__record_failures()
+
+        record['compute_time'] = tm.time() - t_start
+        record['bytes_written'] = _get_nbytes(self._results)
+        record['rss'] = _get_tree_rss()
+        self.__batch_record = record
+        return record
+
+    def __record_failures(self):
+        """
+        Finds the positions in the current batch that failed and fills in
+        their results so that the results of the batch can be written as usual.
+        Lazy results are computed here so that errors can be caught
+        """
+        self.__failed_in_batch = np.zeros(0, dtype=np.int64)
+        if isinstance(self._results, da.core.Array) or \
+                (isinstance(self._results, (list, tuple)) and len(self._results) > 0 and
+                 all([isinstance(item, da.core.Array) for item in self._results])):
+            self._results, failed = _compute_lazy_isolated(self._results, self.__get_dask_compute_kwargs(),
+                                                           blocks_per_round=self._cores)
+            self.__failed_in_batch = self.__compute_jobs[self.__start_pos: self.__end_pos][failed]
+            if len(failed) > 0 and self.verbose:
+                print('Rank {} - {} of {} positions failed'.format(self.mpi_rank, len(failed),
+                                                                   self.__end_pos - self.__start_pos))
+            return
+        if self._results is None or isinstance(self._results, np.ndarray):
+            # Nothing failed
+            return
+        failures = [item for item in self._results if isinstance(item, _Failure)]
+        self._results, failed = _fill_failures(self._results)
+        self.__failed_in_batch = self.__compute_jobs[self.__start_pos: self.__end_pos][failed]
+        if len(failures) > 0 and self.verbose:
+            print('Rank {} - {} of {} positions failed. First error - {}'
+                  ''.format(self.mpi_rank, len(failures), self.__end_pos - self.__start_pos,
+                            failures[0].message))
+
+    def __snapshot_batch(self):
+        """
+        Captures the state of the current batch that is needed to write its
+        results while the next batch is being computed
+
+        Returns
+        -------
+        snapshot : dict
+            Results, pixels, spectroscopic slice, units of work, failed units,
+            end position and profile record of the current batch
+        """
+        return {'results': self._results, 'pixels': self.__pixels_in_batch,
+                'spectral_slice': self.__spectral_slice,
+                'units': self.__compute_jobs[self.__start_pos: self.__end_pos],
+                'failed': self.__failed_in_batch, 'end_pos': self.__end_pos,
+                'record': self.__batch_record}
+
+    def __commit_batch(self, snapshot=None):
+        """
+        Writes the results of a batch to the file. The file is
+        flushed and the positions are marked as completed in the status
+        dataset only if a flush is due per the flushing policy.
+
+        Parameters
+        ----------
+        snapshot : dict, optional
+            State of the batch as returned by __snapshot_batch() when writing
+            in the background. Only one batch is written at a time.
+            By default, the current batch is written
+
+        Returns
+        -------
+        time_per_pos : float
+            Time in seconds taken to write and flush per unit of work
+        """
+        t_start = tm.time()
+        if snapshot is None:
+            snapshot = self.__snapshot_batch()
+        else:
+            snapshot['thread'] = threading.get_ident()
+            self.__write_snapshot = snapshot
+        try:
+            self.__write_batch(snapshot)
+        finally:
+            self.__write_snapshot = None
+        return (tm.time() - t_start) / len(snapshot['units'])
+
+    def __write_batch(self, snapshot):
+        """
+        Writes the results of a batch to the file and flushes the file if a
+        flush is due per the flushing policy
+
+        Parameters
+        ----------
+        snapshot : dict
+            State of the batch as returned by __snapshot_batch()
+        """
+        record = snapshot['record']
+        unflushed = self.__unflushed
+        # Nothing to write if all positions failed
+        has_results = len(snapshot['failed']) < len(snapshot['units'])
+        t_start = tm.time()
+        if self.__collective_dsets is not None:
+            self.__write_collectively(has_results=has_results)
+        elif has_results:
+            self._write_results_chunk()
+        record['write_time'] = tm.time() - t_start
+
+        # Failed positions are left incomplete so that they are computed again when resuming
+        succeeded = snapshot['units'][~np.isin(snapshot['units'], snapshot['failed'])]
+        unflushed['runs'] += _get_consecutive_runs(succeeded)
+        unflushed['failed'] += _get_consecutive_runs(np.sort(snapshot['failed']))
+        unflushed['num_batches'] += 1
+        unflushed['end_pos'] = snapshot['end_pos']
+
+        flush_due = self.__flush_every_n_batches is not None and \
+            unflushed['num_batches'] >= self.__flush_every_n_batches
+        flush_due = flush_due or (self.__flush_every_s is not None and
+                                  tm.time() - unflushed['t_flush'] >= self.__flush_every_s)
+        if self.__collective_dsets is not None:
+            # Flushing is collective as well
+            flush_due = self.mpi_comm.allreduce(flush_due, op=get_MPI().LOR)
+        if flush_due:
+            self.__flush_pending(record)
+
+    def __find_collective_datasets(self):
+        """
+        Finds the attributes of this object that point to the `Main` datasets
+        in the results group when writing collectively under MPI
+        """
+        if not self.__collective_writes or self.mpi_comm is None:
+            return
+        dset_names = [h5_dset.name for h5_dset in get_all_main(self.h5_results_grp)]
+        self.__collective_dsets = []
+        for attr in sorted(vars(self).keys()):
+            val = getattr(self, attr)
+            if isinstance(val, h5py.Dataset) and val.file == self.h5_results_grp.file and val.name in dset_names:
+                self.__collective_dsets.append(val)
+                # Each dataset only needs to be written to once
+                dset_names.remove(val.name)
+        if self.verbose and self.mpi_rank == 0:
+            print('Will write collectively to: {}'.format([h5_dset.name for h5_dset in self.__collective_dsets]))
+
+    def __write_collectively(self, has_batch=True, has_results=True):
+        """
+        Writes the results of the current batch, if any, along with all other
+        ranks. This call is collective
+
+        Parameters
+        ----------
+        has_batch : bool, optional. Default = True
+            Whether or not this rank computed on a batch
+        has_results : bool, optional. Default = True
+            Whether or not this rank has results to write for its batch
+
+        Returns
+        -------
+        active : bool
+            Whether or not any rank computed on a batch
+        """
+        # 0 - no batch, 1 - batch without results, 2 - batch with results
+        state = 2 if has_batch and has_results else int(has_batch)
+        state = self.mpi_comm.allreduce(state, op=get_MPI().MAX)
+        if state < 2:
+            return state > 0
+        with ExitStack() as stack:
+            for h5_dset in self.__collective_dsets:
+                stack.enter_context(h5_dset.collective)
+            if has_batch and has_results:
+                self._write_results_chunk()
+            else:
+                for h5_dset in self.__collective_dsets:
+                    _write_nothing(h5_dset)
+        return True
+
+    def __flush_pending(self, record=None):
+        """
+        Flushes the file and only then marks the positions of all batches
+        written since the last flush as completed in the status dataset
+
+        Parameters
+        ----------
+        record : dict, optional
+            Profile record of the batch to attribute the time taken to
+        """
+        unflushed = self.__unflushed
+        if unflushed is None:
+            return
+        if unflushed['num_batches'] == 0 and self.__collective_dsets is None:
+            return
+        t_flush = tm.time()
+        runs = _merge_ranges(np.array(unflushed['runs'], dtype=np.int64).reshape(-1, 2))
+        if self.__rank_h5_file is not None:
+            # Results need to be in this rank's file before the positions are marked as completed
+            self.__rank_h5_file.flush()
+            self.__rank_completed.add(runs)
+            self.__write_rank_ranges()
+            self.__rank_h5_file.flush()
+        # Leaving in this provision that will allow restarting of processes
+        if self.mpi_size == 1 and self.__num_tiles == 1:
+            self.h5_results_grp.attrs['last_pixel'] = unflushed['end_pos']
+        # Child classes don't even have to worry about flushing. Process will do it.
+        self.h5_main.file.flush()
+
+        # All ranks should mark the pixels for these batches as completed. 'last_pixel' attribute will be updated later
+        # Setting each section to 1 independently
+        t_status = tm.time()
+        for run_start, run_end in runs:
+            self._h5_status_dset[run_start: run_end] = 1
+            if self._h5_failed_dset is not None:
+                # May have failed in an earlier attempt
+                self._h5_failed_dset[run_start: run_end] = 0
+        for run_start, run_end in unflushed['failed']:
+            self._h5_failed_dset[run_start: run_end] = 1
+        self.__completed.add(runs)
+        if self.mpi_size == 1:
+            self.__completed.write(self._h5_status_dset)
+
+        unflushed.update({'runs': [], 'failed': [], 'num_batches': 0, 't_flush': tm.time()})
+        if record is not None:
+            record['flush_time'] = t_status - t_flush
+            record['status_time'] = tm.time() - t_status
+
+    def __retry_failures(self, *args, **kwargs):
+        """
+        Applies _retry_function to the positions that failed, split among the
+        ranks, and writes the results of those that succeed. This call is
+        collective
 
+        Parameters
+        ----------
+        args : list
+            arguments to the function in the correct order
+        kwargs : dict
+            keyword arguments to the function
+        """
+        if not self.__isolate_failures or not self._has_retry_function():
+            return
+        # The failed positions dataset needs to be up to date
+        self.__flush_pending()
         if self.mpi_comm is not None:
             self.mpi_comm.barrier()
+        # Failed positions are incomplete, so any rank can write their results.
+        # The flags are read in pieces no larger than a batch of the source dataset
+        num_units = self._h5_failed_dset.shape[0]
+        step = max(self._max_pos_per_read,
+                   int(self.__bytes_per_pos * self._max_pos_per_read) // self._h5_failed_dset.dtype.itemsize)
+        failed = [np.zeros(0, dtype=np.int64)]
+        for start in range(0, num_units, step):
+            failed.append(start + np.where(self._h5_failed_dset[start: start + step] > 0)[0])
+        failed = np.hstack(failed)
+        failed = np.array_split(failed, self.mpi_size)[self.mpi_rank]
+
+        # Batches of positions within the same tile
+        tiles = failed // self.h5_main.shape[0]
+        batches = []
+        for group in np.split(failed, np.where(np.diff(tiles) != 0)[0] + 1):
+            batches += [group[start: start + self._max_pos_per_read]
+                        for start in range(0, len(group), self._max_pos_per_read)]
+        num_rounds = len(batches)
+        if self.__collective_dsets is not None:
+            num_rounds = self.mpi_comm.allreduce(num_rounds, op=get_MPI().MAX)
+        if self.verbose:
+            print('Rank {} - retrying {} positions that failed'.format(self.mpi_rank, len(failed)))
+
+        func = _IsolatedFunction(self._retry_function)
+        recovered = []
+        for ind in range(num_rounds):
+            has_results = False
+            if ind < len(batches):
+                self.__spectral_slice, pixels = self.__split_units(batches[ind])
+                data = np.asarray(self.__read_units(batches[ind]))
+                with threadpool_limits(limits=self.__blas_threads):
+                    results = _apply_to_block(func, data, True, args, kwargs)
+                succeeded = np.array([not isinstance(item, _Failure) for item in results], dtype=bool)
+                has_results = np.any(succeeded)
+                self.__pixels_in_batch = pixels[succeeded]
+                self.data = data[succeeded]
+                self._results = [item for item, success in zip(results, succeeded) if success]
+                recovered += _get_consecutive_runs(batches[ind][succeeded])
+            if self.__collective_dsets is not None:
+                self.__write_collectively(has_batch=ind < len(batches), has_results=has_results)
+            elif has_results:
+                self._write_results_chunk()
+        self._results = None
+        self.data = None
 
-        if self.mpi_rank == 0:
-            print('Finished processing the entire dataset!')
+        # Marks the recovered positions as completed and no longer flags them
+        self.__unflushed['runs'] += recovered
+        self.__unflushed['num_batches'] += 1
+        self.__flush_pending()
+        if self.verbose:
+            print('Rank {} - {} of {} positions succeeded when retried'
+                  ''.format(self.mpi_rank, sum([end - start for start, end in recovered]), len(failed)))
 
-        # Update the legacy 'last_pixel' attribute here:
-        if self.mpi_rank == 0:
-            self.h5_results_grp.attrs['last_pixel'] = self.h5_main.shape[0]
+    def __wait_for_pending_write(self):
+        """
+        Blocks till the batch being written in the background, if any, has
+        been committed to the file. Errors raised while writing are re-raised
 
-        return self.h5_results_grp
+        Returns
+        -------
+        time_per_pos : float
+            Time in seconds taken to write and flush the batch per unit of
+            work. None if no batch was being written
+        """
+        if self.__pending_write is None:
+            return None
+        future = self.__pending_write
+        self.__pending_write = None
+        return future.result()
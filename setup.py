@@ -16,10 +16,12 @@ requirements = ['numpy>=1.10',
                 'cytoolz',  # dask installation failing without this
                 'dask>=0.10',
                 'h5py>=2.6.0',
+                'joblib',
                 'pillow',  # Remove once ImageReader is in ScopeReaders
                 'psutil',
                 'six',
-                'sidpy>=0.0.2'
+                'sidpy>=0.0.2',
+                'threadpoolctl'
                 ]
 
 setup(
@@ -36,8 +38,6 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Cython',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: Implementation :: CPython',
@@ -49,6 +49,8 @@ setup(
     author='S. Somnath, C. R. Smith, and contributors',
     author_email='pycroscopy@gmail.com',
     install_requires=requirements,
+    # Executors with initializers and multiprocessing contexts
+    python_requires='>=3.7',
     setup_requires=['pytest-runner'],
     tests_require=['unittest2;python_version<"3.0"', 'pytest'],
     platforms=['Linux', 'Mac OSX', 'Windows 10/8.1/8/7'],
@@ -11,6 +11,7 @@ import sys
 import h5py
 import numpy as np
 import shutil
+from unittest import mock
 
 sys.path.append("../../pyUSID/")
 from pyUSID.io import hdf_utils, Dimension, USIDataset
@@ -814,6 +815,95 @@ class TestCreateIndexedGroup(unittest.TestCase):
         os.remove(file_path)
 
 
+class TestGetParmsHash(unittest.TestCase):
+
+    def test_equivalent_values(self):
+        parms_1 = {'a': 1, 'b': [1.5, 2.5], 'c': 'str', 'd': None}
+        parms_2 = {'c': np.array('str'), 'b': np.array([1.5, 2.5], dtype=np.float32),
+                   'a': np.int64(1)}
+        self.assertEqual(hdf_utils.get_parms_hash(parms_1),
+                         hdf_utils.get_parms_hash(parms_2))
+
+    def test_int_and_float(self):
+        self.assertEqual(hdf_utils.get_parms_hash({'a': 1, 'b': [1, 2]}),
+                         hdf_utils.get_parms_hash({'a': 1.0, 'b': np.array([1., 2.])}))
+
+    def test_different_values(self):
+        parms_hash_1, keys_hash_1 = hdf_utils.get_parms_hash({'a': 1, 'b': 2.5})
+        parms_hash_2, keys_hash_2 = hdf_utils.get_parms_hash({'a': 1, 'b': 2.6})
+        self.assertNotEqual(parms_hash_1, parms_hash_2)
+        self.assertEqual(keys_hash_1, keys_hash_2)
+
+    def test_invalid_type(self):
+        with self.assertRaises(TypeError):
+            _ = hdf_utils.get_parms_hash(['a', 1])
+
+
+class TestIndexResultsGroup(unittest.TestCase):
+
+    def setUp(self):
+        self.file_path = 'test.h5'
+        data_utils.delete_existing_file(self.file_path)
+        self.h5_f = h5py.File(self.file_path, mode='w')
+        self.h5_dset = self.h5_f.create_dataset('Main', data=[1, 2, 3])
+        self.parms = [{'a': 1, 'b': 2.5}, {'a': 2, 'b': 2.5}]
+        self.h5_groups = []
+        for parms in self.parms:
+            h5_group = hdf_utils.create_results_group(self.h5_dset, 'Tool')
+            hdf_utils.write_simple_attrs(h5_group, parms)
+            self.assertTrue(hdf_utils.index_results_group(h5_group, self.h5_dset, 'Tool', parms))
+            self.h5_groups.append(h5_group)
+
+    def tearDown(self):
+        self.h5_f.close()
+        data_utils.delete_existing_file(self.file_path)
+
+    def test_index_written(self):
+        for h5_group in self.h5_groups:
+            self.assertIn('parms_hash', h5_group.attrs)
+        self.assertIn('results_index', self.h5_f.attrs)
+
+    def test_found_via_index(self):
+        # Attributes are not compared for indexed groups
+        del self.h5_groups[1].attrs['a']
+        ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms=self.parms[1])
+        self.assertEqual(ret, [self.h5_groups[1]])
+
+    def test_found_with_equivalent_types(self):
+        ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms={'a': 1.0, 'b': 2.5})
+        self.assertEqual(ret, [self.h5_groups[0]])
+
+    def test_hash_mismatch_not_compared(self):
+        # Indexed groups with other parameters are skipped without comparing attributes
+        with mock.patch('pyUSID.io.hdf_utils.simple.check_for_matching_attrs') as mock_check:
+            ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms=self.parms[0])
+            mock_check.assert_not_called()
+        self.assertEqual(ret, [self.h5_groups[0]])
+
+    def test_no_match(self):
+        ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms={'a': 3, 'b': 2.5})
+        self.assertEqual(ret, [])
+
+    def test_subset_of_parms(self):
+        # Falls back to comparing attributes
+        ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms={'b': 2.5})
+        self.assertEqual(ret, self.h5_groups)
+
+    def test_unindexed_group(self):
+        h5_group = hdf_utils.create_results_group(self.h5_dset, 'Tool')
+        hdf_utils.write_simple_attrs(h5_group, self.parms[0])
+        ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms=self.parms[0])
+        self.assertEqual(ret, [self.h5_groups[0], h5_group])
+
+    def test_replaced_group(self):
+        group_name = self.h5_groups[0].name
+        del self.h5_f[group_name]
+        h5_group = self.h5_f.create_group(group_name)
+        hdf_utils.write_simple_attrs(h5_group, {'a': 5, 'b': 2.5})
+        ret = hdf_utils.check_for_old(self.h5_dset, 'Tool', new_parms=self.parms[0])
+        self.assertEqual(ret, [])
+
+
 class TestCreateResultsGroup(unittest.TestCase):
 
     def test_first(self):
@@ -1167,6 +1257,51 @@ class TestCreateEmptyDataset(unittest.TestCase):
 
         os.remove(file_path)
 
+    def test_compression_kept_outside_mpio(self):
+        file_path = 'test.h5'
+        data_utils.delete_existing_file(file_path)
+        with h5py.File(file_path, mode='w') as h5_f:
+            h5_dset_source = h5_f.create_dataset('Source', data=np.arange(6.), chunks=(3,), compression='gzip')
+            for parallel_compression in [False, True]:
+                h5_duplicate = hdf_utils.create_empty_dataset(h5_dset_source, np.float32,
+                                                              'Duplicate_{}'.format(parallel_compression),
+                                                              parallel_compression=parallel_compression)
+                self.assertEqual(h5_duplicate.compression, 'gzip')
+
+        os.remove(file_path)
+
+    def test_placeholder(self):
+        file_path = 'test.h5'
+        data_utils.delete_existing_file(file_path)
+        with h5py.File(file_path, mode='w') as h5_f:
+            h5_dset_source = h5_f.create_dataset('Source', data=np.arange(6.))
+            h5_dset_source.attrs['units'] = 'nm'
+            with hdf_utils.simple._placeholder_datasets():
+                h5_duplicate = hdf_utils.create_empty_dataset(h5_dset_source, np.float32, 'Duplicate')
+            self.assertTrue(h5_duplicate.is_virtual)
+            self.assertEqual(h5_duplicate.virtual_sources(), [])
+            self.assertEqual(h5_duplicate.shape, h5_dset_source.shape)
+            self.assertEqual(h5_duplicate.dtype, np.float32)
+            self.assertEqual(h5_duplicate.attrs['units'], 'nm')
+            # Only within the context
+            h5_other = hdf_utils.create_empty_dataset(h5_dset_source, np.float32, 'Other')
+            self.assertFalse(h5_other.is_virtual)
+
+        os.remove(file_path)
+
+    def test_placeholder_without_virtual_datasets(self):
+        file_path = 'test.h5'
+        data_utils.delete_existing_file(file_path)
+        with h5py.File(file_path, mode='w') as h5_f:
+            h5_dset_source = h5_f.create_dataset('Source', data=np.arange(6.))
+            with mock.patch('pyUSID.io.hdf_utils.simple._supports_virtual_datasets', return_value=False):
+                with hdf_utils.simple._placeholder_datasets():
+                    h5_duplicate = hdf_utils.create_empty_dataset(h5_dset_source, np.float32, 'Duplicate')
+            self.assertFalse(h5_duplicate.is_virtual)
+            self.assertEqual(h5_duplicate.shape, h5_dset_source.shape)
+
+        os.remove(file_path)
+
     def validate_copied_dataset(self, h5_f_new, h5_dest, dset_new_name,
                                 dset_data, dset_attrs):
         self.assertTrue(dset_new_name in h5_f_new.keys())
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, unicode_literals, absolute_import
+import unittest
+from ..io import data_utils
+from ..io.data_utils import *
+from .test_process import AvgSpecRecordBatches
+sys.path.append("../../../pyUSID/")
+import pyUSID as usid
+
+
+class MaxSpecRecordBatches(AvgSpecRecordBatches):
+
+    def __init__(self, h5_main, *args, **kwargs):
+        super(MaxSpecRecordBatches, self).__init__(h5_main, *args, **kwargs)
+        self.process_name = 'Max_Val'
+        self.duplicate_h5_groups, self.partial_h5_groups = self._check_for_duplicates()
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        return np.max(spectrogram)
+
+
+class ScaledAvgSpec(AvgSpecRecordBatches):
+
+    def __init__(self, h5_main, scale=1, **kwargs):
+        super(ScaledAvgSpec, self).__init__(h5_main, **kwargs)
+        self.parms_dict = {'scale': scale}
+        self.duplicate_h5_groups, self.partial_h5_groups = self._check_for_duplicates()
+
+    @staticmethod
+    def _map_function(spectrogram, scale=1):
+        return scale * np.mean(spectrogram)
+
+    def _unit_computation(self, *args, **kwargs):
+        super(ScaledAvgSpec, self)._unit_computation(scale=self.parms_dict['scale'])
+
+
+class TestProcessPipeline(unittest.TestCase):
+
+    def setUp(self):
+        delete_existing_file(data_utils.std_beps_path)
+        data_utils.make_beps_file()
+        self.h5_file = h5py.File(data_utils.std_beps_path, mode='r+')
+        self.h5_main = usid.USIDataset(self.h5_file['Raw_Measurement/source_main'])
+        self.exp_mean = np.expand_dims(np.mean(self.h5_main[()], axis=1), axis=1)
+        self.exp_max = np.expand_dims(np.max(self.h5_main[()], axis=1), axis=1)
+        self.avg_proc = AvgSpecRecordBatches(self.h5_main)
+        self.max_proc = MaxSpecRecordBatches(self.h5_main)
+
+    def tearDown(self):
+        self.h5_file.close()
+        delete_existing_file(data_utils.std_beps_path)
+
+    def test_compute(self):
+        pipeline = usid.ProcessPipeline([self.avg_proc, self.max_proc])
+        pipeline._max_pos_per_read = 6
+        h5_avg_grp, h5_max_grp = pipeline.compute()
+        self.assertNotEqual(h5_avg_grp, h5_max_grp)
+        self.assertTrue(np.allclose(h5_avg_grp['Results'][()], self.exp_mean))
+        self.assertTrue(np.allclose(h5_max_grp['Results'][()], self.exp_max))
+        for proc, h5_grp in zip([self.avg_proc, self.max_proc], [h5_avg_grp, h5_max_grp]):
+            self.assertEqual([len(batch) for batch in proc.batches], [6, 6, 3])
+            h5_status_dset = h5_grp['completed_positions']
+            self.assertEqual(np.sum(h5_status_dset[()]), self.h5_main.shape[0])
+            self.assertEqual(h5_grp.attrs['last_pixel'], self.h5_main.shape[0])
+
+    def test_resume_independently(self):
+        self.avg_proc._max_pos_per_read = 6
+        h5_avg_grp = self.avg_proc.compute()
+        h5_avg_grp['completed_positions'][:] = 0
+        h5_avg_grp['completed_positions'].attrs['completed_ranges'] = [[0, 10]]
+        h5_avg_grp['completed_positions'].attrs['num_completed'] = 10
+        h5_avg_grp['Results'][10:] = 0
+        self.avg_proc.batches = []
+
+        pipeline = usid.ProcessPipeline([self.avg_proc, self.max_proc])
+        h5_grps = pipeline.compute()
+        self.assertEqual(h5_grps[0], h5_avg_grp)
+        # Only the positions missing for each process are handed to it
+        self.assertTrue(np.all(np.hstack(self.avg_proc.batches) == np.arange(10, 15)))
+        self.assertTrue(np.all(np.hstack(self.max_proc.batches) == np.arange(15)))
+        self.assertTrue(np.allclose(h5_avg_grp['Results'][()], self.exp_mean))
+
+    def test_skip_complete_results(self):
+        h5_avg_grp = self.avg_proc.compute()
+        self.avg_proc = AvgSpecRecordBatches(self.h5_main)
+        pipeline = usid.ProcessPipeline([self.avg_proc, self.max_proc])
+        h5_grps = pipeline.compute()
+        self.assertEqual(h5_grps[0], h5_avg_grp)
+        self.assertEqual(self.avg_proc.batches, [])
+        self.assertTrue(np.allclose(h5_grps[1]['Results'][()], self.exp_max))
+
+    def test_sweep(self):
+        pipeline = usid.ProcessPipeline.sweep(ScaledAvgSpec, self.h5_main,
+                                              [{'scale': 1}, {'scale': 2}, {'scale': 3}],
+                                              cores=1)
+        self.assertEqual([proc._cores for proc in pipeline.processes], [1, 1, 1])
+        h5_grps = pipeline.compute()
+        self.assertEqual(len(set([h5_grp.name for h5_grp in h5_grps])), 3)
+        for scale, h5_grp in zip([1, 2, 3], h5_grps):
+            self.assertEqual(h5_grp.attrs['scale'], scale)
+            self.assertTrue(np.allclose(h5_grp['Results'][()], scale * self.exp_mean))
+        # Results of each variant are found like any other results
+        proc = ScaledAvgSpec(self.h5_main, scale=2)
+        self.assertEqual(proc.duplicate_h5_groups, [h5_grps[1]])
+
+    def test_memory_divided(self):
+        self.avg_proc._max_pos_per_read = 12
+        self.max_proc._max_pos_per_read = 6
+        pipeline = usid.ProcessPipeline([self.avg_proc, self.max_proc])
+        self.assertEqual(pipeline._max_pos_per_read, 4)
+
+    def test_results_cleared(self):
+        pipeline = usid.ProcessPipeline([self.avg_proc, self.max_proc])
+        pipeline._max_pos_per_read = 6
+        _ = pipeline.compute()
+        self.assertIsNone(self.avg_proc._results)
+        self.assertIsNone(self.max_proc._results)
+
+    def test_unsupported_options(self):
+        for kwargs in [{'prefetch': True}, {'async_write': True},
+                       {'checkpoint_every_s': 1}, {'dynamic_scheduling': True}]:
+            pipeline = usid.ProcessPipeline([self.avg_proc, AvgSpecRecordBatches(self.h5_main, **kwargs)])
+            with self.assertRaises(ValueError):
+                _ = pipeline.compute()
+
+    def test_sweep_not_process_class(self):
+        with self.assertRaises(TypeError):
+            _ = usid.ProcessPipeline.sweep(dict, self.h5_main, [{'scale': 1}])
+
+    def test_not_processes(self):
+        with self.assertRaises(TypeError):
+            _ = usid.ProcessPipeline([self.avg_proc, self.h5_main])
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            _ = usid.ProcessPipeline([])
+
+    def test_different_h5_main(self):
+        h5_other = self.h5_main.parent.create_dataset('other_main', data=self.h5_main[()])
+        usid.hdf_utils.write_simple_attrs(h5_other, {'quantity': 'Current', 'units': 'nA'})
+        usid.hdf_utils.link_as_main(h5_other, self.h5_main.h5_pos_inds,
+                                    self.h5_main.h5_pos_vals,
+                                    self.h5_main.h5_spec_inds,
+                                    self.h5_main.h5_spec_vals)
+        other_proc = MaxSpecRecordBatches(usid.USIDataset(h5_other))
+        with self.assertRaises(ValueError):
+            _ = usid.ProcessPipeline([self.avg_proc, other_proc])
+
+
+if __name__ == '__main__':
+    unittest.main()
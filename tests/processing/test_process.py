@@ -7,6 +7,17 @@ Created on Tue Nov  3 15:07:16 2017
 """
 from __future__ import division, print_function, unicode_literals, absolute_import
 import unittest
+import io
+import contextlib
+import os
+import sys
+import glob
+import time as tm
+import threading
+from unittest import mock
+import dask.array as da
+from multiprocessing import Value
+import psutil
 from ..io import data_utils
 from ..io.data_utils import *
 sys.path.append("../../../pyUSID/")
@@ -556,6 +567,1405 @@ class TestMultiBatchCompute(TestCoreProcessNoTest):
         self.proc._max_pos_per_read = 6
         super(TestMultiBatchCompute, self).test_compute()
 
+
+class TestMultiBatchComputePrefetch(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestMultiBatchComputePrefetch,
+              self).setUp(proc_class=proc_class, prefetch=True, **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 7
+        super(TestMultiBatchComputePrefetch, self).test_compute()
+        h5_status_dset = self.proc.h5_results_grp['completed_positions']
+        self.assertEqual(np.sum(h5_status_dset[()]), self.h5_main.shape[0])
+
+    def test_max_pos_halved(self):
+        proc = AvgSpecUltraBasic(self.h5_main, max_mem_mb=1)
+        for kwargs in [{'prefetch': True}, {'async_write': True}]:
+            proc_two_batches = AvgSpecUltraBasic(self.h5_main, max_mem_mb=1, **kwargs)
+            self.assertEqual(proc_two_batches._max_pos_per_read,
+                             proc._max_pos_per_read // 2)
+
+
+class AvgSpecRecordBatches(AvgSpecUltraBasicWGetPrevResults):
+
+    def __init__(self, h5_main, *args, **kwargs):
+        self.batches = []
+        super(AvgSpecRecordBatches, self).__init__(h5_main, *args, **kwargs)
+
+    def _write_results_chunk(self):
+        self.batches.append(self._get_pixels_in_current_batch().copy())
+        super(AvgSpecRecordBatches, self)._write_results_chunk()
+
+
+class TestChunkAlignedBatches(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        delete_existing_file(data_utils.std_beps_path)
+        data_utils.make_beps_file()
+        self.h5_file = h5py.File(data_utils.std_beps_path, mode='r+')
+        h5_source = usid.USIDataset(self.h5_file['Raw_Measurement/source_main'])
+        h5_chunked = h5_source.parent.create_dataset('chunked_main',
+                                                     data=h5_source[()],
+                                                     chunks=(4, h5_source.shape[1]),
+                                                     compression='gzip')
+        usid.hdf_utils.write_simple_attrs(h5_chunked, {'quantity': 'Current',
+                                                       'units': 'nA'})
+        usid.hdf_utils.link_as_main(h5_chunked, h5_source.h5_pos_inds,
+                                    h5_source.h5_pos_vals,
+                                    h5_source.h5_spec_inds,
+                                    h5_source.h5_spec_vals)
+        self.h5_main = usid.USIDataset(h5_chunked)
+        self.exp_result = np.expand_dims(np.mean(self.h5_main[()], axis=1),
+                                         axis=1)
+
+        self.proc = proc_class(self.h5_main, **proc_kwargs)
+
+    def test_max_pos_per_read_multiple_of_chunks(self):
+        self.assertEqual(self.proc._max_pos_per_read % 4, 0)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestChunkAlignedBatches, self).test_compute()
+        self.assertEqual([len(batch) for batch in self.proc.batches],
+                         [4, 4, 4, 3])
+        self.assertTrue(np.all(np.hstack(self.proc.batches) ==
+                               np.arange(self.h5_main.shape[0])))
+
+    def test_plan_overlapping_chunks(self):
+        self.proc._max_pos_per_read = 3
+        plan = self.proc.plan()
+        self.assertEqual(list(plan['batches'][0][:, 1]), [3, 1, 3, 1, 3, 1, 3])
+        # Batches of up to 3 positions split the first 3 chunks of 4 positions
+        self.assertEqual(plan['chunks_decompressed'], 7)
+        self.assertEqual(plan['chunks_decompressed_again'], 3)
+        self.assertAlmostEqual(plan['decompression_amplification'], 7 * 4 / 15)
+
+    def test_compute_partial(self):
+        # Resuming with holes in the completed positions
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        h5_grp['completed_positions'][[1, 2, 5, 6]] = 0
+        # Summary is now stale and should not be relied upon
+        del h5_grp['completed_positions'].attrs['completed_ranges']
+        h5_grp['Results'][[1, 2, 5, 6], 0] = 0
+        self.proc.batches = []
+        self.proc._max_pos_per_read = 3
+        self.proc.compute(override=False)
+        # Positions 5 and 6 share a chunk and should be read together
+        self.assertEqual([list(batch) for batch in self.proc.batches],
+                         [[1, 2], [5, 6]])
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+
+
+class AvgSpecSlow(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        tm.sleep(0.01)
+        return np.mean(spectrogram)
+
+
+class FakeClock(object):
+    """
+    Stands in for the time module within process.py. Time only passes when
+    positions are computed
+    """
+
+    now = 0.0
+    # Exactly representable such that batch sizes are exact
+    seconds_per_pos = 2.0 ** -7
+
+    @staticmethod
+    def time():
+        return FakeClock.now
+
+
+class AvgSpecTicking(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        FakeClock.now += FakeClock.seconds_per_pos
+        return np.mean(spectrogram)
+
+
+class TestCheckpointEverySeconds(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecTicking, **proc_kwargs):
+        FakeClock.seconds_per_pos = 2.0 ** -7
+        super(TestCheckpointEverySeconds,
+              self).setUp(proc_class=proc_class, cores=1,
+                          checkpoint_every_s=5 * FakeClock.seconds_per_pos, **proc_kwargs)
+
+    def test_compute(self):
+        with mock.patch('pyUSID.processing.process.tm', FakeClock):
+            super(TestCheckpointEverySeconds, self).test_compute()
+        # 5 positions per batch instead of all positions in one batch
+        self.assertEqual([len(batch) for batch in self.proc.batches], [5, 5, 5])
+        self.assertTrue(np.all(np.hstack(self.proc.batches) ==
+                               np.arange(self.h5_main.shape[0])))
+
+    def test_fast_batches_resized(self):
+        # Batches that take under 5 ms to compute
+        FakeClock.seconds_per_pos = 2.0 ** -10
+        self.proc._Process__checkpoint_every_s = 5 * FakeClock.seconds_per_pos
+        with mock.patch('pyUSID.processing.process.tm', FakeClock):
+            # Starting with a single position per batch
+            with mock.patch.object(AvgSpecTicking, '_estimate_compute_time_per_pixel',
+                                   return_value=10 * FakeClock.seconds_per_pos):
+                self.proc.compute()
+        self.assertEqual([len(batch) for batch in self.proc.batches], [1, 5, 5, 4])
+
+
+class TestInvalidProcessKwargs(unittest.TestCase):
+
+    def setUp(self):
+        delete_existing_file(data_utils.std_beps_path)
+        data_utils.make_beps_file()
+        self.h5_file = h5py.File(data_utils.std_beps_path, mode='r+')
+        self.h5_main = usid.USIDataset(self.h5_file['Raw_Measurement/source_main'])
+
+    def tearDown(self):
+        self.h5_file.close()
+        delete_existing_file(data_utils.std_beps_path)
+
+    def test_checkpoint_every_s_not_number(self):
+        with self.assertRaises(TypeError):
+            _ = AvgSpecUltraBasic(self.h5_main, checkpoint_every_s='60')
+
+    def test_checkpoint_every_s_negative(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, checkpoint_every_s=-5)
+
+    def test_flush_every_n_batches_not_int(self):
+        with self.assertRaises(TypeError):
+            _ = AvgSpecUltraBasic(self.h5_main, flush_every_n_batches=2.5)
+
+    def test_flush_every_n_batches_zero(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, flush_every_n_batches=0)
+
+    def test_flush_every_s_negative(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, flush_every_s=-1)
+
+    def test_spectral_tile_size_not_int(self):
+        with self.assertRaises(TypeError):
+            _ = AvgSpecUltraBasic(self.h5_main, spectral_tile_size=2.5)
+
+    def test_spectral_tile_size_zero(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, spectral_tile_size=0)
+
+    def test_rank_files_invalid(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, rank_files='hdf5')
+
+    def test_rank_files_virtual_unsupported(self):
+        with mock.patch('pyUSID.processing.process._supports_virtual_datasets', return_value=False):
+            with self.assertRaises(ValueError):
+                _ = AvgSpecUltraBasic(self.h5_main, rank_files='virtual')
+            _ = AvgSpecUltraBasic(self.h5_main, rank_files='copy')
+
+    def test_rank_files_with_spectral_tiles(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, rank_files='copy', spectral_tile_size=5)
+
+    def test_collective_writes_async(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, collective_writes=True, async_write=True)
+
+    def test_collective_writes_rank_files(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, collective_writes=True, rank_files='virtual')
+
+    def test_backend_not_str(self):
+        with self.assertRaises(TypeError):
+            _ = AvgSpecUltraBasic(self.h5_main, backend=['processes'])
+
+    def test_backend_unknown(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, backend='gpu')
+
+    def test_shared_memory_wo_worker_pool(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, shared_memory=True)
+
+
+class TestDynamicScheduling(TestChunkAlignedBatches):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestDynamicScheduling,
+              self).setUp(proc_class=proc_class, dynamic_scheduling=True,
+                          **proc_kwargs)
+
+    def test_progress_partial(self):
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        h5_grp['completed_positions'][[1, 2, 5, 6]] = 0
+        del h5_grp['completed_positions'].attrs['completed_ranges']
+        del h5_grp['completed_positions'].attrs['num_completed']
+        self.proc._max_pos_per_read = 3
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.proc.compute(override=False)
+        percents = [int(line.split('-')[1].split('%')[0])
+                    for line in stdout.getvalue().splitlines()
+                    if line.startswith('Rank 0 - ')]
+        # Progress includes the positions completed before resuming
+        self.assertEqual(percents, [int(100 * 13 / 15), 100])
+
+
+class _TwoRankWorkCounter(usid.processing.process._WorkCounter):
+    """
+    Counter where another rank claims the next batch right after this one
+    """
+
+    def fetch_and_add(self, increment=1):
+        value = super(_TwoRankWorkCounter, self).fetch_and_add(increment)
+        if increment > 0:
+            super(_TwoRankWorkCounter, self).fetch_and_add(increment)
+        return value
+
+
+class TestDynamicSchedulingTwoRanks(TestChunkAlignedBatches):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestDynamicSchedulingTwoRanks,
+              self).setUp(proc_class=proc_class, dynamic_scheduling=True,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        stdout = io.StringIO()
+        with mock.patch('pyUSID.processing.process._WorkCounter', _TwoRankWorkCounter):
+            with contextlib.redirect_stdout(stdout):
+                self.proc.compute()
+        # Only every other batch of 4 positions was claimed by this rank
+        self.assertEqual([list(batch) for batch in self.proc.batches],
+                         [[0, 1, 2, 3], [8, 9, 10, 11]])
+        percents = [int(line.split('-')[1].split('%')[0])
+                    for line in stdout.getvalue().splitlines()
+                    if line.startswith('Rank 0 - ')]
+        # Progress includes the batches claimed by the other rank
+        self.assertEqual(percents, [int(100 * 8 / 15), 100])
+
+
+class TestDynamicSchedulingPrefetch(TestChunkAlignedBatches):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestDynamicSchedulingPrefetch,
+              self).setUp(proc_class=proc_class, dynamic_scheduling=True,
+                          prefetch=True, **proc_kwargs)
+
+
+class TestWorkCounter(unittest.TestCase):
+
+    def test_local(self):
+        counter = usid.processing.process._WorkCounter()
+        self.assertEqual(counter.fetch_and_add(), 0)
+        self.assertEqual(counter.fetch_and_add(3), 1)
+        self.assertEqual(counter.fetch_and_add(), 4)
+        self.assertEqual(counter.value, 5)
+        self.assertEqual(counter.value, 5)
+        counter.free()
+
+
+class TestPersistentWorkerPool(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestPersistentWorkerPool,
+              self).setUp(proc_class=proc_class, cores=2,
+                          backend='processes', **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestPersistentWorkerPool, self).test_compute()
+
+
+class AvgSpecBatchFunc(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        raise AssertionError('_batch_function should have been used instead')
+
+    @staticmethod
+    def _batch_function(data, *args, **kwargs):
+        return np.mean(data, axis=1)
+
+
+class TestBatchFunction(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecBatchFunc, **proc_kwargs):
+        super(TestBatchFunction,
+              self).setUp(proc_class=proc_class, cores=2, **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestBatchFunction, self).test_compute()
+        self.assertEqual(len(self.proc.batches), 3)
+
+
+class TestBatchFunctionWorkerPool(TestBatchFunction):
+
+    def setUp(self, proc_class=AvgSpecBatchFunc, **proc_kwargs):
+        super(TestBatchFunctionWorkerPool,
+              self).setUp(proc_class=proc_class, backend='processes',
+                          **proc_kwargs)
+
+
+class TestBatchFunctionSerial(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecBatchFunc, **proc_kwargs):
+        super(TestBatchFunctionSerial,
+              self).setUp(proc_class=proc_class, cores=1, **proc_kwargs)
+
+
+class BlasThreadsBatchFunc(AvgSpecUltraBasic):
+
+    @staticmethod
+    def _batch_function(data, *args, **kwargs):
+        from threadpoolctl import threadpool_info
+        num_threads = max([1] + [info['num_threads'] for info in threadpool_info()
+                                 if info['user_api'] == 'blas'])
+        return np.full(len(data), num_threads, dtype=np.float32)
+
+
+class TestBlasThreadsInWorkers(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=BlasThreadsBatchFunc, **proc_kwargs):
+        super(TestBlasThreadsInWorkers,
+              self).setUp(proc_class=proc_class, **proc_kwargs)
+
+    def test_compute(self):
+        # Use workers even on machines with a single CPU
+        self.proc._cores = 2
+        self.proc._Process__blas_threads = 1
+        h5_grp = self.proc.compute()
+        # Queried from within each worker
+        self.assertTrue(np.all(h5_grp['Results'][()] == 1))
+
+    def test_environment_restored(self):
+        orig_val = os.environ.get('OPENBLAS_NUM_THREADS')
+        with usid.processing.process._limit_blas_threads(3):
+            # Read by workers started within
+            self.assertEqual(os.environ['OPENBLAS_NUM_THREADS'], '3')
+        self.assertEqual(os.environ.get('OPENBLAS_NUM_THREADS'), orig_val)
+
+
+class TestBlasThreadsInWorkerPool(TestBlasThreadsInWorkers):
+
+    def setUp(self, proc_class=BlasThreadsBatchFunc, **proc_kwargs):
+        super(TestBlasThreadsInWorkerPool,
+              self).setUp(proc_class=proc_class, backend='processes',
+                          **proc_kwargs)
+
+
+class TestSharedMemoryWorkerPool(TestPersistentWorkerPool):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestSharedMemoryWorkerPool,
+              self).setUp(proc_class=proc_class, shared_memory=True,
+                          **proc_kwargs)
+
+
+    def test_batches_read_into_shared_buffer(self):
+        self.proc._max_pos_per_read = 6
+        # Use the pool even on machines with a single CPU
+        self.proc._cores = 2
+        create = usid.processing.process._SharedBuffer.reuse_or_create
+        read = usid.processing.process._read_positions
+        with mock.patch('pyUSID.processing.process._SharedBuffer.reuse_or_create',
+                        side_effect=create) as mock_create:
+            with mock.patch('pyUSID.processing.process._read_positions', side_effect=read) as mock_read:
+                super(TestSharedMemoryWorkerPool, self).test_compute()
+        # Each batch of 6 positions is read straight into the shared buffer and never copied
+        self.assertEqual(mock_read.call_count, 3)
+        for call in mock_read.call_args_list:
+            self.assertIsInstance(call[1]['out'], np.memmap)
+        self.assertEqual(mock_create.call_count, 3)
+
+
+class TestSharedMemoryPrefetch(TestSharedMemoryWorkerPool):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestSharedMemoryPrefetch,
+              self).setUp(proc_class=proc_class, prefetch=True,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._cores = 2
+        super(TestSharedMemoryPrefetch, self).test_compute()
+        # Each of the 3 batches was read into one of the two buffers in turn
+        self.assertEqual(self.proc._Process__num_shared_reads, 3)
+
+
+class AvgSpecBatchFuncResultsBuffer(AvgSpecBatchFunc):
+
+    def _get_results_buffer_spec(self):
+        return (), np.float32
+
+
+class TestSharedMemoryResultsBuffer(TestBatchFunction):
+
+    def setUp(self, proc_class=AvgSpecBatchFuncResultsBuffer, **proc_kwargs):
+        super(TestSharedMemoryResultsBuffer,
+              self).setUp(proc_class=proc_class, backend='processes',
+                          shared_memory=True, **proc_kwargs)
+
+    def test_results_buffer_in_memory_budget(self):
+        procs = [AvgSpecBatchFuncResultsBuffer(self.h5_main, backend='processes', max_mem_mb=1,
+                                               shared_memory=shared_memory)
+                 for shared_memory in [True, False]]
+        self.assertLess(procs[0]._max_pos_per_read, procs[1]._max_pos_per_read)
+
+
+class TestDaskBackend(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestDaskBackend,
+              self).setUp(proc_class=proc_class, cores=2, backend='dask',
+                          dask_scheduler='threads', **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestDaskBackend, self).test_compute()
+
+
+class TestDaskBackendLazy(TestDaskBackend):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestDaskBackendLazy,
+              self).setUp(proc_class=proc_class, lazy=True, **proc_kwargs)
+
+
+class TestDaskBackendBatchFunction(TestBatchFunction):
+
+    def setUp(self, proc_class=AvgSpecBatchFunc, **proc_kwargs):
+        super(TestDaskBackendBatchFunction,
+              self).setUp(proc_class=proc_class, backend='dask',
+                          dask_scheduler='synchronous', **proc_kwargs)
+
+
+class AvgSpecDaskFunc(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _dask_function(data, *args, **kwargs):
+        return data.mean(axis=1, keepdims=True)
+
+    def _write_results_chunk(self):
+        # Not computed till written
+        self.batches.append((self._get_pixels_in_current_batch().copy(),
+                             isinstance(self._results, da.core.Array)))
+        self._store_results_chunk(self.h5_results)
+
+
+class TestDaskFunction(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecDaskFunc, **proc_kwargs):
+        super(TestDaskFunction,
+              self).setUp(proc_class=proc_class, cores=1, lazy=True,
+                          dask_scheduler='synchronous', **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestDaskFunction, self).test_compute()
+        self.assertEqual([len(pixels) for pixels, _ in self.proc.batches], [6, 6, 3])
+        self.assertTrue(all([is_lazy for _, is_lazy in self.proc.batches]))
+
+    def test_resume_non_consecutive(self):
+        h5_grp = self.proc.compute()
+        h5_grp['Results'][2:4] = 0
+        h5_grp['Results'][9:12] = 0
+        h5_grp['completed_positions'][2:4] = 0
+        h5_grp['completed_positions'][9:12] = 0
+        del h5_grp['completed_positions'].attrs['completed_ranges']
+        del h5_grp['completed_positions'].attrs['num_completed']
+        proc = AvgSpecDaskFunc(self.h5_main, cores=1, lazy=True)
+        h5_grp = proc.compute()
+        self.assertTrue(np.all(proc.batches[0][0] == [2, 3, 9, 10, 11]))
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+
+
+def _mean_or_fail(block):
+    if np.mean(block) > AvgSpecFlaky.threshold:
+        raise ValueError('Simulated failure')
+    return np.mean(block, axis=1, keepdims=True)
+
+
+class AvgSpecDaskFlaky(AvgSpecDaskFunc):
+
+    @staticmethod
+    def _dask_function(data, *args, **kwargs):
+        return data.map_blocks(_mean_or_fail, chunks=(data.chunks[0], (1,)), dtype=data.dtype)
+
+
+class TestDaskFunctionIsolateFailures(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecDaskFlaky, **proc_kwargs):
+        super(TestDaskFunctionIsolateFailures,
+              self).setUp(proc_class=proc_class, cores=1, lazy=True, isolate_failures=True,
+                          dask_scheduler='synchronous', **proc_kwargs)
+
+    def tearDown(self):
+        AvgSpecFlaky.threshold = np.inf
+        super(TestDaskFunctionIsolateFailures, self).tearDown()
+
+    def test_compute(self):
+        AvgSpecFlaky.threshold = -np.inf
+        with self.assertWarns(UserWarning):
+            h5_grp = self.proc.compute()
+        self.assertTrue(np.all(h5_grp['completed_positions'][()] == 0))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 1))
+        # Nothing was written
+        self.assertEqual(len(self.proc.batches), 0)
+
+        AvgSpecFlaky.threshold = np.inf
+        proc = AvgSpecDaskFlaky(self.h5_main, cores=1, lazy=True, isolate_failures=True,
+                                dask_scheduler='synchronous')
+        h5_grp = proc.compute()
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 0))
+
+
+class AvgSpecRecordThreads(AvgSpecRecordBatches):
+
+    threads = set()
+    calls = []
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        # Sleeping releases the GIL
+        tm.sleep(0.005)
+        AvgSpecRecordThreads.threads.add(threading.current_thread().name)
+        return np.mean(spectrogram)
+
+
+class AvgSpecHoldGIL(AvgSpecRecordThreads):
+
+    threads = set()
+    calls = []
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        # Pure python loops hold the GIL
+        t_start = tm.time()
+        while tm.time() - t_start < 0.005:
+            pass
+        AvgSpecHoldGIL.threads.add(threading.current_thread().name)
+        AvgSpecHoldGIL.calls.append(tm.time())
+        return np.mean(spectrogram)
+
+
+class TestThreadsBackend(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordThreads, **proc_kwargs):
+        super(TestThreadsBackend,
+              self).setUp(proc_class=proc_class, backend='threads',
+                          **proc_kwargs)
+        # Independent of the number of cores on this machine
+        self.proc._cores = 4
+        proc_class.threads.clear()
+        del proc_class.calls[:]
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestThreadsBackend, self).test_compute()
+        self.assertGreater(len(AvgSpecRecordThreads.threads), 1)
+
+
+class TestThreadsBackendHoldGIL(TestThreadsBackend):
+
+    def setUp(self, proc_class=AvgSpecHoldGIL, **proc_kwargs):
+        super(TestThreadsBackendHoldGIL,
+              self).setUp(proc_class=proc_class, **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestThreadsBackend, self).test_compute()
+        # Within this process, the function only ran serially and with
+        # threads on the 6 positions used to measure the speedup
+        self.assertEqual(len(AvgSpecHoldGIL.calls), 2 * 6)
+
+
+class DoubleSpecTiles(AvgSpecRecordBatches):
+
+    def _create_results_datasets(self):
+        self.h5_results_grp = usid.hdf_utils.create_results_group(self.h5_main, self.process_name)
+        usid.hdf_utils.write_simple_attrs(self.h5_results_grp, self.parms_dict)
+        self.h5_results = usid.hdf_utils.write_main_dataset(
+            self.h5_results_grp, self.h5_main.shape, 'Results', 'quantity', 'units',
+            None, None, dtype=np.float32,
+            h5_pos_inds=self.h5_main.h5_pos_inds, h5_pos_vals=self.h5_main.h5_pos_vals,
+            h5_spec_inds=self.h5_main.h5_spec_inds, h5_spec_vals=self.h5_main.h5_spec_vals)
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        return 2 * spectrogram
+
+    def _write_results_chunk(self):
+        self.batches.append((self._get_pixels_in_current_batch().copy(),
+                             self._get_spectral_slice_in_current_batch()))
+        self.h5_results[self._get_pixels_in_current_batch(),
+                        self._get_spectral_slice_in_current_batch()] = np.array(self._results)
+
+
+class TestSpectralTiles(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=DoubleSpecTiles, **proc_kwargs):
+        super(TestSpectralTiles,
+              self).setUp(proc_class=proc_class, cores=1,
+                          spectral_tile_size=5, **proc_kwargs)
+        self.exp_result = 2 * self.h5_main[()]
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+        h5_status_dset = h5_grp['completed_positions']
+        # 15 positions x 3 tiles of 5, 5, and 4 spectroscopic steps
+        self.assertEqual(h5_status_dset.shape, (45,))
+        self.assertEqual(h5_status_dset.attrs['spectral_tile_size'], 5)
+        self.assertEqual(np.sum(h5_status_dset[()]), 45)
+        self.assertEqual([len(pixels) for pixels, _ in self.proc.batches], [6, 6, 3] * 3)
+        self.assertEqual([spec_slice for _, spec_slice in self.proc.batches],
+                         [slice(0, 5)] * 3 + [slice(5, 10)] * 3 + [slice(10, 14)] * 3)
+
+    def test_resume(self):
+        h5_grp = self.proc.compute()
+        # Lose the second tile of positions 3 to 7
+        h5_grp['completed_positions'][18: 23] = 0
+        del h5_grp['completed_positions'].attrs['completed_ranges']
+        del h5_grp['completed_positions'].attrs['num_completed']
+        h5_grp['Results'][3: 8, 5: 10] = 0
+
+        proc = DoubleSpecTiles(self.h5_main, cores=1, spectral_tile_size=5)
+        self.assertEqual(proc.partial_h5_groups, [h5_grp])
+        proc.compute()
+        self.assertEqual(len(proc.batches), 1)
+        self.assertTrue(np.all(proc.batches[0][0] == np.arange(3, 8)))
+        self.assertEqual(proc.batches[0][1], slice(5, 10))
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+
+    def test_complete_results_found_without_tiles(self):
+        h5_grp = self.proc.compute()
+        proc = DoubleSpecTiles(self.h5_main, cores=1)
+        self.assertEqual(proc.duplicate_h5_groups, [h5_grp])
+
+    def test_not_in_pipeline(self):
+        with self.assertRaises(ValueError):
+            _ = usid.ProcessPipeline([self.proc]).compute()
+
+
+class AvgSpecFailOnce(AvgSpecRecordBatches):
+
+    fail = True
+
+    def _write_results_chunk(self):
+        if AvgSpecFailOnce.fail and self._get_pixels_in_current_batch()[0] > 0:
+            raise IOError('Simulated failure')
+        super(AvgSpecFailOnce, self)._write_results_chunk()
+
+
+class TestRankFilesVirtual(TestCoreProcessNoTest):
+
+    rank_files = 'virtual'
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestRankFilesVirtual,
+              self).setUp(proc_class=proc_class, rank_files=self.rank_files,
+                          **proc_kwargs)
+
+    def tearDown(self):
+        super(TestRankFilesVirtual, self).tearDown()
+        for path in self.get_rank_files():
+            os.remove(path)
+
+    def get_rank_files(self):
+        return glob.glob(os.path.splitext(data_utils.std_beps_path)[0] + '_*_rank*.h5')
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestRankFilesVirtual, self).test_compute()
+        h5_results = self.proc.h5_results_grp['Results']
+        self.assertTrue(h5_results.is_virtual)
+        self.assertTrue(usid.hdf_utils.check_if_main(h5_results))
+        self.assertEqual(self.proc.h5_results, h5_results)
+        self.assertEqual(len(self.get_rank_files()), 1)
+        with h5py.File(self.get_rank_files()[0], mode='r') as h5_rank_file:
+            self.assertEqual(h5_rank_file[h5_results.name].compression, 'gzip')
+            self.assertTrue(np.all(h5_rank_file['completed_ranges'][()] == [[0, 15]]))
+
+    def test_resume(self):
+        self.proc = AvgSpecFailOnce(self.h5_main, rank_files=self.rank_files)
+        self.proc._max_pos_per_read = 6
+        AvgSpecFailOnce.fail = True
+        with self.assertRaises(IOError):
+            _ = self.proc.compute()
+        # Results written so far are only in the file of this rank
+        h5_results = self.proc.h5_results_grp['Results']
+        if self.rank_files == 'virtual':
+            # Placeholder without any storage
+            self.assertTrue(h5_results.is_virtual)
+            self.assertEqual(h5_results.virtual_sources(), [])
+        else:
+            self.assertFalse(h5_results.is_virtual)
+        AvgSpecFailOnce.fail = False
+
+        proc = AvgSpecRecordBatches(self.h5_main, rank_files=self.rank_files)
+        proc._max_pos_per_read = 6
+        h5_grp = proc.compute()
+        self.assertEqual(h5_grp, self.proc.h5_results_grp)
+        self.assertTrue(np.all(np.hstack(proc.batches) == np.arange(6, 15)))
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+
+
+class TestRankFilesCopy(TestRankFilesVirtual):
+
+    rank_files = 'copy'
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestRankFilesVirtual, self).test_compute()
+        self.assertFalse(self.proc.h5_results_grp['Results'].is_virtual)
+        self.assertEqual(self.get_rank_files(), [])
+
+
+class TestCollectiveWritesSerial(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestCollectiveWritesSerial,
+              self).setUp(proc_class=proc_class, collective_writes=True,
+                          **proc_kwargs)
+
+
+class TestWriteNothing(unittest.TestCase):
+
+    def setUp(self):
+        self.h5_path = 'write_nothing.h5'
+        self.h5_file = h5py.File(self.h5_path, mode='w')
+
+    def tearDown(self):
+        self.h5_file.close()
+        delete_existing_file(self.h5_path)
+
+    def test_compressed(self):
+        h5_dset = self.h5_file.create_dataset('Results', data=np.arange(12.).reshape(6, 2),
+                                              chunks=(2, 2), compression='gzip')
+        usid.processing.process._write_nothing(h5_dset)
+        self.assertTrue(np.allclose(h5_dset[()], np.arange(12.).reshape(6, 2)))
+
+
+class TestPlan(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestPlan, self).setUp(proc_class=proc_class, cores=1,
+                                    **proc_kwargs)
+
+    def test_plan(self):
+        self.proc._max_pos_per_read = 6
+        num_objects = len(self.h5_main.parent)
+        h5_target_group = self.proc._h5_target_group
+        plan = self.proc.plan()
+        # Nothing was written or left changed
+        self.assertEqual(len(self.h5_main.parent), num_objects)
+        self.assertIsNone(self.proc.h5_results_grp)
+        self.assertEqual(self.proc._h5_target_group, h5_target_group)
+        self.assertIsNone(self.proc._Process__compute_jobs)
+        self.assertIsNone(self.proc._Process__start_pos)
+        self.assertEqual(plan['num_positions'], 15)
+        self.assertEqual(plan['num_batches'], 3)
+        self.assertTrue(np.all(plan['batches'][0] == [[0, 6, 0], [6, 6, 0], [12, 3, 0]]))
+        self.assertEqual(plan['bytes_read'], self.h5_main.size * self.h5_main.dtype.itemsize)
+        self.assertIsNone(plan['chunks_decompressed'])
+        self.assertEqual(plan['decompression_amplification'], 1.0)
+        self.assertGreater(plan['memory_per_worker'], 0)
+        # One float32 per position
+        self.assertEqual(plan['bytes_written'], 15 * 4)
+        self.assertGreaterEqual(plan['compute_time'], 0)
+
+        # The plan matches what compute() does
+        self.proc.compute()
+        self.assertEqual([len(batch) for batch in self.proc.batches], [6, 6, 3])
+
+    def test_plan_partial(self):
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        h5_grp['completed_positions'][10:] = 0
+        del h5_grp['completed_positions'].attrs['completed_ranges']
+        del h5_grp['completed_positions'].attrs['num_completed']
+        proc = AvgSpecRecordBatches(self.h5_main, cores=1)
+        proc._max_pos_per_read = 6
+        plan = proc.plan()
+        self.assertEqual(plan['num_positions'], 5)
+        self.assertTrue(np.all(plan['batches'][0] == [[10, 5, 0]]))
+        self.assertEqual(plan['bytes_written'], 5 * 4)
+        self.assertEqual(proc.plan(override=True)['num_positions'], 15)
+
+    def test_plan_duplicate(self):
+        _ = self.proc.compute()
+        proc = AvgSpecRecordBatches(self.h5_main, cores=1)
+        plan = proc.plan()
+        self.assertEqual(plan['num_positions'], 0)
+        self.assertEqual(plan['num_batches'], 0)
+        self.assertEqual(plan['bytes_read'], 0)
+
+
+class AvgSpecFlaky(AvgSpecRecordBatches):
+
+    # Positions whose mean exceeds this fail
+    threshold = np.inf
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        if np.mean(spectrogram) > AvgSpecFlaky.threshold:
+            raise ValueError('Simulated failure')
+        return np.mean(spectrogram)
+
+
+class AvgSpecFlakyRetry(AvgSpecFlaky):
+
+    def __init__(self, h5_main, *args, **kwargs):
+        self.num_data = []
+        super(AvgSpecFlakyRetry, self).__init__(h5_main, *args, **kwargs)
+
+    @staticmethod
+    def _retry_function(spectrogram, *args, **kwargs):
+        return np.mean(spectrogram)
+
+    def _write_results_chunk(self):
+        self.num_data.append(len(self.data))
+        super(AvgSpecFlakyRetry, self)._write_results_chunk()
+
+
+class TestIsolateFailures(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecFlaky, **proc_kwargs):
+        super(TestIsolateFailures,
+              self).setUp(proc_class=proc_class, cores=1,
+                          isolate_failures=True, **proc_kwargs)
+        self.proc._max_pos_per_read = 4
+        AvgSpecFlaky.threshold = np.median(self.exp_result)
+        self.exp_failed = self.exp_result[:, 0] > AvgSpecFlaky.threshold
+
+    def tearDown(self):
+        AvgSpecFlaky.threshold = np.inf
+        super(TestIsolateFailures, self).tearDown()
+
+    def test_compute(self):
+        # Results of batches where all positions failed are not written
+        self.proc._max_pos_per_read = self.h5_main.shape[0]
+        with self.assertWarns(UserWarning):
+            h5_grp = self.proc.compute()
+        results = h5_grp['Results'][()]
+        self.assertTrue(np.allclose(results[~self.exp_failed], self.exp_result[~self.exp_failed]))
+        self.assertTrue(np.all(np.isnan(results[self.exp_failed])))
+        # Failed positions are left to be computed again
+        self.assertTrue(np.all(h5_grp['completed_positions'][()] == ~self.exp_failed))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == self.exp_failed))
+
+    def test_all_failed(self):
+        AvgSpecFlaky.threshold = -np.inf
+        h5_grp = self.proc.compute()
+        self.assertTrue(np.all(h5_grp['completed_positions'][()] == 0))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 1))
+        # Nothing was written
+        self.assertEqual(len(self.proc.batches), 0)
+
+    def test_resume(self):
+        self.proc._max_pos_per_read = self.h5_main.shape[0]
+        h5_grp = self.proc.compute()
+        AvgSpecFlaky.threshold = np.inf
+        proc = AvgSpecFlaky(self.h5_main, cores=1, isolate_failures=True)
+        self.assertEqual(proc.partial_h5_groups, [h5_grp])
+        h5_grp = proc.compute()
+        self.assertTrue(np.all(np.hstack(proc.batches) == np.where(self.exp_failed)[0]))
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+        self.assertTrue(np.all(h5_grp['completed_positions'][()] == 1))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 0))
+
+    def test_not_isolated(self):
+        proc = AvgSpecFlaky(self.h5_main, cores=1)
+        with self.assertRaises(ValueError):
+            proc.compute()
+
+
+class TestRetryFailures(TestIsolateFailures):
+
+    def setUp(self, proc_class=AvgSpecFlakyRetry, **proc_kwargs):
+        super(TestRetryFailures, self).setUp(proc_class=proc_class,
+                                             **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = self.h5_main.shape[0]
+        h5_grp = self.proc.compute()
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+        self.assertTrue(np.all(h5_grp['completed_positions'][()] == 1))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 0))
+        # Failed positions were written again
+        self.assertEqual(sum([len(batch) for batch in self.proc.batches]),
+                         self.h5_main.shape[0] + np.sum(self.exp_failed))
+        # Along with their data
+        self.assertEqual(self.proc.num_data, [len(batch) for batch in self.proc.batches])
+
+    def test_failed_flags_read_in_pieces(self):
+        self.proc._max_pos_per_read = 2
+        # Flags of 2 positions per read
+        self.proc._Process__bytes_per_pos = 1
+        h5_grp = self.proc.compute()
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 0))
+        retried = np.hstack(self.proc.batches[-int(np.ceil(np.sum(self.exp_failed) / 2)):])
+        self.assertTrue(np.all(retried == np.where(self.exp_failed)[0]))
+
+    def test_resume(self):
+        # Nothing is left to resume since the failed positions were recovered
+        h5_grp = self.proc.compute()
+        proc = AvgSpecFlakyRetry(self.h5_main, cores=1, isolate_failures=True)
+        self.assertEqual(proc.partial_h5_groups, [])
+        self.assertEqual(proc.duplicate_h5_groups, [h5_grp])
+
+    def test_all_failed(self):
+        AvgSpecFlaky.threshold = -np.inf
+        h5_grp = self.proc.compute()
+        self.assertTrue(np.allclose(h5_grp['Results'][()], self.exp_result))
+        self.assertTrue(np.all(h5_grp['failed_positions'][()] == 0))
+
+
+class TestComputeLazyIsolated(unittest.TestCase):
+
+    def test_failed_block(self):
+        data = da.from_array(np.arange(12.).reshape(6, 2), chunks=(2, 2))
+
+        def sum_or_fail(block):
+            if block[0, 0] == 4:
+                raise ValueError('Simulated failure')
+            return block.sum(axis=1, keepdims=True)
+
+        sums = data.map_blocks(sum_or_fail, chunks=((2, 2, 2), (1,)), dtype=data.dtype)
+        for blocks_per_round in [1, 3]:
+            results, failed = usid.processing.process._compute_lazy_isolated(
+                [sums, data], {'scheduler': 'synchronous'}, blocks_per_round=blocks_per_round)
+            self.assertTrue(np.all(failed == [2, 3]))
+            succeeded = np.array([0, 1, 4, 5])
+            self.assertTrue(np.allclose(results[0][succeeded, 0], np.arange(1., 24., 4)[succeeded]))
+            self.assertTrue(np.all(np.isnan(results[0][2:4])))
+            # All results of the failed positions are filled
+            self.assertTrue(np.all(np.isnan(results[1][2:4])))
+            self.assertTrue(np.allclose(results[1][succeeded], data.compute()[succeeded]))
+
+
+class TestFillFailures(unittest.TestCase):
+
+    def test_int(self):
+        failure = usid.processing.process._Failure(ValueError('Simulated failure'))
+        results, failed = usid.processing.process._fill_failures([np.arange(3), failure, np.arange(3)])
+        self.assertTrue(np.all(failed == [1]))
+        self.assertTrue(np.all(results[1] == [0, 0, 0]))
+
+    def test_float(self):
+        failure = usid.processing.process._Failure(ValueError('Simulated failure'))
+        results, failed = usid.processing.process._fill_failures([failure, 1.5])
+        self.assertTrue(np.all(failed == [0]))
+        self.assertTrue(np.isnan(results[0]))
+        self.assertEqual(failure.message, 'ValueError: Simulated failure')
+
+
+class TestPinCpus(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestPinCpus,
+              self).setUp(proc_class=proc_class, backend='threads',
+                          pin_cpus=sys.platform.startswith('linux'),
+                          **proc_kwargs)
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), 'CPU affinity is only supported on Linux')
+    def test_affinity_restored(self):
+        affinity = os.sched_getaffinity(0)
+        _ = self.proc.compute()
+        self.assertEqual(os.sched_getaffinity(0), affinity)
+
+
+class TestSplitCpus(unittest.TestCase):
+
+    def test_parse_cpu_list(self):
+        self.assertEqual(usid.processing.process._parse_cpu_list('0-3,8,10-11\n'),
+                         [0, 1, 2, 3, 8, 10, 11])
+
+    def test_fewer_parts_than_nodes(self):
+        cpu_sets = usid.processing.process._split_cpus([[0, 1], [2, 3], [4, 5]], 2)
+        self.assertEqual(cpu_sets, [[0, 1, 2, 3], [4, 5]])
+
+    def test_more_parts_than_nodes(self):
+        cpu_sets = usid.processing.process._split_cpus([[0, 1, 2, 3], [4, 5, 6, 7]], 4)
+        self.assertEqual(cpu_sets, [[0, 1], [2, 3], [4, 5], [6, 7]])
+
+    def test_more_parts_than_cpus(self):
+        cpu_sets = usid.processing.process._split_cpus([[0], [1]], 3)
+        self.assertEqual(cpu_sets, [[0], [0], [1]])
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'), 'CPU affinity is only supported on Linux')
+    def test_pin_thread(self):
+        cpu = min(os.sched_getaffinity(0))
+        counter = Value('i', 0)
+        affinity = []
+
+        def pin():
+            usid.processing.process._pin_to_next_cpus([[cpu]], counter)
+            affinity.append(os.sched_getaffinity(0))
+
+        thread = threading.Thread(target=pin)
+        thread.start()
+        thread.join()
+        self.assertEqual(affinity, [{cpu}])
+        self.assertEqual(counter.value, 1)
+
+
+class TestGetConsecutiveRuns(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(usid.processing.process._get_consecutive_runs([]), [])
+
+    def test_runs(self):
+        runs = usid.processing.process._get_consecutive_runs(
+            np.array([0, 1, 2, 5, 7, 8]))
+        self.assertEqual(runs, [(0, 3), (5, 6), (7, 9)])
+
+
+class TestCompletedRangesSummary(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestCompletedRangesSummary,
+              self).setUp(proc_class=proc_class, **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestCompletedRangesSummary, self).test_compute()
+        h5_status_dset = self.proc.h5_results_grp['completed_positions']
+        self.assertEqual(h5_status_dset.attrs['num_completed'],
+                         self.h5_main.shape[0])
+        self.assertTrue(np.all(h5_status_dset.attrs['completed_ranges'] ==
+                               [[0, self.h5_main.shape[0]]]))
+
+    def test_resume_wo_reading_status(self):
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        h5_status_dset = h5_grp['completed_positions']
+        # Only the summary says that the first 10 positions are complete
+        h5_status_dset[:] = 0
+        h5_status_dset.attrs['num_completed'] = 10
+        h5_status_dset.attrs['completed_ranges'] = [[0, 10]]
+        self.proc.batches = []
+        self.proc.compute(override=False)
+        self.assertTrue(np.all(np.hstack(self.proc.batches) ==
+                               np.arange(10, self.h5_main.shape[0])))
+        self.assertEqual(h5_status_dset.attrs['num_completed'],
+                         self.h5_main.shape[0])
+
+    def test_stale_summary_ignored(self):
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        h5_status_dset = h5_grp['completed_positions']
+        h5_status_dset[[3, 4]] = 0
+        # Summary inconsistent with itself
+        h5_status_dset.attrs['completed_ranges'] = [[0, 3], [5, 10]]
+        self.proc.batches = []
+        self.proc.compute(override=False)
+        self.assertTrue(np.all(np.hstack(self.proc.batches) == [3, 4]))
+
+
+class TestResultsGroupIndexed(TestCoreProcessNoTest):
+
+    def test_compute(self):
+        super(TestResultsGroupIndexed, self).test_compute()
+        h5_grp = self.proc.h5_results_grp
+        self.assertEqual(h5_grp.attrs['parms_hash'],
+                         usid.hdf_utils.get_parms_hash(self.proc.parms_dict)[0])
+        proc = AvgSpecUltraBasic(self.h5_main)
+        self.assertEqual(proc.duplicate_h5_groups, [h5_grp])
+
+
+class TestCompletedRanges(unittest.TestCase):
+
+    def test_merge(self):
+        completed = usid.processing.process._CompletedRanges([[5, 7], [0, 2]])
+        completed.add([[2, 3], [6, 9], [11, 12]])
+        self.assertTrue(np.all(completed.ranges == [[0, 3], [5, 9], [11, 12]]))
+        self.assertEqual(completed.num_completed, 8)
+
+    def test_get_incomplete(self):
+        completed = usid.processing.process._CompletedRanges([[1, 3], [5, 6]])
+        self.assertTrue(np.all(completed.get_incomplete(8) == [0, 3, 4, 6, 7]))
+        self.assertEqual(len(usid.processing.process._CompletedRanges().get_incomplete(4)), 4)
+
+
+class AvgSpecAllocating(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        # Touch 64 MB within the worker
+        return np.mean(spectrogram) + 0 * np.ones(8 * 1024 ** 2).sum()
+
+
+class TestComputeProfileWorkers(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecAllocating, **proc_kwargs):
+        super(TestComputeProfileWorkers,
+              self).setUp(proc_class=proc_class, cores=2, backend='processes',
+                          save_profile=True, **proc_kwargs)
+
+    def test_compute(self):
+        # Use the pool even on machines with a single CPU
+        self.proc._cores = 2
+        super(TestComputeProfileWorkers, self).test_compute()
+        profile = self.proc.profile
+        # Workers are not waited for children of this process
+        self.assertGreater(len(profile.worker_peak_rss), 0)
+        self.assertGreaterEqual(min(profile.worker_peak_rss.values()), 64 * 1024 ** 2)
+        self.assertGreaterEqual(profile.peak_rss_per_rank[0],
+                                usid.processing.process._get_peak_rss() + 64 * 1024 ** 2)
+
+
+class TestComputeProfile(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordBatches, **proc_kwargs):
+        super(TestComputeProfile,
+              self).setUp(proc_class=proc_class, save_profile=True,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestComputeProfile, self).test_compute()
+        table = self.proc.profile.to_array()
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table['num_positions'].sum(), self.h5_main.shape[0])
+        self.assertTrue(np.all(table['start'] == [0, 6, 12]))
+        self.assertTrue(np.all(table['bytes_read'] == table['num_positions'] *
+                               self.h5_main.shape[1] * self.h5_main.dtype.itemsize))
+        self.assertTrue(np.all(table['compute_time'] > 0))
+        self.assertGreater(self.proc.profile.peak_rss_per_rank[0], 0)
+        self.assertGreaterEqual(self.proc.profile.peak_rss, np.max(table['rss']))
+        self.assertGreater(self.proc.profile.positions_per_second[0], 0)
+        summary = self.proc.profile.summary()
+        self.assertEqual(summary['num_batches'], 3)
+        h5_profile = self.proc.h5_results_grp['compute_profile']
+        self.assertTrue(np.all(h5_profile[()] == table))
+        self.assertEqual(len(h5_profile.attrs['positions_per_second']), 1)
+
+    def test_profile_appended_on_resume(self):
+        self.proc._max_pos_per_read = 6
+        h5_grp = self.proc.compute()
+        h5_grp['completed_positions'][:] = 0
+        h5_grp['completed_positions'].attrs['num_completed'] = 0
+        h5_grp['completed_positions'].attrs['completed_ranges'] = np.zeros((0, 2), dtype=np.int64)
+        self.proc.compute(override=False)
+        self.assertEqual(h5_grp['compute_profile'].shape, (6,))
+
+
+class AvgSpecLargeIntermediate(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        # ~ 1.6 MB of intermediates per position
+        return np.mean(np.outer(np.ones(2 * 10 ** 5), spectrogram)[0])
+
+
+class TestAutoMemMultiplier(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecLargeIntermediate, **proc_kwargs):
+        super(TestAutoMemMultiplier,
+              self).setUp(proc_class=proc_class, cores=1, max_mem_mb=1,
+                          mem_multiplier='auto', **proc_kwargs)
+
+    def test_compute(self):
+        # Only the source dataset is accounted for before calibration
+        self.assertGreaterEqual(self.proc._max_pos_per_read, self.h5_main.shape[0])
+        super(TestAutoMemMultiplier, self).test_compute()
+        # Intermediates leave room for just one position within 1 MB
+        self.assertEqual(self.proc._max_pos_per_read, 1)
+        self.assertEqual(len(self.proc.batches), self.h5_main.shape[0])
+
+    def test_estimate_memory_per_pixel(self):
+        bytes_per_pos, transient_bytes = self.proc._estimate_memory_per_pixel()
+        self.assertLess(bytes_per_pos, 10 ** 4)
+        self.assertGreater(transient_bytes, 2 * 10 ** 5 * self.h5_main.shape[1] * 8)
+
+    def test_invalid_str(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, mem_multiplier='guess')
+
+
+class AvgSpecBlasThreads(AvgSpecRecordBatches):
+
+    @staticmethod
+    def _map_function(spectrogram, *args, **kwargs):
+        from threadpoolctl import threadpool_info
+        return max([pool['num_threads'] for pool in threadpool_info()] + [0])
+
+
+class TestAutoCores(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecSlow, **proc_kwargs):
+        super(TestAutoCores,
+              self).setUp(proc_class=proc_class, cores='auto', **proc_kwargs)
+
+    def test_compute(self):
+        max_cores = self.proc._cores
+        super(TestAutoCores, self).test_compute()
+        self.assertGreaterEqual(self.proc._cores, 1)
+        self.assertLessEqual(self.proc._cores, max_cores)
+
+    def test_invalid_str(self):
+        with self.assertRaises(ValueError):
+            _ = AvgSpecUltraBasic(self.h5_main, cores='all')
+
+
+class TestBlasThreadsLimited(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecBlasThreads, **proc_kwargs):
+        super(TestBlasThreadsLimited,
+              self).setUp(proc_class=proc_class, cores=2, backend='processes',
+                          **proc_kwargs)
+
+    def test_compute(self):
+        h5_grp = self.proc.compute()
+        blas_threads = h5_grp['Results'][()]
+        physical_cores = psutil.cpu_count(logical=False) or psutil.cpu_count()
+        self.assertLessEqual(np.max(blas_threads),
+                             max(1, physical_cores // self.proc._cores))
+
+
+class TestMultiBatchComputeAsyncWrite(TestMultiBatchComputePrefetch):
+
+    def setUp(self, proc_class=AvgSpecUltraBasic, **proc_kwargs):
+        super(TestMultiBatchComputeAsyncWrite,
+              self).setUp(proc_class=proc_class, async_write=True,
+                          **proc_kwargs)
+
+
+class AvgSpecFailAfterFirstWrite(AvgSpecUltraBasic):
+
+    def _write_results_chunk(self):
+        if self._get_pixels_in_current_batch()[0] > 0:
+            raise IOError('Simulated failure')
+        super(AvgSpecFailAfterFirstWrite, self)._write_results_chunk()
+
+
+class TestAsyncWriteFailure(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecFailAfterFirstWrite, **proc_kwargs):
+        super(TestAsyncWriteFailure,
+              self).setUp(proc_class=proc_class, async_write=True,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+
+        with self.assertRaises(IOError):
+            _ = self.proc.compute()
+        # Only the positions whose results were written should be complete
+        h5_status_dset = self.proc.h5_results_grp['completed_positions']
+        self.assertEqual(np.sum(h5_status_dset[()]), 6)
+        self.assertTrue(np.all(h5_status_dset[:6] == 1))
+
+
+class AvgSpecCountWrites(AvgSpecRecordBatches):
+
+    def __init__(self, h5_main, *args, **kwargs):
+        self.num_writes = 0
+        super(AvgSpecCountWrites, self).__init__(h5_main, *args, **kwargs)
+
+    def _write_results_chunk(self):
+        self.num_writes += 1
+        super(AvgSpecCountWrites, self)._write_results_chunk()
+
+
+class TestAsyncWriteSnapshot(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecCountWrites, **proc_kwargs):
+        super(TestAsyncWriteSnapshot,
+              self).setUp(proc_class=proc_class, async_write=True,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        super(TestAsyncWriteSnapshot, self).test_compute()
+        self.assertTrue(np.all(np.hstack(self.proc.batches) == np.arange(15)))
+        # Written via this object rather than a copy
+        self.assertEqual(self.proc.num_writes, len(self.proc.batches))
+        # Results of the last batch are still those of the main thread
+        self.assertEqual(len(self.proc._results), len(self.proc.batches[-1]))
+
+
+class AvgSpecRecordStatus(AvgSpecRecordBatches):
+
+    def __init__(self, h5_main, *args, **kwargs):
+        self.num_completed = []
+        super(AvgSpecRecordStatus, self).__init__(h5_main, *args, **kwargs)
+
+    def _write_results_chunk(self):
+        self.num_completed.append(int(np.sum(self._h5_status_dset[()])))
+        super(AvgSpecRecordStatus, self)._write_results_chunk()
+
+
+class TestFlushEveryNBatches(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordStatus, **proc_kwargs):
+        super(TestFlushEveryNBatches,
+              self).setUp(proc_class=proc_class, flush_every_n_batches=2,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 3
+        super(TestFlushEveryNBatches, self).test_compute()
+        # Positions are marked as completed in groups of two batches
+        self.assertEqual(self.proc.num_completed, [0, 0, 6, 6, 12])
+        h5_status_dset = self.proc.h5_results_grp['completed_positions']
+        self.assertEqual(np.sum(h5_status_dset[()]), self.h5_main.shape[0])
+        self.assertEqual(self.proc.h5_results_grp.attrs['last_pixel'],
+                         self.h5_main.shape[0])
+
+
+class TestFlushOnlyAtEnd(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecRecordStatus, **proc_kwargs):
+        super(TestFlushOnlyAtEnd,
+              self).setUp(proc_class=proc_class, flush_every_n_batches=None,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 3
+        super(TestFlushOnlyAtEnd, self).test_compute()
+        self.assertEqual(self.proc.num_completed, [0] * 5)
+        h5_status_dset = self.proc.h5_results_grp['completed_positions']
+        self.assertEqual(np.sum(h5_status_dset[()]), self.h5_main.shape[0])
+
+
+class TestFlushEverySeconds(TestFlushOnlyAtEnd):
+
+    def setUp(self, proc_class=AvgSpecRecordStatus, **proc_kwargs):
+        super(TestFlushEverySeconds,
+              self).setUp(proc_class=proc_class, flush_every_s=3600,
+                          **proc_kwargs)
+
+
+class TestFlushOnlyAtEndFailure(TestCoreProcessNoTest):
+
+    def setUp(self, proc_class=AvgSpecFailAfterFirstWrite, **proc_kwargs):
+        super(TestFlushOnlyAtEndFailure,
+              self).setUp(proc_class=proc_class, flush_every_n_batches=None,
+                          **proc_kwargs)
+
+    def test_compute(self):
+        self.proc._max_pos_per_read = 6
+        with self.assertRaises(IOError):
+            _ = self.proc.compute()
+        # The batch that was written before the failure is checkpointed
+        h5_status_dset = self.proc.h5_results_grp['completed_positions']
+        self.assertEqual(np.sum(h5_status_dset[()]), 6)
+        self.assertTrue(np.all(h5_status_dset[:6] == 1))
+
 # TODO: read_data_chunk
 # TODO: interrupt computation
 # TODO: set_cores, invalid inputs, etc.